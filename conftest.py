@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+
+
+# Presence of this file puts repository root on import path, so that tests can import food package without installing it
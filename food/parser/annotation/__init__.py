@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+
+
+from .dataset import AnnotationDataset
+from .lines import AnnotationView, LinesAnnotationDataset
+from .sqlite import SqliteAnnotationDataset, migrate
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncio
+
+
+# Abstract asynchronous annotation store
+class AnnotationDataset:
+    
+    # Acquire latest annotation for given key(s), or a read-only mapping of all annotations if no key is given
+    # Note: do not modify resulting object
+    # Note: mapping may query storage synchronously, hence coroutines should only pass it to executor, and use keys otherwise
+    async def get(self, keys=None):
+        raise NotImplementedError()
+    
+    # Add new annotation(s)
+    async def add(self, entries):
+        raise NotImplementedError()
+    
+    # Release resources
+    def close(self):
+        pass
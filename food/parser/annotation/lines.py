@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncio
+import collections.abc
+import io
+import json
+import logging
+import os
+
+from .dataset import AnnotationDataset
+
+
+# Basic logger instance
+logger = logging.getLogger(__name__)
+
+
+# Number of recent entries kept apart before merging them in base dictionary
+MERGE_THRESHOLD = 1024
+
+# Number of trailing bytes compared to detect file rewrites
+TAIL_SIZE = 64
+
+# Minimal number of superseded lines before compaction
+COMPACTION_MINIMUM = 1024
+
+
+# Immutable view of annotations, where recent entries are kept apart to avoid copying everything on each update
+class AnnotationView(collections.abc.Mapping):
+    def __init__(self, base, recent=None):
+        self._base = base
+        self._recent = recent or {}
+        self._length = len(base) + sum(1 for key in self._recent if key not in base)
+    
+    def __getitem__(self, key):
+        try:
+            return self._recent[key]
+        except KeyError:
+            return self._base[key]
+    
+    def __contains__(self, key):
+        return key in self._recent or key in self._base
+    
+    def __iter__(self):
+        for key in self._base:
+            if key not in self._recent:
+                yield key
+        yield from self._recent
+    
+    def __len__(self):
+        return self._length
+    
+    # Create new version with additional entries
+    def extend(self, entries):
+        recent = dict(self._recent)
+        recent.update(entries)
+        if len(recent) < MERGE_THRESHOLD:
+            return AnnotationView(self._base, recent)
+        base = dict(self._base)
+        base.update(recent)
+        return AnnotationView(base)
+
+
+# Append-only key-value store, where only new lines are parsed on refresh
+class LinesAnnotationDataset(AnnotationDataset):
+    def __init__(self, path, executor, interval=1.0, compaction=2.0):
+        self._path = path
+        self._executor = executor
+        self._interval = interval
+        self._compaction = compaction
+        self._view = None
+        self._signature = None
+        self._offset = 0
+        self._tail = b''
+        self._lines = 0
+        self._watcher = None
+        self._lock = asyncio.Lock()
+    
+    # Get file modification signature, if any
+    def _stat(self):
+        try:
+            status = os.stat(self._path)
+        except FileNotFoundError:
+            return None
+        return status.st_dev, status.st_ino, status.st_mtime_ns, status.st_size
+    
+    # Check whether already parsed content is unchanged
+    def _check(self, signature):
+        device, inode, _, size = signature
+        if self._signature is None or self._signature[:2] != (device, inode) or size < self._offset:
+            return False
+        with io.open(self._path, 'rb') as file:
+            file.seek(self._offset - len(self._tail))
+            return file.read(len(self._tail)) == self._tail
+    
+    # Parse complete lines starting at given offset
+    def _read(self, offset):
+        with io.open(self._path, 'rb') as file:
+            file.seek(offset)
+            data = file.read()
+        end = data.rfind(b'\n') + 1
+        entries = {}
+        count = 0
+        for line in data[:end].splitlines():
+            if line.strip():
+                entry = json.loads(line.decode('utf-8'))
+                entries[entry['key']] = entry
+                count += 1
+        return entries, count, offset + end, data[:end]
+    
+    # Internal data acquisition, parsing only appended lines if possible
+    def _get(self):
+        
+        # If file does not exist, dataset is empty
+        signature = self._stat()
+        if signature is None:
+            if self._view is None or self._signature is not None:
+                self._view = AnnotationView({})
+                self._signature = None
+                self._offset = 0
+                self._tail = b''
+                self._lines = 0
+            return self._view
+        
+        # Check if file is still fresh
+        if self._view is not None and signature == self._signature:
+            return self._view
+        
+        # Parse new lines only, if previous content was not modified
+        if self._view is not None and self._check(signature):
+            entries, count, offset, data = self._read(self._offset)
+            self._view = self._view.extend(entries)
+            self._lines += count
+        
+        # Otherwise, reload everything
+        else:
+            entries, count, offset, data = self._read(0)
+            self._view = AnnotationView(entries)
+            self._lines = count
+            self._tail = b''
+        self._tail = (self._tail + data)[-TAIL_SIZE:]
+        self._offset = offset
+        self._signature = signature
+        return self._view
+    
+    # Rewrite file with only latest entries, if too many lines are superseded
+    # Note: lines appended by other processes during compaction may be lost, hence only one process should enable it
+    def _compact(self):
+        view = self._get()
+        if self._compaction is None or self._lines - len(view) < COMPACTION_MINIMUM or self._lines < len(view) * self._compaction:
+            return
+        temporary_path = '%s.%d.tmp' % (self._path, os.getpid())
+        with io.open(temporary_path, 'w', encoding='utf-8', newline='\n') as file:
+            for entry in view.values():
+                file.write('%s\n' % json.dumps(entry))
+        os.replace(temporary_path, self._path)
+        self._view = AnnotationView(dict(view))
+        self._signature = self._stat()
+        self._offset = self._signature[3]
+        with io.open(self._path, 'rb') as file:
+            file.seek(max(0, self._offset - TAIL_SIZE))
+            self._tail = file.read()
+        self._lines = len(view)
+        logger.info('Compacted annotations to %d lines', self._lines)
+    
+    # Periodically check file in background
+    async def _watch(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self._interval)
+            async with self._lock:
+                try:
+                    await loop.run_in_executor(self._executor, self._compact)
+                except Exception:
+                    logger.exception('Failed to refresh annotations')
+    
+    # Load data on first access
+    async def _load(self):
+        loop = asyncio.get_event_loop()
+        async with self._lock:
+            if self._view is None:
+                await loop.run_in_executor(self._executor, self._get)
+                self._watcher = asyncio.ensure_future(self._watch())
+        return self._view
+    
+    # Stop background refresh
+    def close(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+    
+    # Acquire latest annotation for given key(s)
+    # Note: do not modify resulting object
+    async def get(self, keys=None):
+        view = self._view
+        if view is None:
+            view = await self._load()
+        if keys is None:
+            return view
+        if type(keys) is str:
+            return view.get(keys)
+        return [view.get(key) for key in keys]
+    
+    # Internal data append
+    def _add(self, entries):
+        
+        # Add new lines in file
+        with io.open(self._path, 'a', encoding='utf-8', newline='\n') as file:
+            for entry in entries:
+                file.write('%s\n' % json.dumps(entry))
+        
+        # Parse them back, along with lines appended by other processes
+        self._get()
+    
+    # Add new annotation(s)
+    async def add(self, entries):
+        loop = asyncio.get_event_loop()
+        if type(entries) is dict:
+            entries = [entries]
+        async with self._lock:
+            await loop.run_in_executor(self._executor, self._add, entries)
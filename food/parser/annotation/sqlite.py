@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncio
+import collections.abc
+import io
+import json
+import sqlite3
+import threading
+
+from .dataset import AnnotationDataset
+
+
+# Maximum number of parameters per statement
+BATCH_SIZE = 500
+
+
+# Open connection, creating schema if needed
+def connect(path):
+    connection = sqlite3.connect(path, timeout=30.0)
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.execute('PRAGMA synchronous = NORMAL')
+    connection.execute('CREATE TABLE IF NOT EXISTS annotations (key TEXT PRIMARY KEY, entry TEXT NOT NULL) WITHOUT ROWID')
+    return connection
+
+
+# Insert or replace entries, in a single transaction
+def insert(connection, entries):
+    with connection:
+        connection.executemany(
+            'INSERT OR REPLACE INTO annotations (key, entry) VALUES (?, ?)',
+            ((entry['key'], json.dumps(entry)) for entry in entries)
+        )
+
+
+# Import existing JSON-lines file
+def migrate(json_path, path, batch_size=10000):
+    connection = connect(path)
+    try:
+        with io.open(json_path, 'r', encoding='utf-8', newline='\n') as file:
+            batch = []
+            for line in file:
+                if line.strip():
+                    batch.append(json.loads(line))
+                    if len(batch) >= batch_size:
+                        insert(connection, batch)
+                        batch = []
+            insert(connection, batch)
+    finally:
+        connection.close()
+
+
+# Read-only mapping, where each access is a point lookup in database
+# Note: unlike in-memory datasets, this reflects latest database state
+# Note: queries are synchronous, hence mapping must not be used by coroutines (i.e. use it in executor, or use get with keys)
+class SqliteAnnotationView(collections.abc.Mapping):
+    def __init__(self, dataset):
+        self._dataset = dataset
+    
+    # Get connection of current thread, unless it runs event loop
+    def _connection(self):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return self._dataset._connection()
+        raise RuntimeError('Annotation database cannot be queried from event loop, use get(keys) instead')
+    
+    def __getitem__(self, key):
+        row = self._connection().execute('SELECT entry FROM annotations WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+    
+    def __contains__(self, key):
+        return self._connection().execute('SELECT 1 FROM annotations WHERE key = ?', (key,)).fetchone() is not None
+    
+    def __iter__(self):
+        for key, in self._connection().execute('SELECT key FROM annotations'):
+            yield key
+    
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM annotations').fetchone()[0]
+    
+    # Iterate over entries with a single query
+    def values(self):
+        for entry, in self._connection().execute('SELECT entry FROM annotations'):
+            yield json.loads(entry)
+    
+    # Iterate over keys and entries with a single query
+    def items(self):
+        for key, entry in self._connection().execute('SELECT key, entry FROM annotations'):
+            yield key, json.loads(entry)
+
+
+# Embedded database store, safe to share between processes
+class SqliteAnnotationDataset(AnnotationDataset):
+    def __init__(self, path, executor):
+        self._path = path
+        self._executor = executor
+        self._local = threading.local()
+        self._view = SqliteAnnotationView(self)
+    
+    # Get connection of current thread
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = connect(self._path)
+        return connection
+    
+    # Look up many keys, using few queries
+    def _get(self, keys):
+        connection = self._connection()
+        entries = {}
+        for start in range(0, len(keys), BATCH_SIZE):
+            batch = keys[start : start + BATCH_SIZE]
+            query = 'SELECT key, entry FROM annotations WHERE key IN (%s)' % ', '.join('?' * len(batch))
+            for key, entry in connection.execute(query, batch):
+                entries[key] = json.loads(entry)
+        return [entries.get(key) for key in keys]
+    
+    # Acquire latest annotation for given key(s)
+    async def get(self, keys=None):
+        if keys is None:
+            return self._view
+        loop = asyncio.get_event_loop()
+        if type(keys) is str:
+            return (await loop.run_in_executor(self._executor, self._get, [keys]))[0]
+        return await loop.run_in_executor(self._executor, self._get, list(keys))
+    
+    # Insert entries using connection of worker thread
+    def _add(self, entries):
+        insert(self._connection(), entries)
+    
+    # Add new annotation(s)
+    async def add(self, entries):
+        loop = asyncio.get_event_loop()
+        if type(entries) is dict:
+            entries = [entries]
+        await loop.run_in_executor(self._executor, self._add, entries)
@@ -2,54 +2,124 @@
 
 
 import asyncio
+import math
 import os
 import random
 
-from .classifier import LogisticClassifier
-from .annotation import AnnotationDataset
+from .classifier import BatchingClassifier, DelayedClassifier, LogisticClassifier, MemoryCacheClassifier, OnlineClassifier
+from .annotation import LinesAnnotationDataset, SqliteAnnotationDataset
 from .ontology import OntologyContainer
-from .sampler import AnnotationSampler, ConfidenceSampler, LineSampler, PredictionSampler
+from .sampler import AnnotationSampler, LineSampler, UncertaintySampler
 
 
 # Get folders and paths
 HERE = os.path.dirname(os.path.realpath(__file__))
 ONTOLOGY_TXT = os.path.join(HERE, '..', 'ontology', 'core.txt')
+ONTOLOGY_BIN = os.path.join(HERE, 'model', 'ontology.bin')
 INGREDIENTS_TXT = os.path.join(HERE, 'model', 'ingredients.txt')
 ANNOTATIONS_JSON = os.path.join(HERE, 'model', 'annotations.json')
+ANNOTATIONS_DB = os.path.join(HERE, 'model', 'annotations.db')
 CLASSIFIER_PKL = os.path.join(HERE, 'model', 'model.pkl')
+CLASSIFIER_DIR = os.path.join(HERE, 'model', 'classifier')
+ONLINE_CLASSIFIER_PKL = os.path.join(HERE, 'model', 'online.pkl')
+LEMMAS_TXT = os.path.join(HERE, 'model', 'lemmas.txt')
+SAMPLE_QUEUE_JSON = os.path.join(HERE, 'model', 'queue.json')
+
+
+# Number of texts classified at once, to bound memory usage
+CLASSIFY_CHUNK_SIZE = 1024
+
+# Whether classifier is updated after each annotation (otherwise, only on explicit training)
+CLASSIFIER_ONLINE = False
+
+# Feature extractor used by newly trained models ("count" or "hashing"), and maximum word n-gram size
+CLASSIFIER_FEATURES = 'count'
+CLASSIFIER_NGRAMS = 1
+
+# Whether to use one model per taxonomy node, searched with a beam from root, instead of a single flat model
+CLASSIFIER_HIERARCHICAL = False
+
+# Number of one-vs-rest binary models fitted in parallel, when training in process pool (otherwise, a single multinomial model is fitted)
+TRAINING_JOBS = 1
+
+# Number of new annotations, and delay after first new annotation (in seconds), that trigger training
+TRAINING_COUNT = 100
+TRAINING_INTERVAL = 600.0
+
+# Labels kept for sampled texts, i.e. all labels with probability strictly above 1%
+# Note: classifiers keep labels whose probability is at least the threshold, hence the smallest float above 1%
+SAMPLE_LIMIT = None
+SAMPLE_THRESHOLD = math.nextafter(0.01, 1.0)
+
+# Uncertainty measure used to pick samples ("confidence", "margin" or "entropy")
+SAMPLE_STRATEGY = 'confidence'
 
 
 # Main logic container
+# Note: if a process pool is provided, heavy training tasks are executed there
+# Note: if a training executor is provided, training sessions are coordinated there instead of in main executor
 class API:
-    def __init__(self, executor, log):
+    def __init__(self, executor, log, processes=None, training_executor=None):
         self._executor = executor
         self._log = log
+        self._processes = processes
+        self._training_executor = training_executor
         
         # Acquire default ontology
         self._ontology = OntologyContainer(
             [ONTOLOGY_TXT],
-            self._executor
+            self._executor,
+            ONTOLOGY_BIN
         )
         
-        # Prepare basic annotation dataset
-        self._annotations = AnnotationDataset(
-            ANNOTATIONS_JSON,
-            self._executor
-        )
+        # Prepare annotation dataset, using database if it has been migrated
+        if os.path.exists(ANNOTATIONS_DB):
+            self._annotations = SqliteAnnotationDataset(
+                ANNOTATIONS_DB,
+                self._executor
+            )
+        else:
+            self._annotations = LinesAnnotationDataset(
+                ANNOTATIONS_JSON,
+                self._executor
+            )
         
-        # Create basic classifier
-        self._classifier = LogisticClassifier(
-            self._ontology,
-            self._annotations,
-            CLASSIFIER_PKL,
-            self._executor
-        )
+        # Create basic classifier, either incremental or trained from scratch
+        if CLASSIFIER_ONLINE:
+            classifier = OnlineClassifier(
+                self._ontology,
+                self._annotations,
+                ONLINE_CLASSIFIER_PKL,
+                self._executor,
+                CLASSIFIER_NGRAMS,
+                training_executor=self._training_executor
+            )
+        else:
+            classifier = LogisticClassifier(
+                self._ontology,
+                self._annotations,
+                CLASSIFIER_DIR,
+                self._executor,
+                LEMMAS_TXT,
+                CLASSIFIER_FEATURES,
+                CLASSIFIER_NGRAMS,
+                CLASSIFIER_HIERARCHICAL,
+                self._processes,
+                TRAINING_JOBS,
+                CLASSIFIER_PKL,
+                training_executor=self._training_executor
+            )
+        
+        # Coalesce training sessions, and trigger them automatically
+        self._scheduler = DelayedClassifier(classifier, TRAINING_COUNT, TRAINING_INTERVAL)
+        
+        # Add result cache and request coalescing
+        self._classifier = MemoryCacheClassifier(BatchingClassifier(self._scheduler))
         
         # Sample generator
-        line_sampler = LineSampler(INGREDIENTS_TXT, self._annotations)
-        prediction_sampler = PredictionSampler(line_sampler, self._classifier)
-        confidence_sampler = ConfidenceSampler(prediction_sampler, oversampling=5)
-        annotation_sampler = AnnotationSampler(confidence_sampler, self._annotations)
+        line_sampler = LineSampler(INGREDIENTS_TXT, self._annotations, self._executor)
+        uncertainty_sampler = UncertaintySampler(line_sampler, self._classifier, SAMPLE_QUEUE_JSON, self._executor, SAMPLE_STRATEGY, SAMPLE_LIMIT, SAMPLE_THRESHOLD)
+        annotation_sampler = AnnotationSampler(uncertainty_sampler, self._annotations)
         self._sampler = annotation_sampler
     
     # Provide information about ontology
@@ -65,29 +135,56 @@ class API:
         return await self._ontology.suggest(query)
     
     # Annotate specified text
-    async def classify(self, text, threshold=None):
-        results = await self._classifier.classify([text])
-        results = results[0]
-        threshold = threshold or 0.0
-        results = {label : probability for label, probability in sorted(results.items(), key=lambda x: x[1], reverse=True) if probability >= threshold}
+    async def classify(self, text, threshold=None, limit=None):
+        results = await self._classifier.classify([text], limit, threshold or 0.0)
+        return results[0]
+    
+    # Annotate many texts, each with its own threshold and limit
+    async def classify_many(self, texts, thresholds, limits):
+        
+        # Group texts sharing the same selection parameters
+        groups = {}
+        for index, (threshold, limit) in enumerate(zip(thresholds, limits)):
+            groups.setdefault((threshold or 0.0, limit), []).append(index)
+        
+        # Classify each group in chunks
+        results = [None] * len(texts)
+        for (threshold, limit), indices in groups.items():
+            for start in range(0, len(indices), CLASSIFY_CHUNK_SIZE):
+                chunk = indices[start : start + CLASSIFY_CHUNK_SIZE]
+                predictions = await self._classifier.classify([texts[index] for index in chunk], limit, threshold)
+                for index, prediction in zip(chunk, predictions):
+                    results[index] = prediction
         return results
     
     # Acquire samples according to specified rules
     async def sample(self, count=1):
         samples = await self._sampler.sample(count)
-        for sample in samples:
-            prediction = sample.get('prediction', {})
-            prediction = {label : probability for label, probability in prediction.items() if probability > 0.01}
-            sample['prediction'] = prediction
         return {
             'samples' : samples
         }
     
     # Register annotation
     async def annotate(self, annotations):
+        if type(annotations) is dict:
+            annotations = [annotations]
         await self._annotations.add(annotations)
+        await self._classifier.update(annotations)
+        await self._sampler.update(annotations)
         return { 'success' : True }
     
     # Train classifier based on existing samples
     async def train(self):
         return await self._classifier.train()
+    
+    # Describe current and last training sessions
+    async def training_status(self):
+        return self._scheduler.get_status()
+    
+    # Stop current training session
+    async def cancel_training(self):
+        return {'success' : self._scheduler.cancel()}
+    
+    # Publish another stored model version (by default, the previous one)
+    async def rollback(self, version=None):
+        return await self._classifier.rollback(version)
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncio
+import concurrent.futures
+import functools
+import io
+import numpy
+import os
+import random
+import resource
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+import time
+
+from .annotation import LinesAnnotationDataset
+from .api import ONTOLOGY_TXT, ANNOTATIONS_JSON, INGREDIENTS_TXT
+from .classifier.logistic.classifier import ONTOLOGY_WEIGHT, get_adjacency, get_samples
+from .classifier.logistic.hierarchy import HierarchicalModel
+from .classifier.logistic.model import Model, create_classifier, create_vectorizer
+from .ontology import OntologyContainer, parse
+from .text import lemma_cache, tokenize
+
+
+# Load annotated texts, and optionally some raw ingredient lines
+def _load_texts(limit):
+    annotations = LinesAnnotationDataset(ANNOTATIONS_JSON, None)._get()
+    texts = list(annotations)
+    if limit > 0 and os.path.exists(INGREDIENTS_TXT):
+        with io.open(INGREDIENTS_TXT, 'r', encoding='utf-8') as file:
+            for line in file:
+                texts.append(line.strip())
+                if len(texts) >= limit:
+                    break
+    return annotations, texts
+
+
+# Count completed calls of coroutine function, with many concurrent clients
+async def _throughput(function, clients, duration):
+    count = 0
+    end = time.perf_counter() + duration
+    async def client():
+        nonlocal count
+        while time.perf_counter() < end:
+            await function()
+            count += 1
+            await asyncio.sleep(0)
+    await asyncio.gather(*[client() for _ in range(clients)])
+    return count / duration
+
+
+# Measure read throughput of ontology and annotation containers
+def benchmark_containers(clients=(1, 4, 16, 64), duration=1.0):
+    async def run():
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            ontology = OntologyContainer([ONTOLOGY_TXT], executor)
+            annotations = LinesAnnotationDataset(ANNOTATIONS_JSON, executor)
+            print('clients\tontology/s\tannotations/s')
+            for count in clients:
+                ontology_rate = await _throughput(ontology.get, count, duration)
+                annotations_rate = await _throughput(annotations.get, count, duration)
+                print('%d\t%.0f\t%.0f' % (count, ontology_rate, annotations_rate))
+            ontology.close()
+            annotations.close()
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(run())
+    loop.close()
+
+
+# Compare tokenization with and without lemma cache, when fitting vectorizer and predicting
+def benchmark_tokenize(limit=100000):
+    annotations, texts = _load_texts(limit)
+    labels = [annotation['truth'][0] for annotation in annotations.values()]
+    print('%d texts' % len(texts))
+    print('cached\tfit\tpredict_proba')
+    for cached in (False, True):
+        lemma_cache.clear()
+        tokenizer = functools.partial(tokenize, cached=cached)
+        
+        # Fit vectorizer on all texts
+        vectorizer = CountVectorizer(tokenizer=tokenizer, binary=True, dtype=numpy.int32)
+        start = time.perf_counter()
+        vectorizer.fit(texts)
+        fit_time = time.perf_counter() - start
+        
+        # Train on annotations, and predict all texts
+        pipeline = Pipeline([
+            ('vectorizer', vectorizer),
+            ('classifier', LogisticRegression(max_iter=100))
+        ])
+        pipeline.fit(list(annotations), labels)
+        start = time.perf_counter()
+        pipeline.predict_proba(texts)
+        predict_time = time.perf_counter() - start
+        print('%s\t%.3fs\t%.3fs' % (cached, fit_time, predict_time))
+
+
+# Generate annotations, using random quantities and qualifiers around ontology labels
+def _synthesize(ontology, count, seed=0):
+    generator = random.Random(seed)
+    labels = [(text, id) for id in ontology.get_identifiers() for text in ontology.get_properties(id)['label']]
+    units = ['', 'g', 'kg', 'ml', 'cups', 'tablespoons', 'teaspoons', 'pinch of', 'cans of']
+    qualifiers = ['', 'fresh', 'chopped', 'diced', 'sliced', 'frozen', 'dried', 'grated', 'minced', 'large', 'small']
+    annotations = {}
+    while len(annotations) < count:
+        text, id = generator.choice(labels)
+        text = ' '.join(word for word in (str(generator.randint(1, 500)), generator.choice(units), generator.choice(qualifiers), text) if word)
+        annotations[text] = {'key' : text, 'truth' : [id]}
+    return annotations
+
+
+# Train as previously done, i.e. with duplicated ontology samples and one text per label
+def _train_duplicated(ontology, annotations):
+    ontology_samples = [(text, [id]) for id in ontology.get_identifiers() for text in ontology.get_properties(id)['label']]
+    annotations_samples = [(a['key'], a['truth']) for a in annotations.values()]
+    samples = ontology_samples * int(ONTOLOGY_WEIGHT) + annotations_samples
+    samples = [(text, label) for text, labels in samples for label in labels]
+    texts, labels = zip(*samples)
+    pipeline = Pipeline([
+        ('vectorizer', create_vectorizer()),
+        ('classifier', create_classifier())
+    ])
+    pipeline.fit(texts, labels)
+
+
+# Train using weighted distinct texts
+def _train_weighted(ontology, annotations):
+    Model().train(get_samples(ontology, annotations), get_adjacency(ontology))
+
+
+# Run training in current (fresh) process, and report time and peak memory increase
+def _measure_training(function, ontology, annotations):
+    lemma_cache.clear()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    function(ontology, annotations)
+    elapsed = time.perf_counter() - start
+    return elapsed, (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss) / 1024
+
+
+# Compare training time and peak resident memory, with duplicated and weighted samples
+def benchmark_training(count=100000):
+    ontology = parse([ONTOLOGY_TXT])
+    annotations = _synthesize(ontology, count)
+    print('%d annotations' % len(annotations))
+    print('samples\ttime\tpeak RSS increase')
+    for name, function in (('duplicated', _train_duplicated), ('weighted', _train_weighted)):
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+            elapsed, rss = executor.submit(_measure_training, function, ontology, annotations).result()
+        print('%s\t%.1fs\t%.0fMB' % (name, elapsed, rss))
+
+
+# Compare flat and hierarchical models, on held-out synthetic and existing annotations
+def benchmark_hierarchy(count=10000, ratio=0.2, seed=0):
+    ontology = parse([ONTOLOGY_TXT])
+    annotations = _synthesize(ontology, count, seed)
+    annotations.update(LinesAnnotationDataset(ANNOTATIONS_JSON, None)._get())
+    entries = list(annotations.values())
+    random.Random(seed).shuffle(entries)
+    split = int(len(entries) * ratio)
+    tests = entries[:split]
+    trains = {entry['key'] : entry for entry in entries[split:]}
+    texts = [entry['key'] for entry in tests]
+    samples = get_samples(ontology, trains)
+    adjacency = get_adjacency(ontology)
+    print('%d training samples, %d test samples' % (len(samples), len(tests)))
+    print('model\ttrain\taccuracy\tlatency\tbatch')
+    for name, model in (('flat', Model()), ('hierarchical', HierarchicalModel()), ('exact', HierarchicalModel(beam=None))):
+        start = time.perf_counter()
+        model.train(samples, adjacency)
+        train_time = time.perf_counter() - start
+        
+        # Measure top-1 accuracy and throughput on whole test set
+        start = time.perf_counter()
+        predictions = model.classify(texts, limit=1)
+        batch_time = (time.perf_counter() - start) / len(texts)
+        accuracy = sum(next(iter(prediction), None) in entry['truth'] for prediction, entry in zip(predictions, tests)) / len(tests)
+        
+        # Measure latency of single-text requests
+        start = time.perf_counter()
+        for text in texts[:1000]:
+            model.classify([text], limit=1)
+        latency = (time.perf_counter() - start) / min(len(texts), 1000)
+        print('%s\t%.1fs\t%.3f\t%.2fms\t%.3fms' % (name, train_time, accuracy, latency * 1000, batch_time * 1000))
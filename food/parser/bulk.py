@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+
+import argparse
+import collections
+import concurrent.futures
+import io
+import json
+import os
+import pickle
+import sys
+import time
+
+from food.scraper.feed import read_ingredients
+
+from .api import CLASSIFIER_DIR, CLASSIFIER_PKL, INGREDIENTS_TXT, LEMMAS_TXT
+from .classifier.logistic import artifact
+from .text import load_lemmas
+
+
+# Number of lines sent to a worker at once
+CHUNK_SIZE = 1000
+
+# Number of chunks queued for each worker, which bounds memory usage
+BACKLOG = 2
+
+# Delay between progress reports, in seconds
+REPORT_INTERVAL = 10.0
+
+
+# Load current model artifact, or legacy pickled model if there is no artifact
+def load_model(path=CLASSIFIER_DIR, legacy_path=CLASSIFIER_PKL):
+    if path is not None and artifact.get_current(path) is not None:
+        return artifact.load(path)
+    with io.open(legacy_path, 'rb') as file:
+        return pickle.load(file)
+
+
+# Model used by worker process, loaded once
+_model = None
+
+
+# Load model in worker process
+def _initialize(path, legacy_path, lemmas_path):
+    global _model
+    if lemmas_path is not None and os.path.exists(lemmas_path):
+        load_lemmas(lemmas_path)
+    _model = load_model(path, legacy_path)
+
+
+# Classify chunk in worker process
+def _classify(texts, limit, threshold):
+    return _model.classify(texts, limit, threshold)
+
+
+# Enumerate lines of given files (where "-" is standard input), without trailing newline
+# Note: scraper feed folders are also accepted, in which case ingredients of all recipes are used
+def read_lines(paths, follow=False):
+    for path in paths:
+        if os.path.isdir(path):
+            for line in read_ingredients(path, follow):
+                yield line.strip()
+            continue
+        if path == '-':
+            file = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+        else:
+            file = io.open(path, 'r', encoding='utf-8')
+        with file:
+            for line in file:
+                yield line.rstrip('\r\n')
+
+
+# Write ingredient lines of scraper feeds, as used by line sampler
+def build_ingredients(folders, path=INGREDIENTS_TXT):
+    count = 0
+    with io.open(path, 'w', encoding='utf-8', newline='\n') as file:
+        for line in read_lines(folders):
+            if len(line) > 0:
+                file.write(line + '\n')
+                count += 1
+    return count
+
+
+# Group items in lists of given size
+def read_chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+# Write one JSON object per line, with labels sorted by decreasing probability
+class JsonLinesWriter:
+    def __init__(self, path):
+        if path == '-':
+            self._file = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', newline='\n')
+        else:
+            self._file = io.open(path, 'w', encoding='utf-8', newline='\n')
+    
+    # Write classified chunk
+    def write(self, texts, results):
+        for text, labels in zip(texts, results):
+            entry = {
+                'text' : text,
+                'labels' : labels
+            }
+            self._file.write(json.dumps(entry, ensure_ascii=False))
+            self._file.write('\n')
+    
+    # Flush content
+    def close(self):
+        self._file.close()
+
+
+# Write Parquet file, with one row group per chunk
+# Note: this requires pyarrow
+class ParquetWriter:
+    def __init__(self, path):
+        import pyarrow
+        import pyarrow.parquet
+        self._pyarrow = pyarrow
+        self._schema = pyarrow.schema([
+            ('text', pyarrow.string()),
+            ('labels', pyarrow.list_(pyarrow.string())),
+            ('probabilities', pyarrow.list_(pyarrow.float32()))
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(sys.stdout.buffer if path == '-' else path, self._schema)
+    
+    # Write classified chunk
+    def write(self, texts, results):
+        columns = [
+            texts,
+            [list(labels.keys()) for labels in results],
+            [list(labels.values()) for labels in results]
+        ]
+        self._writer.write_table(self._pyarrow.Table.from_arrays([self._pyarrow.array(c, t) for c, t in zip(columns, self._schema.types)], schema=self._schema))
+    
+    # Write footer
+    def close(self):
+        self._writer.close()
+
+
+# Create writer, guessing format from extension if needed
+def create_writer(path, format=None):
+    if format is None:
+        format = 'parquet' if path.endswith('.parquet') else 'jsonl'
+    if format == 'parquet':
+        return ParquetWriter(path)
+    if format == 'jsonl':
+        return JsonLinesWriter(path)
+    raise ValueError('Unsupported format %s' % format)
+
+
+# Report throughput
+def _report(count, start, final=False):
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print('%s%d lines in %.1fs (%.0f lines/s)' % ('done: ' if final else '', count, elapsed, rate), file=sys.stderr, flush=True)
+
+
+# Classify lines using process pool, writing results in original order
+# Note: only a bounded number of chunks is in flight, hence memory usage does not depend on input size
+def annotate(lines, writer, limit=5, threshold=None, processes=None, chunk_size=CHUNK_SIZE, path=CLASSIFIER_DIR, legacy_path=CLASSIFIER_PKL, lemmas_path=LEMMAS_TXT):
+    processes = processes or os.cpu_count() or 1
+    start = time.perf_counter()
+    report = start + REPORT_INTERVAL
+    count = 0
+    with concurrent.futures.ProcessPoolExecutor(processes, initializer=_initialize, initargs=(path, legacy_path, lemmas_path)) as executor:
+        
+        # Write oldest chunk, once it is done
+        pending = collections.deque()
+        def pop():
+            nonlocal count, report
+            texts, future = pending.popleft()
+            writer.write(texts, future.result())
+            count += len(texts)
+            if time.perf_counter() >= report:
+                _report(count, start)
+                report = time.perf_counter() + REPORT_INTERVAL
+        
+        # Keep workers busy, without reading whole input
+        for texts in read_chunks(lines, chunk_size):
+            if len(pending) >= processes * BACKLOG:
+                pop()
+            pending.append((texts, executor.submit(_classify, texts, limit, threshold)))
+        while len(pending) > 0:
+            pop()
+    
+    _report(count, start, True)
+    return count
+
+
+# Command-line entry point
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog='python -m food.parser.bulk', description='Classify ingredient lines with saved model.')
+    parser.add_argument('inputs', nargs='*', default=['-'], help='text files, one ingredient per line ("-" for standard input), or scraper feed folders')
+    parser.add_argument('--follow', action='store_true', help='wait for new shards of feed folders, until they are complete')
+    parser.add_argument('-o', '--output', default='-', help='output file ("-" for standard output)')
+    parser.add_argument('-f', '--format', choices=['jsonl', 'parquet'], help='output format (guessed from extension by default)')
+    parser.add_argument('-k', '--limit', type=int, default=5, help='number of labels kept for each line')
+    parser.add_argument('-t', '--threshold', type=float, default=None, help='minimum probability of kept labels')
+    parser.add_argument('-p', '--processes', type=int, default=None, help='number of worker processes')
+    parser.add_argument('-c', '--chunk-size', type=int, default=CHUNK_SIZE, help='number of lines sent to a worker at once')
+    parser.add_argument('-m', '--model', default=CLASSIFIER_DIR, help='model artifact folder')
+    args = parser.parse_args(arguments)
+    
+    writer = create_writer(args.output, args.format)
+    try:
+        annotate(read_lines(args.inputs, args.follow), writer, args.limit, args.threshold, args.processes, args.chunk_size, args.model)
+    finally:
+        writer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 
 
+from .batch import BatchingClassifier
 from .cache import MemoryCacheClassifier
 from .classifier import Classifier
+from .delay import DelayedClassifier
 from .logistic import LogisticClassifier
+from .online import OnlineClassifier
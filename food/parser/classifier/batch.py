@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncio
+
+from .classifier import Classifier
+
+
+# Coalesce concurrent requests arriving within a short window into a single call
+# Note: requests are grouped by selection parameters, so each group results in one call
+class BatchingClassifier(Classifier):
+    def __init__(self, classifier, delay=0.005, maximum=1024):
+        self._classifier = classifier
+        self._delay = delay
+        self._maximum = maximum
+        self._pending = []
+        self._count = 0
+        self._handle = None
+    
+    # Queue texts, and wait for next batch
+    async def classify(self, texts, limit=None, threshold=None):
+        
+        # Large requests are already efficient
+        if len(texts) >= self._maximum:
+            return await self._classifier.classify(texts, limit, threshold)
+        
+        # Otherwise, wait for other requests, unless batch is full
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._pending.append((texts, limit, threshold, future))
+        self._count += len(texts)
+        if self._count >= self._maximum:
+            self._flush()
+        elif self._handle is None:
+            self._handle = loop.call_later(self._delay, self._flush)
+        return await future
+    
+    # Send all queued texts at once
+    def _flush(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        groups = {}
+        for texts, limit, threshold, future in self._pending:
+            groups.setdefault((limit, threshold), []).append((texts, future))
+        self._pending = []
+        self._count = 0
+        for (limit, threshold), pending in groups.items():
+            asyncio.ensure_future(self._run(pending, limit, threshold))
+    
+    # Classify batch and dispatch results
+    async def _run(self, pending, limit, threshold):
+        texts = [text for batch, _ in pending for text in batch]
+        try:
+            results = await self._classifier.classify(texts, limit, threshold)
+        except Exception as error:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        offset = 0
+        for batch, future in pending:
+            if not future.done():
+                future.set_result(results[offset : offset + len(batch)])
+            offset += len(batch)
+    
+    # Ask for retraining
+    async def train(self):
+        return await self._classifier.train()
+    
+    # Forward new annotations
+    async def update(self, entries):
+        await self._classifier.update(entries)
+    
+    # Use another stored model version
+    async def rollback(self, version=None):
+        return await self._classifier.rollback(version)
+    
+    # Get identifier of current model
+    def get_version(self):
+        return self._classifier.get_version()
@@ -2,22 +2,83 @@
 
 
 import asyncio
+import collections
 from .classifier import Classifier
 
 
-# Simple cache strategy (no discard)
+# Normalize text, as tokenization ignores case and whitespaces
+def normalize(text):
+    return ' '.join(text.lower().split())
+
+
+# Bounded least-recently-used cache, keyed by model version, selection parameters and normalized text
+# Note: do not modify resulting objects
 class MemoryCacheClassifier(Classifier):
-    def __init__(self, classifier):
+    def __init__(self, classifier, capacity=100000):
         self._classifier = classifier
-        self._cache = {}
+        self._capacity = capacity
+        self._cache = collections.OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
     
     # Use in-memory value, if available
-    async def classify(self, texts):
-        # TODO implement cache
-        return await self._classifier.classify(texts)
+    async def classify(self, texts, limit=None, threshold=None):
+        version = self._classifier.get_version()
+        keys = [(version, limit, threshold, normalize(text)) for text in texts]
+        
+        # Find cached results
+        results = []
+        misses = collections.OrderedDict()
+        for text, key in zip(texts, keys):
+            result = self._cache.get(key)
+            if result is None:
+                misses.setdefault(key, text)
+                self._misses += 1
+            else:
+                self._cache.move_to_end(key)
+                self._hits += 1
+            results.append(result)
+        
+        # Classify missing texts only
+        if len(misses) > 0:
+            predictions = await self._classifier.classify(list(misses.values()), limit, threshold)
+            predictions = dict(zip(misses.keys(), predictions))
+            for key, prediction in predictions.items():
+                self._cache[key] = prediction
+                self._cache.move_to_end(key)
+            while len(self._cache) > self._capacity:
+                self._cache.popitem(last=False)
+                self._evictions += 1
+            results = [predictions[key] if result is None else result for key, result in zip(keys, results)]
+        return results
     
     # Invalidate cache when underlying model is ready
     async def train(self):
         status = await self._classifier.train()
         self._cache.clear()
         return status
+    
+    # Forward new annotations
+    async def update(self, entries):
+        await self._classifier.update(entries)
+    
+    # Use another stored model version, where cached results are keyed by model version anyway
+    async def rollback(self, version=None):
+        status = await self._classifier.rollback(version)
+        self._cache.clear()
+        return status
+    
+    # Get identifier of current model
+    def get_version(self):
+        return self._classifier.get_version()
+    
+    # Get cache usage counters
+    def get_statistics(self):
+        return {
+            'size' : len(self._cache),
+            'capacity' : self._capacity,
+            'hits' : self._hits,
+            'misses' : self._misses,
+            'evictions' : self._evictions
+        }
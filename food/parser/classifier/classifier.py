@@ -7,10 +7,22 @@ import asyncio
 # Abstract asynchronous classifier interface
 class Classifier:
     
-    # Provide annotation for specified texts
-    async def classify(self, texts):
+    # Provide annotation for specified texts, optionally keeping only most probable labels
+    async def classify(self, texts, limit=None, threshold=None):
         raise NotImplementedError()
     
-    # Ask for retraining (old model should be available during training)
-    async def train(self):
+    # Ask for retraining (old model should be available during training), optionally reporting progress
+    async def train(self, progress=None):
         pass
+    
+    # Notify about new annotations, which may be used without full retraining
+    async def update(self, entries):
+        pass
+    
+    # Use another stored model version (by default, the previous one), if supported
+    async def rollback(self, version=None):
+        return {'success' : False}
+    
+    # Get identifier of current model, which changes whenever predictions may change
+    def get_version(self):
+        return None
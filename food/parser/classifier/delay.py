@@ -2,53 +2,138 @@
 
 
 import asyncio
+import logging
+import time
 
 from .classifier import Classifier
+from .progress import Cancelled, Progress
 
 
-# Chain coroutines
-async def then(fence, task):
-    await fence
-    return await task
+logger = logging.getLogger(__name__)
 
 
-# Avoid overlapping training sessions
+# Avoid overlapping training sessions, where requests made during a session are coalesced into a single next session
+# Note: training is also triggered after given number of new annotations, or given delay after first new annotation
 class DelayedClassifier(Classifier):
-    def __init__(self, classifier):
+    def __init__(self, classifier, count=None, interval=None):
         self._classifier = classifier
-        self._lock = asyncio.Lock()
+        self._count = count
+        self._interval = interval
         self._training_future = None
         self._pending_future = None
+        self._progress = None
+        self._changes = 0
+        self._timer = None
+        self._duration = None
+        self._last_status = None
     
     # Annotate given samples
-    async def classify(self, texts):
-        return await self._classifier.classify(texts)
+    async def classify(self, texts, limit=None, threshold=None):
+        return await self._classifier.classify(texts, limit, threshold)
+    
+    # Forward new annotations, and schedule training if needed
+    async def update(self, entries):
+        await self._classifier.update(entries)
+        self._changes += len(entries)
+        if self._count is not None and self._changes >= self._count:
+            self._trigger()
+        elif self._interval is not None and self._timer is None:
+            loop = asyncio.get_event_loop()
+            self._timer = loop.call_later(self._interval, self._trigger)
+    
+    # Get identifier of current model
+    def get_version(self):
+        return self._classifier.get_version()
+    
+    # Use another stored model version
+    # Note: a running session still publishes its model when done
+    async def rollback(self, version=None):
+        return await self._classifier.rollback(version)
     
     # Schedule training session
     async def train(self):
-        async with self._lock:
-            
-            # If no training session is running, just do it
-            if self._training_future is None:
-                future = asyncio.ensure_future(self._train())
-                self._training_future = future
-            
-            # Otherwise, if there is no session scheduled, prepare it
-            elif self._pending_future is None:
-                future = asyncio.ensure_future(then(self._training_future, self._classifier.train()))
-                self._pending_future = future
-            
-            # Otherwise, just wait on scheduled training
-            else:
-                future = self._pending_future
         
-        # Wait for it
-        return await future
+        # If no training session is running, just do it
+        if self._training_future is None:
+            future = asyncio.ensure_future(self._train())
+            self._training_future = future
+        
+        # Otherwise, if there is no session scheduled, prepare it
+        elif self._pending_future is None:
+            future = asyncio.ensure_future(self._train(self._training_future))
+            self._pending_future = future
+        
+        # Otherwise, just wait on scheduled training
+        else:
+            future = self._pending_future
+        
+        # Wait for it, without cancelling it if caller goes away
+        return await asyncio.shield(future)
     
-    # Train and then trigger any scheduled session
-    async def _train(self):
-        status = await self._classifier.train()
-        async with self._lock:
+    # Ask running session to stop, in which case its model is discarded
+    # Note: session only stops at next checkpoint (see "interruptible" in status), and scheduled session is kept
+    def cancel(self):
+        if self._progress is None:
+            return False
+        self._progress.cancel()
+        return True
+    
+    # Describe running session, scheduled session and outcome of last session
+    def get_status(self):
+        status = {
+            'version' : self.get_version(),
+            'running' : None if self._progress is None else self._progress.get_status(),
+            'pending' : self._pending_future is not None,
+            'changes' : self._changes,
+            'scheduled' : None,
+            'last' : self._last_status
+        }
+        if self._timer is not None:
+            loop = asyncio.get_event_loop()
+            status['scheduled'] = max(self._timer.when() - loop.time(), 0.0)
+        return status
+    
+    # Start training in background, from timer or annotation count
+    def _trigger(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending_future is None:
+            asyncio.ensure_future(self.train())
+    
+    # Wait for previous session, train, and then hand over to any scheduled session
+    async def _train(self, fence=None):
+        if fence is not None:
+            await asyncio.wait([fence])
+        
+        # Annotations received from now on are not guaranteed to be part of this session
+        self._changes = 0
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        # Expected duration is the one of last successful session
+        progress = Progress(self._duration)
+        self._progress = progress
+        start = time.perf_counter()
+        try:
+            status = await self._classifier.train(progress)
+            if status.get('success'):
+                self._duration = time.perf_counter() - start
+        except Cancelled:
+            status = {
+                'success' : False,
+                'cancelled' : True
+            }
+        except:
+            logger.exception('Failed to train classifier')
+            status = {
+                'success' : False
+            }
+        finally:
+            self._progress = None
             self._training_future = self._pending_future
             self._pending_future = None
+        status['finished'] = time.time()
+        self._last_status = status
         return status
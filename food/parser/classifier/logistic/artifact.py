@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+
+import io
+import json
+import numpy
+import os
+import pickle
+import scipy.sparse
+import shutil
+import threading
+import time
+from sklearn.linear_model import LogisticRegression
+from sklearn.multiclass import OneVsRestClassifier
+
+from .model import ColumnSelector, Model, create_vectorizer, select
+
+
+# Artifact layout: one folder per version, and a file naming current version
+FORMAT = 1
+CURRENT = 'CURRENT'
+METADATA = 'metadata.json'
+FEATURES = 'features.json'
+CLASSES = 'classes.json'
+COLUMNS = 'columns.npy'
+COEFFICIENTS = 'coefficients.npy'
+INTERCEPTS = 'intercepts.npy'
+PICKLE = 'model.pkl'
+
+# Number of versions kept, to allow rollback
+RETENTION = 5
+
+
+# List available versions, in increasing order
+def get_versions(path):
+    if not os.path.isdir(path):
+        return []
+    return sorted(int(name) for name in os.listdir(path) if name.isdigit())
+
+
+# Get version that is currently published, if any
+def get_current(path):
+    try:
+        with io.open(os.path.join(path, CURRENT), 'r', encoding='utf-8') as file:
+            return int(file.read().strip())
+    except FileNotFoundError:
+        versions = get_versions(path)
+        return versions[-1] if len(versions) > 0 else None
+
+
+# Atomically change published version
+def set_current(path, version):
+    if not os.path.isdir(os.path.join(path, '%08d' % version)):
+        raise KeyError(version)
+    temporary_path = os.path.join(path, '%s.%d.%d.tmp' % (CURRENT, os.getpid(), threading.get_ident()))
+    with io.open(temporary_path, 'w', encoding='utf-8', newline='\n') as file:
+        file.write('%d\n' % version)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, os.path.join(path, CURRENT))
+
+
+# Write JSON file
+def _dump(value, path):
+    with io.open(path, 'w', encoding='utf-8', newline='\n') as file:
+        json.dump(value, file, ensure_ascii=False)
+
+
+# Read JSON file
+def _load(path):
+    with io.open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+# Convert logits to probabilities, as done by scikit-learn
+def _get_probabilities(logits, kind):
+    if kind == 'ovr':
+        probabilities = 1.0 / (1.0 + numpy.exp(-logits))
+    else:
+        probabilities = numpy.exp(logits - logits.max(axis=1, keepdims=True))
+    probabilities /= probabilities.sum(axis=1, keepdims=True)
+    return probabilities
+
+
+# Get kind, coefficients and intercepts of fitted linear classifier, or None if it cannot be stored as raw arrays
+# Note: kind is checked against classifier itself, using an empty row as probe, as constructor arguments may be ignored by scikit-learn
+def _get_linear(classifier):
+    if isinstance(classifier, OneVsRestClassifier):
+        if not all(isinstance(estimator, LogisticRegression) for estimator in classifier.estimators_):
+            return None
+        coefficients = numpy.vstack([estimator.coef_ for estimator in classifier.estimators_])
+        intercepts = numpy.concatenate([estimator.intercept_ for estimator in classifier.estimators_])
+    elif isinstance(classifier, LogisticRegression):
+        coefficients = classifier.coef_
+        intercepts = classifier.intercept_
+    else:
+        return None
+    if coefficients.shape[0] != len(classifier.classes_):
+        return None
+    expected = classifier.predict_proba(scipy.sparse.csr_matrix((1, coefficients.shape[1])))
+    for kind in ('multinomial', 'ovr'):
+        if numpy.allclose(_get_probabilities(intercepts[numpy.newaxis, :], kind), expected, rtol=1e-4, atol=1e-6):
+            return kind, coefficients, intercepts
+    return None
+
+
+# Write flat linear model as raw arrays, with features and classes
+def _write_linear(model, folder, coefficients, intercepts):
+    features, ngrams, size = model.get_feature_spec()
+    vectorizer, classifier = [step for _, step in model.get_pipeline().steps]
+    spec = {
+        'features' : features,
+        'ngrams' : ngrams,
+        'size' : size
+    }
+    if features == 'count':
+        spec['vocabulary'] = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+    else:
+        numpy.save(os.path.join(folder, COLUMNS), vectorizer.steps[-1][1].columns_.astype(numpy.int64))
+    _dump(spec, os.path.join(folder, FEATURES))
+    _dump(classifier.classes_.tolist(), os.path.join(folder, CLASSES))
+    
+    # Coefficients are stored as one row per feature, so that sparse rows select contiguous memory
+    numpy.save(os.path.join(folder, COEFFICIENTS), numpy.ascontiguousarray(coefficients.T, dtype=numpy.float32))
+    numpy.save(os.path.join(folder, INTERCEPTS), intercepts.astype(numpy.float32))
+
+
+# Reserve next version number, where temporary folder acts as a lock between processes
+def _reserve(path):
+    versions = get_versions(path)
+    version = versions[-1] + 1 if len(versions) > 0 else 1
+    while True:
+        temporary_folder = os.path.join(path, '%08d.tmp' % version)
+        try:
+            os.mkdir(temporary_folder)
+        except FileExistsError:
+            version += 1
+            continue
+        
+        # Version may have been published by another process meanwhile
+        if os.path.exists(os.path.join(path, '%08d' % version)):
+            os.rmdir(temporary_folder)
+            version += 1
+            continue
+        return version, temporary_folder
+
+
+# Save model as new version, published atomically, and remove old versions
+# Note: flat multiclass models are stored as raw arrays (either multinomial or one-vs-rest), other models are pickled
+# Note: concurrent saves get distinct versions, and the last one to finish is published
+def save(model, path, retention=RETENTION):
+    os.makedirs(path, exist_ok=True)
+    version, temporary_folder = _reserve(path)
+    
+    # Prepare content in temporary folder
+    try:
+        metadata = {
+            'format' : FORMAT,
+            'version' : version,
+            'created' : time.time()
+        }
+        linear = None
+        if type(model) is Model and model.get_pipeline() is not None and len(model.get_pipeline().steps[-1][1].classes_) > 2:
+            linear = _get_linear(model.get_pipeline().steps[-1][1])
+        if linear is not None:
+            kind, coefficients, intercepts = linear
+            metadata['type'] = 'linear'
+            metadata['kind'] = kind
+            _write_linear(model, temporary_folder, coefficients, intercepts)
+        else:
+            metadata['type'] = 'pickle'
+            with io.open(os.path.join(temporary_folder, PICKLE), 'wb') as file:
+                pickle.dump(model, file)
+        _dump(metadata, os.path.join(temporary_folder, METADATA))
+        
+        # Publish folder, then make it current
+        os.rename(temporary_folder, os.path.join(path, '%08d' % version))
+    except:
+        shutil.rmtree(temporary_folder, ignore_errors=True)
+        raise
+    set_current(path, version)
+    
+    # Discard oldest versions
+    for old_version in get_versions(path)[:-retention]:
+        shutil.rmtree(os.path.join(path, '%08d' % old_version), ignore_errors=True)
+    return version
+
+
+# Load given version, or current one
+def load(path, version=None):
+    if version is None:
+        version = get_current(path)
+        if version is None:
+            raise FileNotFoundError(path)
+    folder = os.path.join(path, '%08d' % version)
+    metadata = _load(os.path.join(folder, METADATA))
+    if metadata['format'] > FORMAT:
+        raise ValueError('Unsupported artifact format %d' % metadata['format'])
+    if metadata['type'] == 'linear':
+        return LinearModel(folder, metadata)
+    with io.open(os.path.join(folder, PICKLE), 'rb') as file:
+        return pickle.load(file)
+
+
+# Flat linear model, where coefficients are memory-mapped (i.e. shared between processes through page cache)
+class LinearModel:
+    def __init__(self, folder, metadata):
+        self._metadata = metadata
+        
+        # Rebuild feature extractor, which needs no fitting
+        spec = _load(os.path.join(folder, FEATURES))
+        self._vectorizer = create_vectorizer(spec['features'], spec['ngrams'], spec['size'])
+        if spec['features'] == 'count':
+            self._vectorizer.set_params(vocabulary={term : index for index, term in enumerate(spec['vocabulary'])})
+            self._selector = None
+        else:
+            self._selector = ColumnSelector()
+            self._selector.columns_ = numpy.load(os.path.join(folder, COLUMNS))
+        
+        # Map coefficients lazily
+        self._classes = numpy.array(_load(os.path.join(folder, CLASSES)), dtype=object)
+        self._coefficients = numpy.load(os.path.join(folder, COEFFICIENTS), mmap_mode='r')
+        self._intercepts = numpy.load(os.path.join(folder, INTERCEPTS))
+    
+    # Get version metadata
+    def get_metadata(self):
+        return self._metadata
+    
+    # Classify each sample, optionally keeping only most probable labels
+    def classify(self, texts, limit=None, threshold=None):
+        
+        # Trivial case
+        if len(texts) == 0:
+            return []
+        
+        # Compute logits, where only coefficients of active features are read
+        features = self._vectorizer.transform(texts)
+        if self._selector is not None:
+            features = self._selector.transform(features)
+        logits = features.astype(numpy.float32) @ self._coefficients + self._intercepts
+        
+        probabilities = _get_probabilities(logits, self._metadata['kind'])
+        return select(probabilities, self._classes, limit, threshold)
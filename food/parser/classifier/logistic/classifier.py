@@ -3,36 +3,133 @@
 
 import asyncio
 import io
+import logging
 import os
 import pickle
 import time
 
+from food.parser.text import load_lemmas, save_lemmas
+
 from ..classifier import Classifier
+from .hierarchy import HierarchicalModel
 from .model import Model
+from . import artifact, parallel
+
+
+# Basic logger instance
+logger = logging.getLogger(__name__)
+
+
+# Relative importance of ontology labels, compared to annotations
+ONTOLOGY_WEIGHT = 5.0
+
+# Delay between checks of published version, in seconds (e.g. to follow a rollback made by another process)
+RELOAD_INTERVAL = 5.0
+
+
+# Accumulate label weights of each text
+def add_samples(samples, pairs, weight=1.0):
+    for text, labels in pairs:
+        weights = samples.setdefault(text, {})
+        for label in labels:
+            weights[label] = weights.get(label, 0.0) + weight
+    return samples
+
+
+# Collect training samples, as label weights for each distinct text, from ontology labels and annotations
+def get_samples(ontology, annotations):
+    samples = {}
+    
+    # Get samples from ontology
+    for id in ontology.get_identifiers():
+        properties = ontology.get_properties(id)
+        add_samples(samples, ((text, [id]) for text in properties['label']), ONTOLOGY_WEIGHT)
+    
+    # Get samples from annotations
+    add_samples(samples, ((a['key'], a['truth']) for a in annotations.values()))
+    return samples
+
+
+# Get direct children of each identifier in taxonomy
+def get_adjacency(ontology):
+    adjacency = {}
+    for id in ontology.get_identifiers():
+        properties = ontology.get_properties(id)
+        adjacency[id] = set(properties['descendants'].get('kind_of', []))
+    return adjacency
 
 
 # Scikit-learn-based classifier
+# Note: feature extractor options (and choice of hierarchical model) only apply to newly trained models
+# Note: if a process pool is provided, training runs in other processes, using given number of jobs for the solver
+# Note: models are stored as versioned artifacts in given folder, while a legacy pickled model is only loaded if there is no artifact yet
+# Note: if a training executor is provided, training sessions do not occupy executor used for classification
+# Note: published version is checked from time to time, hence versions published by other processes are used as well
 class LogisticClassifier(Classifier):
-    def __init__(self, ontology, annotations, path, executor):
+    def __init__(self, ontology, annotations, path, executor, lemmas_path=None, features='count', ngrams=1, hierarchical=False, processes=None, jobs=1, legacy_path=None, retention=artifact.RETENTION, training_executor=None):
         self._ontology = ontology
         self._annotations = annotations
         self._path = path
         self._executor = executor
+        self._training_executor = training_executor or executor
+        self._lemmas_path = lemmas_path
+        self._features = features
+        self._ngrams = ngrams
+        self._hierarchical = hierarchical
+        self._processes = processes
+        self._jobs = jobs
+        self._retention = retention
+        
+        # Preload lemmas used by previous model, if any
+        if self._lemmas_path is not None and os.path.exists(self._lemmas_path):
+            load_lemmas(self._lemmas_path)
         
         # Load previously model, if any
-        if self._path is not None and os.path.exists(self._path):
-            with io.open(self._path, 'rb') as file:
+        self._current = None if self._path is None else artifact.get_current(self._path)
+        self._watcher = None
+        if self._current is not None:
+            self._model = artifact.load(self._path, self._current)
+        elif legacy_path is not None and os.path.exists(legacy_path):
+            with io.open(legacy_path, 'rb') as file:
                 self._model = pickle.load(file)
         else:
             self._model = Model()
+        self._version = 0
+    
+    # Use published version, if it was changed meanwhile
+    async def _reload(self):
+        loop = asyncio.get_event_loop()
+        current = await loop.run_in_executor(self._executor, artifact.get_current, self._path)
+        if current is not None and current != self._current:
+            model = await loop.run_in_executor(self._executor, artifact.load, self._path, current)
+            self._model = model
+            self._current = current
+            self._version += 1
+    
+    # Periodically check published version in background
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(RELOAD_INTERVAL)
+            try:
+                await self._reload()
+            except Exception:
+                logger.exception('Failed to reload classifier')
+    
+    # Stop background checks
+    def close(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
     
     # Run synchronous model in background
-    async def classify(self, texts):
+    async def classify(self, texts, limit=None, threshold=None):
+        if self._watcher is None and self._path is not None:
+            self._watcher = asyncio.ensure_future(self._watch())
         loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(self._executor, self._model.classify, texts)
+        return await loop.run_in_executor(self._executor, self._model.classify, texts, limit, threshold)
     
     # Acquire training samples and run training session
-    async def train(self):
+    async def train(self, progress=None):
         
         # Acquire ontology
         ontology = await self._ontology.get()
@@ -42,54 +139,76 @@ class LogisticClassifier(Classifier):
         annotations = await self._annotations.get()
         
         # Train in background
-        model, status = await loop.run_in_executor(self._executor, self._train, ontology, annotations)
+        model, status = await loop.run_in_executor(self._training_executor, self._train, ontology, annotations, progress)
         if model is not None:
             self._model = model
+            self._current = status.get('version')
+            self._version += 1
         return status
     
+    # Get identifier of current model
+    def get_version(self):
+        return self._version
+    
+    # Publish and use another stored version (by default, the one before current version)
+    async def rollback(self, version=None):
+        if self._path is None:
+            return {'success' : False}
+        loop = asyncio.get_event_loop()
+        versions = await loop.run_in_executor(self._executor, artifact.get_versions, self._path)
+        if version is None:
+            current = await loop.run_in_executor(self._executor, artifact.get_current, self._path)
+            versions = [v for v in versions if current is not None and v < current]
+            if len(versions) == 0:
+                return {'success' : False}
+            version = versions[-1]
+        elif version not in versions:
+            return {'success' : False}
+        model = await loop.run_in_executor(self._executor, artifact.load, self._path, version)
+        await loop.run_in_executor(self._executor, artifact.set_current, self._path, version)
+        self._model = model
+        self._current = version
+        self._version += 1
+        return {'success' : True, 'version' : version}
+    
     # Train logistic model
-    def _train(self, ontology, annotations):
+    # Note: cancellation is checked between stages, and a cancelled model is never published
+    def _train(self, ontology, annotations, progress=None):
         start = time.perf_counter()
         
-        # Get samples from ontology
-        ontology_samples = []
-        for id in ontology.get_identifiers():
-            properties = ontology.get_properties(id)
-            for text in properties['label']:
-                sample = (text, [id])
-                ontology_samples.append(sample)
-        
-        # Get samples from annotations
-        annotations_samples = [(a['key'], a['truth']) for a in annotations.values()]
+        # Get samples from ontology and annotations
+        if progress is not None:
+            progress.update('collecting')
+        samples = get_samples(ontology, annotations)
         
-        # Properly weight samples
-        samples = ontology_samples * 5 + annotations_samples
+        # Acquire taxonomy
+        adjacency = get_adjacency(ontology)
         
-        # Acquire hierarchy
-        identifiers = ontology.get_identifiers()
-        adjacency = {}
-        for id in identifiers:
-            properties = ontology.get_properties(id)
-            descendants = properties['descendants']
-            children = set()
-            for key, values in descendants.items():
-                for value in values:
-                    children.add(value)
-            adjacency[id] = children
-        
-        # Train model
-        model = Model()
-        model.train(samples, adjacency)
+        # Train either flat or hierarchical model
+        if self._hierarchical:
+            model = HierarchicalModel(self._features, self._ngrams, jobs=self._jobs)
+        else:
+            model = Model(self._features, self._ngrams, jobs=self._jobs)
+        if self._processes is None:
+            model.train(samples, adjacency, progress)
+        else:
+            model = parallel.train(model, samples, adjacency, self._processes, progress=progress)
         
-        # Save model
+        # Save model as new version, and reload it to share memory-mapped weights
+        if progress is not None:
+            progress.update('saving')
+        version = None
         if self._path is not None:
-            with io.open(self._path, 'wb') as file:
-                pickle.dump(model, file)
+            version = artifact.save(model, self._path, self._retention)
+            model = artifact.load(self._path, version)
+        if self._lemmas_path is not None:
+            save_lemmas(self._lemmas_path)
         
         # Ready
         end = time.perf_counter()
         status = {
             'success' : True,
-            'time_elapsed' : end - start
+            'time_elapsed' : end - start,
+            'version' : version
         }
         return model, status
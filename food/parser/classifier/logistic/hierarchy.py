@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+
+
+import collections
+import heapq
+from joblib import Parallel, delayed
+import math
+import numpy
+import operator
+import scipy.sparse
+
+from .model import HASHING_SIZE, create_classifier, create_extractor, expand, select
+
+
+# Virtual parent of top-level nodes
+ROOT = None
+
+# Number of nodes kept at each depth by beam search, and probability below which a node is not expanded (as none of its labels can be more probable)
+BEAM_WIDTH = 4
+BEAM_MINIMUM = 1e-4
+
+
+# Enumerate (parent, child) links from root to given label, following all paths
+def get_links(label, parents):
+    links = []
+    stack = [label]
+    visited = {label}
+    while len(stack) > 0:
+        node = stack.pop()
+        for parent in parents[node] or [ROOT]:
+            links.append((parent, node))
+            if parent is not ROOT and parent not in visited:
+                visited.add(parent)
+                stack.append(parent)
+    return links
+
+
+# Express linear classifier as softmax over logits, i.e. as weights and biases of each class
+# Note: binary scikit-learn models have a single decision, whose mapping to probabilities depends on version, hence it is checked on most decisive sample
+def get_logits(classifier, features):
+    weights = classifier.coef_.T
+    bias = classifier.intercept_
+    if weights.shape[1] > 1:
+        return weights, bias
+    sample = features[[numpy.abs(classifier.decision_function(features)).argmax()]]
+    expected = classifier.predict_proba(sample)
+    candidates = [
+        (numpy.hstack([numpy.zeros_like(weights), weights]), numpy.hstack([numpy.zeros_like(bias), bias])),
+        (numpy.hstack([-weights, weights]), numpy.hstack([-bias, bias]))
+    ]
+    for candidate_weights, candidate_bias in candidates:
+        if numpy.allclose(softmax(sample @ candidate_weights + candidate_bias), expected):
+            return candidate_weights, candidate_bias
+    raise ValueError('Unsupported binary classifier')
+
+
+# Normalize logits of each row
+def softmax(logits):
+    logits = numpy.exp(logits - logits.max(axis=1, keepdims=True))
+    return logits / logits.sum(axis=1, keepdims=True)
+
+
+# Train node on its own rows and features, unless there is a single choice, and only keep coefficients
+def fit_node(features, targets, weights):
+    if len(set(targets)) == 1:
+        return [targets[0]], None, None, None
+    columns = numpy.flatnonzero(features.getnnz(axis=0))
+    features = features[:, columns]
+    classifier = create_classifier()
+    classifier.fit(features, targets, sample_weight=weights)
+    weights, bias = get_logits(classifier, features)
+    return classifier.classes_.tolist(), columns, weights, bias
+
+
+# Get longest distance from root of each label, so that all parents of a label are at lower depths
+def get_depths(nodes):
+    children = {node : [target for target in targets if target != node] for node, (targets, _, _, _) in nodes.items()}
+    incoming = collections.Counter(target for targets in children.values() for target in targets)
+    depths = {label : 0 for label in set(children) | set(incoming)}
+    stack = [label for label in depths if incoming[label] == 0]
+    while len(stack) > 0:
+        source = stack.pop()
+        for target in children.get(source, []):
+            depths[target] = max(depths[target], depths[source] + 1)
+            incoming[target] -= 1
+            if incoming[target] == 0:
+                stack.append(target)
+    return depths
+
+
+# Get most probable choices of a node, as (target, probability) pairs, given its logits
+# Note: nodes have few targets, hence plain Python is faster than NumPy here
+def get_choices(targets, logits, beam):
+    logits = logits.tolist()
+    top = max(logits)
+    scores = [math.exp(logit - top) for logit in logits]
+    total = sum(scores)
+    choices = zip(targets, scores)
+    if len(scores) > beam:
+        choices = heapq.nlargest(beam, choices, key=operator.itemgetter(1))
+    return [(target, score / total) for target, score in choices]
+
+
+# Index weights of each node model by feature, so that beam search only reads weights of active features
+# Note: nodes without active feature only depend on their bias, hence their choices are computed once
+# Note: each node only keeps its best choices, as a single node cannot contribute more than that to the next depths
+def compile_beam(nodes, beam):
+    rows = {}
+    priors = {}
+    for node, (targets, columns, weights, bias) in nodes.items():
+        if columns is None:
+            rows[node] = {}
+            priors[node] = [(targets[0], 1.0)]
+        else:
+            weights = numpy.ascontiguousarray(weights)
+            rows[node] = {column : weights[row] for row, column in enumerate(columns.tolist())}
+            priors[node] = get_choices(targets, bias, beam)
+    return {
+        'beam' : beam,
+        'rows' : rows,
+        'priors' : priors,
+        'depths' : get_depths(nodes)
+    }
+
+
+# Keep most probable labels above threshold, in decreasing order
+def select_sparse(probabilities, limit=None, threshold=None):
+    threshold = threshold or 0.0
+    labels = sorted(probabilities.items(), key=lambda x: x[1], reverse=True)
+    if limit is not None:
+        labels = labels[:max(limit, 0)]
+    return {label : probability for label, probability in labels if probability >= threshold}
+
+
+# Maximal magnitude of logits, so that they can be exponentiated without shifting them (i.e. without overflow in double precision)
+LOGIT_LIMIT = 500.0
+
+
+# Create sparse matrix that sums given groups of rows (where group identifiers are sorted)
+def get_summation(groups, count):
+    return scipy.sparse.csr_matrix((numpy.ones(len(groups)), (groups, numpy.arange(len(groups)))), shape=(count, len(groups)))
+
+
+# Stack node models, so that all of them are evaluated with a single product, and group their links by depth
+# Note: links of nodes with a model come first, while nodes without model have a single link that is always followed
+# Note: depth of a node is its longest distance from root, hence all its parents are at lower depths
+# Note: weights are dense, i.e. one float per feature and link, which is similar to a flat model (i.e. one per feature and label)
+def compile_nodes(nodes, size):
+    
+    # Assign an index to each label, where root is first
+    labels = [ROOT]
+    indices = {ROOT : 0}
+    for node, (targets, _, _, _) in nodes.items():
+        for label in [node] + list(targets):
+            if label not in indices:
+                indices[label] = len(labels)
+                labels.append(label)
+    
+    # Assign a block of links to each node model
+    models = [(node, node_targets, node_columns, node_weights, node_bias) for node, (node_targets, node_columns, node_weights, node_bias) in nodes.items() if node_columns is not None]
+    count = sum(len(node_targets) for _, node_targets, _, _, _ in models)
+    weights = numpy.zeros((size, count), dtype=numpy.float32)
+    bias = numpy.zeros(count)
+    sources = []
+    targets = []
+    blocks = []
+    for block, (node, node_targets, node_columns, node_weights, node_bias) in enumerate(models):
+        offset = len(sources)
+        weights[node_columns, offset : offset + len(node_targets)] = node_weights
+        bias[offset : offset + len(node_targets)] = node_bias
+        sources.extend([indices[node]] * len(node_targets))
+        targets.extend(indices[target] for target in node_targets)
+        blocks.extend([block] * len(node_targets))
+    blocks = numpy.array(blocks, dtype=numpy.intp)
+    
+    # Add links that are always followed
+    for node, (node_targets, node_columns, _, _) in nodes.items():
+        if node_columns is None:
+            sources.append(indices[node])
+            targets.append(indices[node_targets[0]])
+    sources = numpy.array(sources, dtype=numpy.intp)
+    targets = numpy.array(targets, dtype=numpy.intp)
+    
+    # Get depth of each label
+    label_depths = get_depths(nodes)
+    depths = numpy.array([label_depths.get(label, 0) for label in labels], dtype=numpy.intp)
+    
+    # Group links by depth of source, where links from a node to itself stop there, and others move mass to a child
+    levels = []
+    for depth in range(depths.max() + 1):
+        selected = depths[sources] == depth
+        stops = numpy.flatnonzero(selected & (sources == targets))
+        
+        # Mass reaching each child is summed over its incoming links
+        moves = numpy.flatnonzero(selected & (sources != targets))
+        moves = moves[numpy.argsort(targets[moves], kind='stable')]
+        children, groups = numpy.unique(targets[moves], return_inverse=True)
+        levels.append((stops, sources[stops], moves, sources[moves], children, get_summation(groups, len(children))))
+    
+    # Labels without model always stop once reached
+    leaves = numpy.array([index for label, index in indices.items() if label is not ROOT and label not in nodes], dtype=numpy.intp)
+    return {
+        'labels' : numpy.array(labels[1:], dtype=object),
+        'links' : len(sources),
+        'weights' : weights,
+        'bias' : bias,
+        'blocks' : blocks,
+        'normalization' : get_summation(blocks, len(models)),
+        'levels' : levels,
+        'leaves' : leaves
+    }
+
+
+# Hierarchy-aware classifier, where each node decides whether to stop or which child to follow
+# Note: node models are small, hence parallelism is obtained by training several nodes at once
+# Note: by default, prediction is a beam search from root, which only evaluates kept nodes, hence probabilities of labels below pruned (or improbable) nodes are zero
+# Note: beam search reads weights of active features for at most beam nodes per depth, instead of evaluating all links
+# Note: without beam, prediction is exact (i.e. probability of each label is the sum over all paths), but all links are evaluated
+class HierarchicalModel:
+    def __init__(self, features='count', ngrams=1, size=HASHING_SIZE, jobs=1, beam=BEAM_WIDTH):
+        self._features = features
+        self._ngrams = ngrams
+        self._size = size
+        self._jobs = jobs
+        self._beam = beam
+        self._vectorizer = None
+        self._nodes = None
+        self._graph = None
+        self._index = None
+    
+    # Compiled structures are rebuilt on first use, instead of being pickled
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_graph'] = None
+        state['_index'] = None
+        return state
+    
+    # Follow most probable nodes from root, one depth at a time, for a single text given as active columns and values
+    def _search(self, columns, values, beam):
+        index = self._index
+        depths = index['depths']
+        priors = index['priors']
+        node_rows = index['rows']
+        features = list(zip(columns, values))
+        
+        # Nodes of each depth are expanded once all their parents are expanded
+        probabilities = collections.defaultdict(float)
+        pending = collections.defaultdict(lambda: collections.defaultdict(float))
+        pending[0][ROOT] = 1.0
+        while len(pending) > 0:
+            level = pending.pop(min(pending))
+            if len(level) > beam:
+                level = heapq.nlargest(beam, level.items(), key=lambda x: x[1])
+            else:
+                level = level.items()
+            for node, mass in level:
+                if mass < BEAM_MINIMUM:
+                    continue
+                
+                # Labels without model always stop once reached
+                rows = node_rows.get(node)
+                if rows is None:
+                    probabilities[node] += mass
+                    continue
+                
+                # Get best choices, where only nodes with active features need to be evaluated
+                logits = None
+                for column, value in features:
+                    row = rows.get(column)
+                    if row is not None:
+                        if logits is None:
+                            logits = self._nodes[node][3].copy()
+                        logits += value * row
+                if logits is None:
+                    choices = priors[node]
+                else:
+                    choices = get_choices(self._nodes[node][0], logits, beam)
+                
+                # Either stop at this node, or move mass to a child
+                for target, score in choices:
+                    if target == node:
+                        probabilities[node] += mass * score
+                    else:
+                        pending[depths[target]][target] += mass * score
+        return probabilities
+    
+    # Compute probability of each label, propagating mass from root one depth at a time
+    def _predict(self, features):
+        graph = getattr(self, '_graph', None)
+        if graph is None:
+            graph = self._graph = compile_nodes(self._nodes, features.shape[1])
+        
+        # Evaluate all node models at once, and normalize each block
+        # Note: arrays are transposed (i.e. one row per link or label), so that gathered links are contiguous
+        count = features.shape[0]
+        logits = numpy.ascontiguousarray((features.astype(numpy.float32) @ graph['weights']).T, dtype=numpy.float64)
+        logits += graph['bias'][:, None]
+        numpy.clip(logits, -LOGIT_LIMIT, LOGIT_LIMIT, out=logits)
+        scores = numpy.empty((graph['links'], count))
+        numpy.exp(logits, out=scores[:len(logits)])
+        scores[:len(logits)] /= (graph['normalization'] @ scores[:len(logits)])[graph['blocks']]
+        scores[len(logits):] = 1.0
+        
+        # Move mass along links, where all parents of a node are handled before it
+        reached = numpy.zeros((len(graph['labels']) + 1, count))
+        reached[0] = 1.0
+        probabilities = numpy.zeros_like(reached)
+        for stops, stop_sources, moves, move_sources, children, summation in graph['levels']:
+            probabilities[stop_sources] = reached[stop_sources] * scores[stops]
+            if len(moves) > 0:
+                reached[children] += summation @ (reached[move_sources] * scores[moves])
+        probabilities[graph['leaves']] = reached[graph['leaves']]
+        return numpy.ascontiguousarray(probabilities[1:].T)
+    
+    # Classify each sample used trained model, optionally keeping only most probable labels
+    def classify(self, texts, limit=None, threshold=None):
+        
+        # Trivial case
+        if len(texts) == 0:
+            return []
+        
+        # If no model has been trained, give nothing
+        if self._nodes is None:
+            return [{} for _ in texts]
+        
+        # Exact propagation from root, for all texts at once
+        features = self._vectorizer.transform(texts)
+        beam = getattr(self, '_beam', BEAM_WIDTH)
+        if beam is None:
+            probabilities = self._predict(features)
+            return select(probabilities, self._graph['labels'], limit, threshold)
+        
+        # Otherwise, search each text independently
+        if getattr(self, '_index', None) is None or self._index['beam'] != beam:
+            self._index = compile_beam(self._nodes, beam)
+        features = features.tocsr()
+        results = []
+        for start, end in zip(features.indptr[:-1], features.indptr[1:]):
+            probabilities = self._search(features.indices[start : end].tolist(), features.data[start : end].tolist(), beam)
+            results.append(select_sparse(probabilities, limit, threshold))
+        return results
+    
+    # Get feature extractor options
+    def get_feature_spec(self):
+        return self._features, self._ngrams, self._size
+    
+    # Train one model per internal node, from weighted samples (i.e. for each text, the weight of each label), optionally reporting progress
+    def train(self, samples, adjacency, progress=None):
+        texts, rows, labels, weights = expand(samples)
+        
+        # Convert words (and optionally word n-grams) to boolean arrays, tokenizing each text once
+        if progress is not None:
+            progress.update('vectorizing')
+        vectorizer = create_extractor(self._features, self._ngrams, self._size)
+        features = vectorizer.fit_transform(texts)
+        self.fit(vectorizer, features, rows, labels, weights, adjacency, progress)
+    
+    # Train from already extracted features, where rows refer to feature matrix
+    # Note: cancellation is checked before each node is dispatched
+    def fit(self, vectorizer, features, rows, labels, weights, adjacency, progress=None):
+        
+        # Make sure no unknown label is given
+        invalid_labels = set(labels)
+        invalid_labels.difference_update(adjacency.keys())
+        assert len(invalid_labels) == 0, ', '.join(invalid_labels)
+        
+        # Get parents from children
+        parents = {id : [] for id in adjacency}
+        for id, children in adjacency.items():
+            for child in children:
+                parents[child].append(id)
+        
+        # Route samples along all paths to their label, where label node learns to stop
+        routes = collections.defaultdict(list)
+        cache = {}
+        for row, label, weight in zip(rows, labels, weights):
+            links = cache.get(label)
+            if links is None:
+                links = cache[label] = get_links(label, parents)
+            routes[label].append((row, label, weight))
+            for parent, child in links:
+                routes[parent].append((row, child, weight))
+        
+        # Train nodes independently, possibly in parallel
+        # Note: tasks are generated lazily, hence only row slices of dispatched nodes are in memory
+        names = list(routes.keys())
+        def get_tasks():
+            for done, name in enumerate(names):
+                if progress is not None:
+                    progress.update('fitting', done, len(names))
+                node_rows, node_targets, node_weights = zip(*routes.pop(name))
+                yield delayed(fit_node)(features[numpy.array(node_rows)], node_targets, numpy.array(node_weights))
+        nodes = dict(zip(names, Parallel(n_jobs=self._jobs)(get_tasks())))
+        
+        # Store model
+        self._vectorizer = vectorizer
+        self._nodes = nodes
+        self._graph = None
+        self._index = None
@@ -2,20 +2,157 @@
 
 
 import numpy
-from sklearn.feature_extraction.text import CountVectorizer
+import scipy.sparse
+import sklearn
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer
 from sklearn.linear_model import LogisticRegression
+from sklearn.multiclass import OneVsRestClassifier
 from sklearn.pipeline import Pipeline
 
 from food.parser.text import tokenize
 
 
+# Number of hashed features
+HASHING_SIZE = 2 ** 20
+
+
+# Keep only hashed features that occur in training set
+# Note: as coefficients are dense, this avoids storing (and optimizing) one weight per class for each unused bucket
+class ColumnSelector(BaseEstimator, TransformerMixin):
+    def fit(self, X, y=None):
+        self.columns_ = numpy.flatnonzero(X.getnnz(axis=0))
+        return self
+    
+    # Remap column indices, only touching non-zero entries
+    def transform(self, X):
+        X = X.tocsr()
+        positions = numpy.searchsorted(self.columns_, X.indices)
+        positions[positions == len(self.columns_)] = 0
+        valid = self.columns_[positions] == X.indices if len(self.columns_) > 0 else numpy.zeros(len(X.indices), dtype=bool)
+        rows = numpy.repeat(numpy.arange(X.shape[0]), numpy.diff(X.indptr))
+        return scipy.sparse.csr_matrix((X.data[valid], (rows[valid], positions[valid])), shape=(X.shape[0], len(self.columns_)))
+
+
+# Create feature extractor, either vocabulary-based ("count") or stateless ("hashing")
+# Note: hashing does not need fitting, hence features can be computed independently by any worker
+def create_vectorizer(features='count', ngrams=1, size=HASHING_SIZE):
+    if features == 'count':
+        return CountVectorizer(
+            tokenizer = tokenize,
+            token_pattern = None,
+            ngram_range = (1, ngrams),
+            # TODO stop_words = [...],
+            binary = True,
+            dtype = numpy.int32
+        )
+    if features == 'hashing':
+        return HashingVectorizer(
+            tokenizer = tokenize,
+            token_pattern = None,
+            ngram_range = (1, ngrams),
+            n_features = size,
+            alternate_sign = False,
+            norm = None,
+            binary = True,
+            dtype = numpy.float32
+        )
+    raise ValueError('Unknown feature extractor %r' % features)
+
+
+# Create feature extractor to be fitted on training texts
+def create_extractor(features='count', ngrams=1, size=HASHING_SIZE):
+    vectorizer = create_vectorizer(features, ngrams, size)
+    if features == 'hashing':
+        vectorizer = Pipeline([
+            ('hashing', vectorizer),
+            ('selector', ColumnSelector())
+        ])
+    return vectorizer
+
+
+# Create linear classifier
+# Note: flat hierarchy representation is used, i.e. a single softmax over all labels, unless several jobs are used (i.e. one-vs-rest binary models fitted in parallel)
+# Note: one-vs-rest wrapper only forwards sample weights through metadata routing, hence fit_classifier must be used
+def create_classifier(jobs=1):
+    classifier = LogisticRegression(
+        solver = 'lbfgs',
+        max_iter = 100
+    )
+    if jobs > 1:
+        with sklearn.config_context(enable_metadata_routing=True):
+            classifier = OneVsRestClassifier(classifier.set_fit_request(sample_weight=True), n_jobs=jobs)
+    return classifier
+
+
+# Fit linear classifier on weighted rows
+def fit_classifier(classifier, features, labels, weights):
+    with sklearn.config_context(enable_metadata_routing=True):
+        return classifier.fit(features, labels, sample_weight=weights)
+
+
+# Flatten weighted samples, given as text to label weights, into rows that refer to unique texts
+def expand(samples):
+    texts = list(samples)
+    rows = []
+    labels = []
+    weights = []
+    for row, text in enumerate(texts):
+        for label, weight in samples[text].items():
+            rows.append(row)
+            labels.append(label)
+            weights.append(weight)
+    return texts, numpy.array(rows, dtype=numpy.intp), labels, numpy.array(weights, dtype=numpy.float64)
+
+
+# Build sparse predictions, keeping only most probable labels above threshold, in decreasing order
+# Note: selection is vectorized, so that Python objects are only created for surviving labels
+def select(probabilities, classes, limit=None, threshold=None):
+    
+    # Without constraint, keep full distribution
+    if limit is None and threshold is None:
+        return [dict(zip(classes, p)) for p in probabilities]
+    
+    # Partially sort columns, to only keep top-k candidates
+    indices = None
+    if limit is not None and limit < probabilities.shape[1]:
+        if limit <= 0:
+            return [{} for _ in probabilities]
+        indices = numpy.argpartition(-probabilities, limit - 1, axis=1)[:, :limit]
+        probabilities = numpy.take_along_axis(probabilities, indices, axis=1)
+    
+    # Sort remaining candidates, and discard improbable ones
+    threshold = threshold or 0.0
+    order = numpy.argsort(-probabilities, axis=1, kind='stable')
+    probabilities = numpy.take_along_axis(probabilities, order, axis=1)
+    indices = order if indices is None else numpy.take_along_axis(indices, order, axis=1)
+    counts = (probabilities >= threshold).sum(axis=1)
+    results = []
+    for index, probability, count in zip(indices, probabilities, counts):
+        results.append(dict(zip(classes[index[:count]].tolist(), probability[:count].tolist())))
+    return results
+
+
 # Scikit-learn-based classifier
+# Note: older pickled models only have a pipeline, which is all that classification requires
 class Model:
-    def __init__(self):
+    def __init__(self, features='count', ngrams=1, size=HASHING_SIZE, jobs=1):
+        self._features = features
+        self._ngrams = ngrams
+        self._size = size
+        self._jobs = jobs
         self._pipeline = None
     
-    # Classify each sample used trained model
-    def classify(self, texts):
+    # Get feature extractor options
+    def get_feature_spec(self):
+        return self._features, self._ngrams, self._size
+    
+    # Get trained pipeline, if any
+    def get_pipeline(self):
+        return self._pipeline
+    
+    # Classify each sample used trained model, optionally keeping only most probable labels
+    def classify(self, texts, limit=None, threshold=None):
         
         # Trivial case
         if len(texts) == 0:
@@ -28,44 +165,38 @@ class Model:
         # Otherwise, use pipeline
         probabilities = self._pipeline.predict_proba(texts)
         classes = self._pipeline.steps[-1][1].classes_
-        return [dict(zip(classes, p)) for p in probabilities]
+        return select(probabilities, classes, limit, threshold)
     
-    # Train model from texts and associated labels
-    def train(self, samples, adjacency):
+    # Train model from weighted samples (i.e. for each text, the weight of each label), optionally reporting progress
+    def train(self, samples, adjacency, progress=None):
+        
+        # Each text is a single row, and each label of this text refers to that row
+        texts, rows, labels, weights = expand(samples)
         
-        # Split multilabels into separate samples
-        samples = [(text, label) for text, labels in samples for label in labels]
-        texts, labels = zip(*samples)
+        # Convert words (and optionally word n-grams) to boolean arrays, tokenizing each text once
+        if progress is not None:
+            progress.update('vectorizing')
+        vectorizer = create_extractor(self._features, self._ngrams, self._size)
+        features = vectorizer.fit_transform(texts)
+        self.fit(vectorizer, features, rows, labels, weights, adjacency, progress)
+    
+    # Train model from already extracted features, where rows refer to feature matrix
+    # Note: solver has no checkpoint, hence fitting cannot be interrupted
+    def fit(self, vectorizer, features, rows, labels, weights, adjacency, progress=None):
         
         # Make sure no unknown label is given
         invalid_labels = set(labels)
         invalid_labels.difference_update(adjacency.keys())
         assert len(invalid_labels) == 0, ', '.join(invalid_labels)
         
-        # Convert words to boolean arrays
-        vectorizer = CountVectorizer(
-            tokenizer = tokenize,
-            # TODO ngram_range = (1, 1),
-            # TODO stop_words = [...],
-            binary = True,
-            dtype = numpy.int32
-        )
+        # Use flat hierarchy representation, where duplicated rows are weighted
+        # Note: see HierarchicalModel for a hierarchy-aware alternative
+        if progress is not None:
+            progress.update('fitting', interruptible=False)
+        classifier = fit_classifier(create_classifier(self._jobs), features[rows], labels, weights)
         
-        # Use flat hierarchy representation
-        # TODO use children to build hierarchy-aware model
-        classifier = LogisticRegression(
-            solver = 'lbfgs',
-            multi_class = 'multinomial',
-            n_jobs = 1,
-            max_iter = 100
-        )
-        
-        # Create and train pipeline
-        pipeline = Pipeline([
+        # Store model
+        self._pipeline = Pipeline([
             ('vectorizer', vectorizer),
             ('classifier', classifier)
         ])
-        pipeline.fit(texts, labels)
-        
-        # Store model
-        self._pipeline = pipeline
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+
+from multiprocessing import resource_tracker, shared_memory
+import numpy
+import scipy.sparse
+from sklearn.pipeline import Pipeline
+
+from food.parser.text import add_lemmas, get_lemmas, lemma_cache
+
+from .model import ColumnSelector, create_vectorizer, expand
+
+
+# Number of texts vectorized by each task
+CHUNK_SIZE = 10000
+
+
+# Open shared memory block, which is explicitly released by training coordinator (hence not tracked by worker processes)
+def open_block(**kwargs):
+    block = shared_memory.SharedMemory(**kwargs)
+    resource_tracker.unregister(block._name, 'shared_memory')
+    return block
+
+
+# Sparse matrix stored in shared memory, which is sent to other processes by name instead of content
+class SharedMatrix:
+    def __init__(self, matrix):
+        self._shape = matrix.shape
+        self._arrays = []
+        for array in (matrix.data, matrix.indices, matrix.indptr):
+            block = open_block(create=True, size=max(array.nbytes, 1))
+            numpy.ndarray(array.shape, array.dtype, block.buf)[:] = array
+            self._arrays.append((block.name, array.dtype.str, len(array)))
+            block.close()
+    
+    # Copy content of blocks
+    def load(self):
+        arrays = []
+        for name, dtype, length in self._arrays:
+            block = open_block(name=name)
+            try:
+                arrays.append(numpy.ndarray((length,), dtype, block.buf).copy())
+            finally:
+                block.close()
+        return scipy.sparse.csr_matrix(tuple(arrays), shape=self._shape)
+    
+    # Release blocks
+    def unlink(self):
+        for name, _, _ in self._arrays:
+            try:
+                block = shared_memory.SharedMemory(name=name)
+            except FileNotFoundError:
+                continue
+            block.close()
+            block.unlink()
+
+
+# Tokenize and vectorize texts, in worker process
+# Note: in vocabulary-based mode, columns refer to local vocabulary, which is also returned
+# Note: lemmas cached by this task are also returned, so that they are saved with model
+def vectorize(texts, features, ngrams, size):
+    count = len(lemma_cache)
+    vectorizer = create_vectorizer(features, ngrams, size)
+    if features == 'count':
+        matrix = vectorizer.fit_transform(texts)
+        vocabulary = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+    else:
+        matrix = vectorizer.transform(texts)
+        vocabulary = None
+    return SharedMatrix(matrix.tocsr()), vocabulary, get_lemmas(count)
+
+
+# Merge vectorized chunks and train model, in worker process
+def fit(model, chunks, rows, labels, weights, adjacency):
+    features, ngrams, size = model.get_feature_spec()
+    matrices = [matrix.load() for matrix, _ in chunks]
+    
+    # Map local vocabularies to global one, sorted as if vectorizer was fitted on all texts
+    if features == 'count':
+        vocabulary = sorted(set().union(*(terms for _, terms in chunks)))
+        indices = {term : index for index, term in enumerate(vocabulary)}
+        for i, (matrix, (_, terms)) in enumerate(zip(matrices, chunks)):
+            mapping = numpy.array([indices[term] for term in terms], dtype=matrix.indices.dtype)
+            matrices[i] = scipy.sparse.csr_matrix((matrix.data, mapping[matrix.indices], matrix.indptr), shape=(matrix.shape[0], len(vocabulary)))
+        matrix = scipy.sparse.vstack(matrices, format='csr')
+        vectorizer = create_vectorizer(features, ngrams, size)
+        vectorizer.set_params(vocabulary=indices)
+    
+    # Hashed features are already aligned, but unused columns are discarded
+    else:
+        selector = ColumnSelector()
+        matrix = selector.fit_transform(scipy.sparse.vstack(matrices, format='csr'))
+        vectorizer = Pipeline([
+            ('hashing', create_vectorizer(features, ngrams, size)),
+            ('selector', selector)
+        ])
+    
+    # Train model
+    model.fit(vectorizer, matrix, rows, labels, weights, adjacency)
+    return model
+
+
+# Train model using process pool, where texts are vectorized in parallel and collected through shared memory
+# Note: if progress is provided, it is updated after each chunk, and cancellation drops chunks that are not started yet
+# Note: lemmas cached by worker processes are merged into cache of current process
+def train(model, samples, adjacency, executor, chunk_size=CHUNK_SIZE, progress=None):
+    texts, rows, labels, weights = expand(samples)
+    features, ngrams, size = model.get_feature_spec()
+    futures = [executor.submit(vectorize, texts[start : start + chunk_size], features, ngrams, size) for start in range(0, len(texts), chunk_size)]
+    chunks = []
+    try:
+        for future in futures:
+            if progress is not None:
+                progress.update('vectorizing', len(chunks), len(futures))
+            matrix, vocabulary, lemmas = future.result()
+            add_lemmas(lemmas)
+            chunks.append((matrix, vocabulary))
+        if progress is not None:
+            progress.update('fitting', interruptible=False)
+        return executor.submit(fit, model, chunks, rows, labels, weights, adjacency).result()
+    
+    # Make sure all blocks are released, even on failure
+    finally:
+        for future in futures:
+            if not future.cancel() and future.exception() is None:
+                future.result()[0].unlink()
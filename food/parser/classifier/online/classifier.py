@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncio
+import io
+import logging
+import os
+import pickle
+import time
+
+from ..classifier import Classifier
+from ..logistic.classifier import get_samples
+from .model import OnlineModel
+
+
+logger = logging.getLogger(__name__)
+
+
+# Minimal delay between snapshots of updated model, in seconds, as each one copies all coefficients
+SNAPSHOT_INTERVAL = 1.0
+
+
+# Incrementally updated classifier, where each annotation batch is applied in background
+# Note: full training is still used to consolidate model (e.g. after ontology changes), and only trained models are saved
+# Note: if a training executor is provided, training sessions do not occupy executor used for classification and updates
+# Note: model is updated in place, while classification uses a snapshot that is replaced at most once per interval
+class OnlineClassifier(Classifier):
+    def __init__(self, ontology, annotations, path, executor, ngrams=1, epochs=5, training_executor=None):
+        self._ontology = ontology
+        self._annotations = annotations
+        self._path = path
+        self._executor = executor
+        self._training_executor = training_executor or executor
+        self._ngrams = ngrams
+        self._epochs = epochs
+        
+        # Load previously model, if any
+        if self._path is not None and os.path.exists(self._path):
+            with io.open(self._path, 'rb') as file:
+                self._model = pickle.load(file)
+        else:
+            self._model = OnlineModel(self._ngrams)
+        self._snapshot = self._model.snapshot()
+        self._published = 0.0
+        self._version = 0
+        
+        # Updates are applied one batch at a time, and those applied during training are replayed on new model
+        self._lock = asyncio.Lock()
+        self._pending = []
+        self._updater = None
+        self._journal = None
+    
+    # Run synchronous model in background
+    async def classify(self, texts, limit=None, threshold=None):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, self._snapshot.classify, texts, limit, threshold)
+    
+    # Get identifier of current model
+    def get_version(self):
+        return self._version
+    
+    # Queue new annotations, without waiting for model update
+    async def update(self, entries):
+        self._pending.extend((entry['key'], entry['truth']) for entry in entries)
+        if self._updater is None:
+            self._updater = asyncio.ensure_future(self._update())
+    
+    # Update model and take snapshot, in worker thread
+    def _apply(self, model, samples, classes):
+        if model.update(samples, classes):
+            return model.snapshot()
+        return None
+    
+    # Apply queued annotations, merging those that arrived during previous update
+    async def _update(self):
+        loop = asyncio.get_event_loop()
+        try:
+            while len(self._pending) > 0:
+                
+                # Wait until next snapshot is allowed, merging annotations that arrive meanwhile
+                delay = self._published + SNAPSHOT_INTERVAL - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                samples = self._pending
+                self._pending = []
+                ontology = await self._ontology.get()
+                async with self._lock:
+                    snapshot = await loop.run_in_executor(self._executor, self._apply, self._model, samples, ontology.get_identifiers())
+                    if snapshot is not None:
+                        self._snapshot = snapshot
+                        self._published = loop.time()
+                        self._version += 1
+                    if self._journal is not None:
+                        self._journal.extend(samples)
+        except:
+            logger.exception('Failed to update classifier')
+        finally:
+            self._updater = None
+    
+    # Retrain from scratch, and replay updates applied meanwhile
+    # Note: overlapping calls must be avoided (e.g. using DelayedClassifier)
+    async def train(self, progress=None):
+        loop = asyncio.get_event_loop()
+        self._journal = []
+        try:
+            ontology = await self._ontology.get()
+            annotations = await self._annotations.get()
+            model, status = await loop.run_in_executor(self._training_executor, self._train, ontology, annotations, progress)
+            async with self._lock:
+                journal = self._journal
+                self._journal = None
+                snapshot = await loop.run_in_executor(self._executor, self._apply, model, journal, ontology.get_identifiers())
+                self._model = model
+                self._snapshot = snapshot or model.snapshot()
+                self._published = loop.time()
+                self._version += 1
+        finally:
+            self._journal = None
+        return status
+    
+    # Train model using all samples
+    def _train(self, ontology, annotations, progress=None):
+        start = time.perf_counter()
+        
+        # Train model
+        if progress is not None:
+            progress.update('fitting', interruptible=False)
+        model = OnlineModel(self._ngrams)
+        model.train(get_samples(ontology, annotations), self._epochs)
+        
+        # Save model, unless session was cancelled meanwhile
+        if progress is not None:
+            progress.update('saving')
+        if self._path is not None:
+            with io.open(self._path, 'wb') as file:
+                pickle.dump(model, file)
+        
+        # Ready
+        end = time.perf_counter()
+        status = {
+            'success' : True,
+            'time_elapsed' : end - start
+        }
+        return model, status
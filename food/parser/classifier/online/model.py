@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+
+import numpy
+from sklearn.linear_model import SGDClassifier
+
+from ..logistic.classifier import add_samples
+from ..logistic.model import create_vectorizer, expand, select
+
+
+# Number of hashed features
+# Note: coefficients are dense, i.e. one float per class and feature, and are copied for each snapshot
+HASHING_SIZE = 2 ** 14
+
+
+# Read-only copy of linear model, used for classification while original model is updated
+# Note: coefficients are stored in single precision, which halves the copy
+class OnlineSnapshot:
+    def __init__(self, vectorizer, classifier):
+        self._vectorizer = vectorizer
+        self._classes = None
+        if classifier is not None:
+            self._classes = classifier.classes_
+            self._coefficients = classifier.coef_.T.astype(numpy.float32)
+            self._intercepts = classifier.intercept_.astype(numpy.float32)
+    
+    # Classify each sample, optionally keeping only most probable labels
+    def classify(self, texts, limit=None, threshold=None):
+        
+        # Trivial case
+        if len(texts) == 0:
+            return []
+        
+        # If no model has been trained, give nothing
+        if self._classes is None:
+            return [{} for _ in texts]
+        
+        # Otherwise, normalize one-vs-rest probabilities, as done by scikit-learn
+        features = self._vectorizer.transform(texts)
+        probabilities = 1.0 / (1.0 + numpy.exp(-(features @ self._coefficients + self._intercepts)))
+        if probabilities.shape[1] == 1:
+            probabilities = numpy.hstack([1.0 - probabilities, probabilities])
+        else:
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+        return select(probabilities, self._classes, limit, threshold)
+
+
+# Linear classifier, trained by stochastic gradient descent over hashed features
+# Note: updates are applied in place, hence model must only be used by a single writer, while readers use snapshots
+class OnlineModel:
+    def __init__(self, ngrams=1, size=HASHING_SIZE):
+        self._vectorizer = create_vectorizer('hashing', ngrams, size)
+        self._classifier = None
+    
+    # Create untrained linear model
+    def _create(self, epochs):
+        return SGDClassifier(
+            loss = 'log_loss',
+            alpha = 1e-5,
+            max_iter = epochs,
+            tol = None,
+            n_jobs = 1
+        )
+    
+    # Classify each sample used trained model, optionally keeping only most probable labels
+    def classify(self, texts, limit=None, threshold=None):
+        
+        # Trivial case
+        if len(texts) == 0:
+            return []
+        
+        # If no model has been trained, give nothing
+        if self._classifier is None:
+            return [{} for _ in texts]
+        
+        # Otherwise, hash features and use linear model
+        features = self._vectorizer.transform(texts)
+        probabilities = self._classifier.predict_proba(features)
+        return select(probabilities, self._classifier.classes_, limit, threshold)
+    
+    # Train model from scratch, using several passes over weighted samples
+    def train(self, samples, epochs=5):
+        texts, rows, labels, weights = expand(samples)
+        classifier = self._create(epochs)
+        classifier.fit(self._vectorizer.transform(texts)[rows], labels, sample_weight=weights)
+        self._classifier = classifier
+    
+    # Update model in place, using a single pass over new texts and associated labels, and tell whether it changed
+    # Note: set of classes is fixed by first update (or training), and samples with other labels are ignored
+    def update(self, samples, classes):
+        if self._classifier is None:
+            classifier = self._create(1)
+            classes = list(classes)
+        else:
+            classifier = self._classifier
+            classes = classifier.classes_
+        known = set(classes)
+        samples = add_samples({}, ((text, [label for label in labels if label in known]) for text, labels in samples))
+        texts, rows, labels, weights = expand(samples)
+        if len(labels) == 0:
+            return False
+        classifier.partial_fit(self._vectorizer.transform(texts)[rows], labels, classes=classes, sample_weight=weights)
+        self._classifier = classifier
+        return True
+    
+    # Copy current state, for classification
+    def snapshot(self):
+        return OnlineSnapshot(self._vectorizer, self._classifier)
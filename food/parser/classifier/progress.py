@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+
+import threading
+import time
+
+
+# Raised by training session, when cancellation was requested
+class Cancelled(Exception):
+    pass
+
+
+# Training session state, shared between event loop and worker threads
+class Progress:
+    def __init__(self, expected=None):
+        self._lock = threading.Lock()
+        self._start = time.time()
+        self._expected = expected
+        self._stage = 'pending'
+        self._done = 0
+        self._total = None
+        self._interruptible = True
+        self._cancelled = False
+    
+    # Report current stage, optionally how many steps are done in this stage, and whether there are checkpoints within this stage
+    # Note: if a stage is not interruptible, cancellation only takes effect once it is done
+    def update(self, stage, done=0, total=None, interruptible=True):
+        with self._lock:
+            self._stage = stage
+            self._done = done
+            self._total = total
+            self._interruptible = interruptible
+        self.check()
+    
+    # Ask session to stop, at next checkpoint
+    def cancel(self):
+        self._cancelled = True
+    
+    # Check whether session was cancelled
+    def is_cancelled(self):
+        return self._cancelled
+    
+    # Stop session, if cancellation was requested
+    def check(self):
+        if self._cancelled:
+            raise Cancelled()
+    
+    # Get current state, where remaining time is based on expected duration (e.g. previous session)
+    def get_status(self):
+        with self._lock:
+            elapsed = time.time() - self._start
+            eta = None
+            if self._expected is not None:
+                eta = max(self._expected - elapsed, 0.0)
+            return {
+                'stage' : self._stage,
+                'done' : self._done,
+                'total' : self._total,
+                'started' : self._start,
+                'elapsed' : elapsed,
+                'eta' : eta,
+                'interruptible' : self._interruptible,
+                'cancelled' : self._cancelled
+            }
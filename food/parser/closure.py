@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+
+import bisect
+
+
+# Inference rules, as (transferring, entering, following) relationships
+# Note: a path is valid if it starts with any number of "transferring" links, then has exactly one "entering" link, and ends with any number of "following" links
+DERIVATIVE_ATTRIBUTES = {'derivative_of', 'part_of', 'made_of'}
+RULES = {
+    'kind_of' : ({'kind_of'}, {'kind_of'}, {'kind_of'}),
+    'derivative_of' : ({'kind_of'}, DERIVATIVE_ATTRIBUTES, {'kind_of'} | DERIVATIVE_ATTRIBUTES),
+    'part_of' : ({'kind_of'}, {'part_of'}, {'kind_of', 'part_of'}),
+    'made_of' : ({'kind_of'}, {'made_of'}, {'kind_of', 'made_of'}),
+    'product_of' : ({'kind_of'}, {'product_of'}, {'kind_of'})
+}
+
+
+# Label each node with the post-order intervals of all nodes reachable from it
+# Note: see Agrawal et al., "Efficient management of transitive relationships in large data and knowledge bases", 1989
+def label(successors):
+    count = len(successors)
+    posts = [None] * count
+    lows = [None] * count
+    order = []
+    
+    # Number nodes using iterative depth-first search, so that spanning subtrees are contiguous
+    active = [False] * count
+    for root in range(count):
+        if posts[root] is not None:
+            continue
+        stack = [(root, iter(successors[root]))]
+        lows[root] = len(order)
+        active[root] = True
+        while len(stack) > 0:
+            node, children = stack[-1]
+            for child in children:
+                if active[child]:
+                    raise ValueError('Cycle detected in ontology')
+                if posts[child] is None:
+                    lows[child] = len(order)
+                    active[child] = True
+                    stack.append((child, iter(successors[child])))
+                    break
+            else:
+                stack.pop()
+                active[node] = False
+                posts[node] = len(order)
+                order.append(node)
+    
+    # Merge intervals in post-order, as successors are always numbered first
+    intervals = [None] * count
+    for node in order:
+        candidates = [(lows[node], posts[node])]
+        for child in successors[node]:
+            candidates.extend(intervals[child])
+        candidates.sort()
+        merged = [candidates[0]]
+        for low, high in candidates[1:]:
+            last_low, last_high = merged[-1]
+            if low <= last_high + 1:
+                if high > last_high:
+                    merged[-1] = (last_low, high)
+            else:
+                merged.append((low, high))
+        intervals[node] = merged
+    return posts, order, intervals
+
+
+# Check whether post-order number is covered by intervals
+def covers(intervals, post):
+    index = bisect.bisect_right(intervals, (post, float('inf'))) - 1
+    return index >= 0 and intervals[index][1] >= post
+
+
+# Transitive closure of a single relationship
+class _Closure:
+    def __init__(self, ascendants, count, rule):
+        transferring, entering, following = rule
+        
+        # Build two-layer graph, where nodes in second layer have used exactly one entering link
+        forward = [[] for _ in range(count * 2)]
+        backward = [[] for _ in range(count * 2)]
+        def connect(source, target):
+            forward[source].append(target)
+            backward[target].append(source)
+        for source, relationships in enumerate(ascendants):
+            for key, targets in relationships.items():
+                for target in targets:
+                    if key in transferring:
+                        connect(source, target)
+                    if key in entering:
+                        connect(source, target + count)
+                    if key in following:
+                        connect(source + count, target + count)
+        
+        # Label both directions
+        self._count = count
+        self._forward_posts, self._forward_order, self._forward_intervals = label(forward)
+        self._backward_posts, self._backward_order, self._backward_intervals = label(backward)
+    
+    # Check whether ascendant is reachable from given node
+    def contains(self, node, ascendant):
+        post = self._forward_posts[ascendant + self._count]
+        return covers(self._forward_intervals[node], post)
+    
+    # List reachable nodes in second layer
+    def ascendants(self, node):
+        order = self._forward_order
+        return [order[post] - self._count for low, high in self._forward_intervals[node] for post in range(low, high + 1) if order[post] >= self._count]
+    
+    # List nodes in first layer that reach given node
+    def descendants(self, node):
+        order = self._backward_order
+        return [order[post] for low, high in self._backward_intervals[node + self._count] for post in range(low, high + 1) if order[post] < self._count]
+
+
+# Precomputed transitive closure index over hierarchical relationships
+class ClosureIndex:
+    def __init__(self, ontology):
+        self._identifiers = list(ontology.get_identifiers())
+        self._indices = {id : index for index, id in enumerate(self._identifiers)}
+        ascendants = []
+        for id in self._identifiers:
+            relationships = ontology._ascendants[id]
+            ascendants.append({key : [self._indices[value] for value in values] for key, values in relationships.items()})
+        self._closures = {relationship : _Closure(ascendants, len(self._identifiers), rule) for relationship, rule in RULES.items()}
+    
+    # Check whether identifier is transitively related to ascendant
+    def is_a(self, identifier, ascendant, relationship='kind_of'):
+        node = self._indices.get(identifier)
+        target = self._indices.get(ascendant)
+        if node is None or target is None:
+            return False
+        return self._closures[relationship].contains(node, target)
+    
+    # Get all transitive ascendants of given identifier
+    def get_ascendants(self, identifier, relationship='kind_of'):
+        node = self._indices.get(identifier)
+        if node is None:
+            return []
+        return [self._identifiers[index] for index in self._closures[relationship].ascendants(node)]
+    
+    # Get all transitive descendants of given identifier
+    def get_descendants(self, identifier, relationship='kind_of'):
+        node = self._indices.get(identifier)
+        if node is None:
+            return []
+        return [self._identifiers[index] for index in self._closures[relationship].descendants(node)]
+    
+    # Get ascendants for many identifiers, resolving each distinct identifier once
+    def get_many_ascendants(self, identifiers, relationship='kind_of'):
+        cache = {}
+        results = []
+        for identifier in identifiers:
+            result = cache.get(identifier)
+            if result is None:
+                result = cache[identifier] = self.get_ascendants(identifier, relationship)
+            results.append(result)
+        return results
+    
+    # Get descendants for many identifiers, resolving each distinct identifier once
+    def get_many_descendants(self, identifiers, relationship='kind_of'):
+        cache = {}
+        results = []
+        for identifier in identifiers:
+            result = cache.get(identifier)
+            if result is None:
+                result = cache[identifier] = self.get_descendants(identifier, relationship)
+            results.append(result)
+        return results
+    
+    # Check many identifiers against a single ascendant
+    def are_a(self, identifiers, ascendant, relationship='kind_of'):
+        target = self._indices.get(ascendant)
+        if target is None:
+            return [False for _ in identifiers]
+        closure = self._closures[relationship]
+        indices = self._indices
+        results = []
+        for identifier in identifiers:
+            node = indices.get(identifier)
+            results.append(node is not None and closure.contains(node, target))
+        return results
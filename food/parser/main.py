@@ -14,6 +14,9 @@ from .log import Log
 HERE = os.path.dirname(os.path.realpath(__file__))
 SERVER_LOG = os.path.join(HERE, 'model', 'server.log')
 
+# Number of processes used for training
+TRAINING_PROCESSES = max(1, (os.cpu_count() or 1) - 1)
+
 
 # Prepare routing table
 routes = web.RouteTableDef()
@@ -54,18 +57,63 @@ async def handle_api_classify(request):
         raise web.HTTPBadRequest()
     text = request.query['text']
     
-    # Get probability threshold
+    # Get probability threshold and label count limit
     try:
         threshold = float(request.query.get('threshold', 0.0))
+        limit = request.query.get('limit')
+        if limit is not None:
+            limit = int(limit)
     except:
         raise web.HTTPBadRequest()
     
-    # TODO allow some limit parameter?
-    
     # Classify sample
-    result = await api.classify(text, threshold)
+    result = await api.classify(text, threshold, limit)
     return web.json_response(result)
 
+# Classify many texts at once
+@routes.post('/api/classify')
+async def handle_api_classify_many(request):
+    api = request.app['api']
+    try:
+        payload = await request.json()
+    except:
+        raise web.HTTPBadRequest()
+    if type(payload) is not dict:
+        raise web.HTTPBadRequest()
+    
+    # Get samples, where threshold and limit may be overridden
+    samples = payload.get('samples')
+    if samples is None:
+        texts = payload.get('texts', [])
+        if type(texts) is not list:
+            raise web.HTTPBadRequest()
+        samples = [{'text' : text} for text in texts]
+    if type(samples) is not list:
+        raise web.HTTPBadRequest()
+    texts = []
+    thresholds = []
+    limits = []
+    for sample in samples:
+        if type(sample) is not dict:
+            raise web.HTTPBadRequest()
+        text = sample.get('text')
+        if type(text) is not str:
+            raise web.HTTPBadRequest()
+        try:
+            threshold = float(sample.get('threshold', payload.get('threshold', 0.0)))
+            limit = sample.get('limit', payload.get('limit'))
+            if limit is not None:
+                limit = int(limit)
+        except:
+            raise web.HTTPBadRequest()
+        texts.append(text)
+        thresholds.append(threshold)
+        limits.append(limit)
+    
+    # Classify samples
+    results = await api.classify_many(texts, thresholds, limits)
+    return web.json_response({'results' : results})
+
 # Query random samples
 @routes.get('/api/sample')
 async def handle_api_sample(request):
@@ -112,6 +160,36 @@ async def handle_api_train(request):
     result = await api.train()
     return web.json_response(result)
 
+# Get training progress
+@routes.get('/api/train')
+async def handle_api_train_status(request):
+    api = request.app['api']
+    result = await api.training_status()
+    return web.json_response(result)
+
+# Stop running training session
+@routes.post('/api/train/cancel')
+async def handle_api_train_cancel(request):
+    api = request.app['api']
+    result = await api.cancel_training()
+    return web.json_response(result)
+
+# Publish another stored model version, by default the previous one
+@routes.post('/api/model/rollback')
+async def handle_api_model_rollback(request):
+    api = request.app['api']
+    try:
+        payload = await request.json() if request.can_read_body else {}
+    except:
+        raise web.HTTPBadRequest()
+    if type(payload) is not dict:
+        raise web.HTTPBadRequest()
+    version = payload.get('version')
+    if version is not None and type(version) is not int:
+        raise web.HTTPBadRequest()
+    result = await api.rollback(version)
+    return web.json_response(result)
+
 # Add logging middleware
 @web.middleware
 async def middleware(request, handler):
@@ -127,8 +205,8 @@ async def middleware(request, handler):
 app = web.Application(middlewares=[middleware])
 app.router.add_routes(routes)
 
-# Instantiate some workers
-with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+# Instantiate some workers, and dedicated thread and processes for training
+with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor, concurrent.futures.ThreadPoolExecutor(max_workers=1) as trainer, concurrent.futures.ProcessPoolExecutor(max_workers=TRAINING_PROCESSES) as processes:
     app['executor'] = executor
     
     # Provide log manager
@@ -136,8 +214,8 @@ with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
     app['log'] = log
     
     # Instantiate API container
-    api = API(executor, log)
+    api = API(executor, log, processes, trainer)
     app['api'] = api
-
+    
     # Run web server
     web.run_app(app)
@@ -3,12 +3,20 @@
 
 import asyncio
 import collections
-from datetime import datetime
-import difflib
+import hashlib
 import io
+import logging
 import os
 from food.ontology.reader import iterate
 
+from . import snapshot
+from .closure import ClosureIndex
+from .suggest import SuggestionIndex
+
+
+# Basic logger instance
+logger = logging.getLogger(__name__)
+
 
 # Attributes with structural meaning
 HIERARCHICAL_ATTRIBUTES = {
@@ -27,6 +35,8 @@ class Ontology:
         self._attributes = {}
         self._ascendants = {}
         self._descendants = {}
+        self._closure = None
+        self._suggestions = None
         for id, relationships in entries.items():
             attributes = {}
             ascendants = {}
@@ -41,6 +51,92 @@ class Ontology:
                 for value in values:
                     self._descendants[value][key].append(id)
     
+    # Create ontology from prebuilt tables
+    @classmethod
+    def _create(cls, attributes, ascendants, descendants):
+        ontology = cls.__new__(cls)
+        ontology._attributes = attributes
+        ontology._ascendants = ascendants
+        ontology._descendants = descendants
+        ontology._closure = None
+        ontology._suggestions = None
+        return ontology
+    
+    # Open compiled snapshot, using memory-mapping instead of parsing
+    @classmethod
+    def load(cls, path):
+        data = snapshot.Snapshot(path)
+        return cls._create(data.attributes, data.ascendants, data.descendants)
+    
+    # Create new version with some triplets removed and added, sharing untouched entries
+    def patch(self, removed, added):
+        
+        # Rebuild relationships of affected entries
+        entries = {}
+        for left, _, _ in removed + added:
+            if left not in entries:
+                relationships = collections.defaultdict(list)
+                for table in (self._attributes, self._ascendants):
+                    for key, values in table.get(left, {}).items():
+                        relationships[key].extend(values)
+                entries[left] = relationships
+        for left, relationship, right in removed:
+            entries[left][relationship].remove(right)
+        for left, relationship, right in added:
+            entries[left][relationship].append(right)
+        
+        # Copy tables, where descendants are copied on first write
+        attributes = dict(self._attributes)
+        ascendants = dict(self._ascendants)
+        descendants = dict(self._descendants)
+        copied = set()
+        def edit(id):
+            if id not in copied:
+                previous = descendants[id]
+                descendants[id] = collections.defaultdict(list, {key : list(values) for key, values in previous.items()})
+                copied.add(id)
+            return descendants[id]
+        
+        # Detach previous hierarchical links
+        for id in entries:
+            for key, values in self._ascendants.get(id, {}).items():
+                for value in values:
+                    children = edit(value)
+                    children[key].remove(id)
+                    if len(children[key]) == 0:
+                        del children[key]
+        
+        # Update entries and attach new hierarchical links
+        for id, relationships in entries.items():
+            relationships = {key : values for key, values in relationships.items() if len(values) > 0}
+            if len(relationships) == 0:
+                del attributes[id]
+                del ascendants[id]
+                continue
+            attributes[id] = {key : values for key, values in relationships.items() if key not in HIERARCHICAL_ATTRIBUTES}
+            ascendants[id] = {key : values for key, values in relationships.items() if key in HIERARCHICAL_ATTRIBUTES}
+            if id not in descendants:
+                descendants[id] = collections.defaultdict(list)
+                copied.add(id)
+        for id in entries:
+            for key, values in ascendants.get(id, {}).items():
+                for value in values:
+                    if value not in attributes:
+                        raise KeyError(value)
+                    edit(value)[key].append(id)
+        
+        # Remove deleted entries, which must not be referenced anymore
+        for id in entries:
+            if id not in attributes:
+                if len(descendants[id]) > 0:
+                    raise KeyError(id)
+                del descendants[id]
+        return self._create(attributes, ascendants, descendants)
+    
+    # Compile as binary snapshot
+    def save(self, path):
+        snapshot.write(path, self._attributes, self._ascendants, self._descendants)
+    
     # Get all identifiers
     def get_identifiers(self):
         return self._attributes.keys()
@@ -57,48 +153,171 @@ class Ontology:
             'descendants' : self._descendants[identifier]
         }
     
-    # Find closest entries
-    def get_close_matches(self, query):
-        return difflib.get_close_matches(query, list(self._attributes), n=16, cutoff=0.01)
+    # Get transitive closure index, built on first use
+    def get_closure(self):
+        if self._closure is None:
+            self._closure = ClosureIndex(self)
+        return self._closure
+    
+    # Get fuzzy suggestion index, built on first use
+    def get_suggestions(self):
+        if self._suggestions is None:
+            self._suggestions = SuggestionIndex(self)
+        return self._suggestions
+    
+    # Find closest entries, using identifiers and labels
+    def get_close_matches(self, query, count=16):
+        return self.get_suggestions().search(query, count)
+
+
+# Source file state, with its parsed triplets (if known)
+Source = collections.namedtuple('Source', ['signature', 'digest', 'triplets'])
+
+
+# Get file modification signature
+def signature(path):
+    status = os.stat(path)
+    return status.st_mtime_ns, status.st_size
+
 
+# Read and parse source file
+def read(path):
+    current_signature = signature(path)
+    with io.open(path, 'rb') as file:
+        content = file.read()
+    digest = hashlib.sha1(content).digest()
+    triplets = list(iterate(io.TextIOWrapper(io.BytesIO(content), encoding='utf-8')))
+    return Source(current_signature, digest, triplets)
 
-# Asynchronous ontology container, with automatic refresh from disk
+
+# Build ontology from triplets
+def build(triplets):
+    entries = collections.defaultdict(lambda: collections.defaultdict(list))
+    for left, relationship, right in triplets:
+        entries[left][relationship].append(right)
+    return Ontology(entries)
+
+
+# Parse ontology from text files
+def parse(paths):
+    return build(triplet for path in paths for triplet in read(path).triplets)
+
+
+# Compile text files as binary snapshot
+def compile_snapshot(paths, path):
+    ontology = parse(paths)
+    ontology.save(path)
+
+
+# Asynchronous ontology container, with automatic and incremental refresh from disk
 class OntologyContainer:
-    def __init__(self, paths, executor):
+    def __init__(self, paths, executor, snapshot=None, interval=1.0):
         self._paths = list(paths)
         self._executor = executor
+        self._snapshot = snapshot
+        self._interval = interval
+        self._sources = {}
+        self._rejected = None
         self._ontology = None
-        self._last = None
+        self._watcher = None
         self._lock = asyncio.Lock()
     
-    # Get fresh internal data
-    def _get(self):
+    # Use compiled snapshot, if it is more recent than all sources
+    def _open_snapshot(self):
+        if self._snapshot is None or not os.path.exists(self._snapshot):
+            return False
+        snapshot_time = os.stat(self._snapshot).st_mtime_ns
+        signatures = {path : signature(path) for path in self._paths}
+        if any(modified_time > snapshot_time for modified_time, _ in signatures.values()):
+            return False
+        self._sources = {path : Source(signatures[path], None, None) for path in self._paths}
+        self._ontology = Ontology.load(self._snapshot)
+        return True
+    
+    # Reparse modified files, and publish new version
+    def _refresh(self):
         
-        # Check if last access time is still fresh
-        if self._last is not None:
-            for path in self._paths:
-                modified_time = os.path.getmtime(path)
-                if modified_time > self._last:
-                    break
-            else:
-                return self._ontology
+        # On first call, try to avoid parsing
+        if self._ontology is None and self._open_snapshot():
+            return self._ontology
         
-        # Reload data
-        now = datetime.now().timestamp()
-        entries = collections.defaultdict(lambda: collections.defaultdict(list))
+        # Skip files that were rejected during previous refresh, until they are modified again
+        signatures = {path : signature(path) for path in self._paths}
+        if signatures == self._rejected:
+            return self._ontology
+        
+        # Find actually modified files
+        sources = dict(self._sources)
+        changes = []
         for path in self._paths:
-            with io.open(path, 'r', encoding='utf-8') as file:
-                for left, relationship, right in iterate(file):
-                    entries[left][relationship].append(right)
-        self._ontology = Ontology(entries)
-        self._last = now
+            source = sources.get(path)
+            if source is not None and source.signature == signatures[path]:
+                continue
+            current = read(path)
+            sources[path] = current
+            if source is None or source.digest != current.digest:
+                changes.append(path)
+        if len(changes) == 0:
+            self._sources = sources
+            return self._ontology
+        
+        # Patch previous version, if triplets of modified files are known
+        try:
+            if self._ontology is not None and all(self._sources[path].triplets is not None for path in changes):
+                removed = [triplet for path in changes for triplet in self._sources[path].triplets]
+                added = [triplet for path in changes for triplet in sources[path].triplets]
+                ontology = self._ontology.patch(removed, added)
+            
+            # Otherwise, rebuild from scratch
+            else:
+                for path in self._paths:
+                    if sources[path].triplets is None:
+                        sources[path] = read(path)
+                ontology = build(triplet for path in self._paths for triplet in sources[path].triplets)
+        
+        # Keep previous version on failure
+        except Exception:
+            self._rejected = signatures
+            raise
+        
+        # Compile snapshot for other processes, and publish new version
+        if self._snapshot is not None:
+            ontology.save(self._snapshot)
+        self._sources = sources
+        self._ontology = ontology
         return self._ontology
     
-    # Get whole ontology object
-    async def get(self):
+    # Periodically check sources in background
+    async def _watch(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self._interval)
+            try:
+                await loop.run_in_executor(self._executor, self._refresh)
+            except Exception:
+                logger.exception('Failed to refresh ontology')
+    
+    # Load data on first access
+    async def _load(self):
         loop = asyncio.get_event_loop()
         async with self._lock:
-            return await loop.run_in_executor(self._executor, self._get)
+            if self._ontology is None:
+                await loop.run_in_executor(self._executor, self._refresh)
+                self._watcher = asyncio.ensure_future(self._watch())
+        return self._ontology
+    
+    # Stop background refresh
+    def close(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+    
+    # Get whole ontology object (current version is never modified)
+    async def get(self):
+        ontology = self._ontology
+        if ontology is None:
+            ontology = await self._load()
+        return ontology
     
     # Acquire suggestions
     async def suggest(self, query):
@@ -6,3 +6,4 @@ from .confidence import ConfidenceSampler
 from .line import LineSampler
 from .sampler import Sampler
 from .prediction import PredictionSampler
+from .uncertainty import UncertaintySampler
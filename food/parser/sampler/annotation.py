@@ -18,11 +18,13 @@ class AnnotationSampler(Sampler):
     # Get samples from sources
     async def sample(self, count=1):
         samples = await self._sampler.sample(count)
-        annotations = await self._annotations.get()
-        for sample in samples:
-            text = sample['text']
-            annotation = annotations.get(text)
+        annotations = await self._annotations.get([sample['text'] for sample in samples])
+        for sample, annotation in zip(samples, annotations):
             if annotation is not None:
                 annotation = annotation.get('truth')
             sample['annotation'] = annotation
         return samples
+    
+    # Forward new annotations
+    async def update(self, entries):
+        await self._sampler.update(entries)
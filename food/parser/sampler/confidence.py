@@ -20,7 +20,7 @@ class ConfidenceSampler(Sampler):
         
         # If insufficient samples are available, take as much as possible, based on confidence
         if len(oversamples) < overcount:
-            oversamples.sort(key=lambda s: max(s.get('prediction', {}).values()))
+            oversamples.sort(key=lambda s: max(s.get('prediction', {}).values(), default=0.0))
             samples = oversamples[:count]
             random.shuffle(samples)
             return oversamples
@@ -34,9 +34,13 @@ class ConfidenceSampler(Sampler):
             worst_confidence = 999.0
             for b in batch:
                 probabilities = b.get('prediction', {}).values()
-                confidence = max(probabilities)
+                confidence = max(probabilities, default=0.0)
                 if confidence < worst_confidence:
                     worst_sample = b
                     worst_confidence = confidence
             samples.append(worst_sample)
         return samples
+    
+    # Forward new annotations
+    async def update(self, entries):
+        await self._sampler.update(entries)
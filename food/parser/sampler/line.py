@@ -3,50 +3,176 @@
 
 import asyncio
 import io
+import math
+import mmap
+import numpy
 import os
 import random
+import struct
+import threading
 
 from .sampler import Sampler
 
 
-# Generate samples from raw text file
+# Index layout: header (with size and modification time of indexed file), then little-endian 64-bit line offsets
+MAGIC = b'FOLI'
+VERSION = 1
+HEADER = struct.Struct('<4sIQQ')
+
+# Number of bytes scanned at once, when building index
+BLOCK_SIZE = 1 << 24
+
+# Maximum number of lines read for each requested sample, which bounds time spent if most lines are annotated or empty
+SCAN_FACTOR = 16
+
+
+# Get size and modification time of indexed file, to detect changes
+def _signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+# Scan file for line starts, and write them (plus end of file) in index file (atomically replaced)
+def build_index(path, index_path):
+    size, mtime = _signature(path)
+    temporary_path = '%s.%d.tmp' % (index_path, os.getpid())
+    with io.open(path, 'rb') as file, io.open(temporary_path, 'wb') as index:
+        index.write(HEADER.pack(MAGIC, VERSION, size, mtime))
+        index.write(numpy.zeros(1, dtype='<u8').tobytes())
+        position = 0
+        last = b'\n'
+        while True:
+            block = file.read(BLOCK_SIZE)
+            if len(block) == 0:
+                break
+            last = block[-1:]
+            starts = numpy.flatnonzero(numpy.frombuffer(block, dtype=numpy.uint8) == 10).astype('<u8')
+            starts += position + 1
+            position += len(block)
+            index.write(starts.tobytes())
+        
+        # Last line may not be terminated
+        if last != b'\n':
+            index.write(numpy.array([position], dtype='<u8').tobytes())
+    os.replace(temporary_path, index_path)
+
+
+# Map index file, unless it is missing or outdated
+def load_index(path, index_path):
+    try:
+        with io.open(index_path, 'rb') as file:
+            magic, version, size, mtime = HEADER.unpack(file.read(HEADER.size))
+    except (FileNotFoundError, struct.error):
+        return None
+    if magic != MAGIC or version != VERSION or (size, mtime) != _signature(path):
+        return None
+    return numpy.memmap(index_path, dtype='<u8', mode='r', offset=HEADER.size)
+
+
+# Enumerate all integers below given bound exactly once, in random order, using constant memory
+# Note: this is an affine permutation, i.e. multiplier is coprime with bound
+def _permutation(count):
+    if count <= 1:
+        yield from range(count)
+        return
+    while True:
+        multiplier = random.randrange(1, count)
+        if math.gcd(multiplier, count) == 1:
+            break
+    shift = random.randrange(count)
+    for i in range(count):
+        yield (multiplier * i + shift) % count
+
+
+# Generate samples from raw text file, which is memory-mapped and accessed through a persisted line offset index
+# Note: annotated texts are skipped by looking up candidates in dataset, hence annotations of other processes are also considered
+# Note: only a bounded number of lines is read for each call, hence fewer samples may be returned if most lines are annotated
 class LineSampler(Sampler):
-    def __init__(self, path, annotations=None):
-        with io.open(path, 'r', encoding='utf-8') as file:
-            texts = []
-            for line in file:
-                texts.append(line.strip())
-        self._texts = texts
-        self._offset = len(texts)
+    def __init__(self, path, annotations=None, executor=None, index_path=None):
+        self._path = path
         self._annotations = annotations
+        self._executor = executor
+        
+        # Acquire line offsets, building index if needed
+        index_path = index_path or path + '.idx'
+        offsets = load_index(path, index_path)
+        if offsets is None:
+            build_index(path, index_path)
+            offsets = load_index(path, index_path)
+        self._offsets = offsets
+        
+        # Map text, if not empty
+        self._file = io.open(path, 'rb')
+        if len(offsets) > 1:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = b''
+        
+        # Lines are enumerated in random order, and a new order is used for each pass
+        # Note: order is shared by worker threads, hence it is protected by a lock
+        self._order = iter(())
+        self._lock = threading.Lock()
+    
+    # Get number of lines
+    def __len__(self):
+        return len(self._offsets) - 1
+    
+    # Decode given line
+    def _get(self, index):
+        return self._data[int(self._offsets[index]) : int(self._offsets[index + 1])].decode('utf-8', errors='replace').strip()
+    
+    # Read given number of lines, and keep distinct non-empty ones
+    def _scan(self, count):
+        texts = []
+        seen = set()
+        with self._lock:
+            for _ in range(count):
+                
+                # If current pass is exhausted, go through the whole dataset again, in another order
+                index = next(self._order, None)
+                if index is None:
+                    self._order = _permutation(len(self))
+                    index = next(self._order, None)
+                    if index is None:
+                        break
+                
+                # Try to get sample
+                text = self._get(index)
+                if len(text) == 0 or text in seen:
+                    continue
+                seen.add(text)
+                texts.append(text)
+        return texts
     
     # Get samples from sources
     async def sample(self, count=1):
-        texts = set()
-        annotations = await self._annotations.get()
-        reshuffle = False
-        for _ in range(count):
+        loop = asyncio.get_event_loop()
+        texts = []
+        seen = set()
+        budget = count * SCAN_FACTOR
+        while len(texts) < count and budget > 0:
             
-            # If buffer is exhausted
-            if self._offset >= len(self._texts):
-                
-                # Avoid infinite loop
-                if reshuffle:
-                    break
-                
-                # Reshuffle set and go through the whole dataset again
-                self._offset = 0
-                random.shuffle(self._texts)
-                reshuffle = True
+            # Read a few more lines than needed, in a worker thread
+            size = min(budget, 2 * (count - len(texts)))
+            budget -= size
+            candidates = await loop.run_in_executor(self._executor, self._scan, size)
+            if len(candidates) == 0:
+                break
             
-            # Try to get sample
-            text = self._texts[self._offset]
-            self._offset += 1
-            if text in annotations:
-                continue
-            if text in texts:
-                continue
-            texts.add(text)
+            # Discard annotated texts, using a batched lookup
+            if self._annotations is not None:
+                annotations = await self._annotations.get(candidates)
+                candidates = [text for text, annotation in zip(candidates, annotations) if annotation is None]
+            for text in candidates:
+                if text not in seen:
+                    seen.add(text)
+                    texts.append(text)
         
         # Return sample list
-        return [{'text' : text} for text in texts]
+        return [{'text' : text} for text in texts[:count]]
+    
+    # Release file
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
@@ -9,17 +9,23 @@ import random
 from .sampler import Sampler
 
 
-# Add prediction to sample
+# Add prediction to sample, optionally keeping only most probable labels
 class PredictionSampler(Sampler):
-    def __init__(self, sampler, classifier):
+    def __init__(self, sampler, classifier, limit=None, threshold=None):
         self._sampler = sampler
         self._classifier = classifier
+        self._limit = limit
+        self._threshold = threshold
     
     # Get samples from sources
     async def sample(self, count=1):
         samples = await self._sampler.sample(count)
         texts = [sample['text'] for sample in samples]
-        predictions = await self._classifier.classify(texts)
+        predictions = await self._classifier.classify(texts, self._limit, self._threshold)
         for sample, prediction in zip(samples, predictions):
             sample['prediction'] = prediction
         return samples
+    
+    # Forward new annotations
+    async def update(self, entries):
+        await self._sampler.update(entries)
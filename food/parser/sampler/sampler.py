@@ -10,3 +10,7 @@ class Sampler:
     # Acquire samples
     async def sample(self, count=1):
         raise NotImplementedError()
+    
+    # Notify about new annotations
+    async def update(self, entries):
+        pass
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncio
+import heapq
+import io
+import json
+import logging
+import math
+import os
+
+from .sampler import Sampler
+
+
+logger = logging.getLogger(__name__)
+
+
+# Number of texts kept in queue
+CAPACITY = 10000
+
+# Number of texts scored at once
+BATCH_SIZE = 1024
+
+# Delay between checks for new model version, in seconds
+POLL_INTERVAL = 5.0
+
+# Minimal delay between two complete scorings of queue, in seconds, as online models change on each annotation
+RESCORE_INTERVAL = 60.0
+
+# Minimal delay between two saves of queue, in seconds
+SAVE_INTERVAL = 30.0
+
+
+# Uncertainty is one minus probability of best label
+def least_confidence(probabilities):
+    return 1.0 - (probabilities[0] if len(probabilities) > 0 else 0.0)
+
+
+# Uncertainty is one minus difference between two best labels
+def smallest_margin(probabilities):
+    probabilities = probabilities + [0.0, 0.0]
+    return 1.0 - (probabilities[0] - probabilities[1])
+
+
+# Uncertainty is entropy, where mass of discarded labels is considered as an additional label
+def largest_entropy(probabilities):
+    residual = max(1.0 - sum(probabilities), 0.0)
+    return -sum(p * math.log(p) for p in probabilities + [residual] if p > 0.0)
+
+
+# Available uncertainty measures, using probabilities sorted by decreasing order
+STRATEGIES = {
+    'confidence' : least_confidence,
+    'margin' : smallest_margin,
+    'entropy' : largest_entropy
+}
+
+
+# Pick most uncertain samples from a queue, which is maintained in background
+# Note: queued texts are scored again when model changes (at most once per interval), and new texts are scored to keep queue full
+# Note: queue is saved from time to time if it changed, and saved predictions are used until they are scored again by current model
+class UncertaintySampler(Sampler):
+    def __init__(self, sampler, classifier, path=None, executor=None, strategy='confidence', limit=None, threshold=None, capacity=CAPACITY, batch_size=BATCH_SIZE):
+        self._sampler = sampler
+        self._classifier = classifier
+        self._path = path
+        self._executor = executor
+        self._measure = STRATEGIES[strategy]
+        self._limit = limit
+        self._threshold = threshold
+        self._capacity = capacity
+        self._batch_size = batch_size
+        
+        # Queue is a heap of (negated uncertainty, text), where entries that are no longer valid are skipped lazily
+        self._heap = []
+        self._entries = {}
+        self._version = None
+        self._rescored = None
+        self._saved = None
+        self._dirty = False
+        if self._path is not None and os.path.exists(self._path):
+            with io.open(self._path, 'r', encoding='utf-8') as file:
+                for text, prediction in json.load(file):
+                    self._push(text, prediction)
+            self._dirty = False
+        
+        # Background job is started on first use
+        self._wakeup = None
+        self._task = None
+    
+    # Get queue length
+    def __len__(self):
+        return len(self._entries)
+    
+    # Add or replace entry
+    def _push(self, text, prediction):
+        uncertainty = self._measure(sorted(prediction.values(), reverse=True))
+        self._entries[text] = (uncertainty, prediction)
+        self._dirty = True
+        heapq.heappush(self._heap, (-uncertainty, text))
+        
+        # Discard invalid entries, if they occupy most of the heap
+        if len(self._heap) > 2 * len(self._entries) + self._batch_size:
+            self._heap = [(-uncertainty, text) for text, (uncertainty, _) in self._entries.items()]
+            heapq.heapify(self._heap)
+    
+    # Remove most uncertain entry
+    def _pop(self):
+        while len(self._heap) > 0:
+            negated_uncertainty, text = heapq.heappop(self._heap)
+            entry = self._entries.get(text)
+            if entry is not None and entry[0] == -negated_uncertainty:
+                del self._entries[text]
+                self._dirty = True
+                return text, entry[1]
+        return None
+    
+    # Make sure background job is running, and notify it
+    def _notify(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+        self._wakeup.set()
+    
+    # Classify texts in batches
+    async def _classify(self, texts):
+        predictions = []
+        for start in range(0, len(texts), self._batch_size):
+            predictions.extend(await self._classifier.classify(texts[start : start + self._batch_size], self._limit, self._threshold))
+        return predictions
+    
+    # Score queued texts using current model
+    async def _rescore(self):
+        texts = list(self._entries.keys())
+        for start in range(0, len(texts), self._batch_size):
+            batch = texts[start : start + self._batch_size]
+            predictions = await self._classifier.classify(batch, self._limit, self._threshold)
+            
+            # Texts may have been sampled or annotated meanwhile
+            for text, prediction in zip(batch, predictions):
+                if text in self._entries:
+                    self._push(text, prediction)
+    
+    # Score new texts, until queue is full or source is exhausted
+    async def _refill(self):
+        while len(self._entries) < self._capacity:
+            samples = await self._sampler.sample(min(self._capacity - len(self._entries), self._batch_size))
+            texts = [sample['text'] for sample in samples if sample['text'] not in self._entries]
+            if len(texts) == 0:
+                break
+            predictions = await self._classifier.classify(texts, self._limit, self._threshold)
+            for text, prediction in zip(texts, predictions):
+                self._push(text, prediction)
+    
+    # Write queue content (atomically replaced)
+    def _save(self, entries):
+        temporary_path = '%s.%d.tmp' % (self._path, os.getpid())
+        with io.open(temporary_path, 'w', encoding='utf-8', newline='\n') as file:
+            json.dump(entries, file, ensure_ascii=False)
+        os.replace(temporary_path, self._path)
+    
+    # Keep queue up-to-date, until cancelled
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                self._wakeup.clear()
+                
+                # Score queued texts again if model has changed, unless it was done recently
+                version = self._classifier.get_version()
+                if version != self._version and (self._rescored is None or loop.time() >= self._rescored + RESCORE_INTERVAL):
+                    await self._rescore()
+                    self._version = version
+                    self._rescored = loop.time()
+                
+                # Replace sampled and annotated texts
+                await self._refill()
+                
+                # Save state, unless it did not change or was saved recently
+                if self._path is not None and self._dirty and (self._saved is None or loop.time() >= self._saved + SAVE_INTERVAL):
+                    entries = [[text, prediction] for text, (_, prediction) in self._entries.items()]
+                    self._dirty = False
+                    self._saved = loop.time()
+                    await loop.run_in_executor(self._executor, self._save, entries)
+            except asyncio.CancelledError:
+                raise
+            except:
+                logger.exception('Failed to update uncertainty queue')
+            
+            # Wait for new samples or annotations, or check model version from time to time
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    
+    # Get most uncertain samples, scoring new texts directly if queue is too short
+    async def sample(self, count=1):
+        samples = []
+        while len(samples) < count:
+            entry = self._pop()
+            if entry is None:
+                break
+            text, prediction = entry
+            samples.append({'text' : text, 'prediction' : prediction})
+        if len(samples) < count:
+            others = await self._sampler.sample(count - len(samples))
+            texts = [sample['text'] for sample in others]
+            for text, prediction in zip(texts, await self._classify(texts)):
+                samples.append({'text' : text, 'prediction' : prediction})
+        self._notify()
+        return samples
+    
+    # Remove annotated texts from queue, and forward new annotations
+    async def update(self, entries):
+        for entry in entries:
+            if self._entries.pop(entry['key'], None) is not None:
+                self._dirty = True
+        await self._sampler.update(entries)
+        self._notify()
+    
+    # Stop background job
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+
+import array
+import bisect
+import collections.abc
+import io
+import mmap
+import os
+import struct
+import sys
+
+
+# File layout: header, then unsigned 32-bit arrays, then UTF-8 string blob
+MAGIC = b'FOOS'
+VERSION = 1
+HEADER = struct.Struct('<4sIIIIII')
+
+
+# Convert unsigned integers to little-endian bytes
+def _pack(values):
+    values = array.array('I', values)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values.tobytes()
+
+
+# Acquire unsigned integer view on buffer, without copy if possible
+def _unpack(buffer):
+    if sys.byteorder == 'little':
+        return buffer.cast('I')
+    values = array.array('I', buffer.tobytes())
+    values.byteswap()
+    return values
+
+
+# Compile ontology dictionaries as binary snapshot (atomically replaced)
+def write(path, attributes, ascendants, descendants):
+    
+    # Intern identifiers first, in sorted order to allow binary search
+    identifiers = sorted(attributes.keys())
+    strings = {id : index for index, id in enumerate(identifiers)}
+    def intern(text):
+        index = strings.get(text)
+        if index is None:
+            index = strings[text] = len(strings)
+        return index
+    
+    # Flatten relationships as compressed sparse rows
+    def flatten(table, resolve):
+        offsets = [0]
+        pairs = []
+        for id in identifiers:
+            for key, values in table[id].items():
+                for value in values:
+                    pairs.append(intern(key))
+                    pairs.append(resolve(value))
+            offsets.append(len(pairs) // 2)
+        return offsets, pairs
+    attribute_offsets, attribute_pairs = flatten(attributes, intern)
+    ascendant_offsets, ascendant_pairs = flatten(ascendants, strings.__getitem__)
+    descendant_offsets, descendant_pairs = flatten(descendants, strings.__getitem__)
+    
+    # Build string table
+    blob = io.BytesIO()
+    string_offsets = [0]
+    for text in strings:
+        blob.write(text.encode('utf-8'))
+        string_offsets.append(blob.tell())
+    
+    # Write to temporary file, and then replace previous snapshot
+    header = HEADER.pack(
+        MAGIC,
+        VERSION,
+        len(identifiers),
+        len(strings),
+        len(attribute_pairs) // 2,
+        len(ascendant_pairs) // 2,
+        len(descendant_pairs) // 2
+    )
+    temporary_path = '%s.%d.tmp' % (path, os.getpid())
+    with io.open(temporary_path, 'wb') as file:
+        file.write(header)
+        for values in [
+            string_offsets,
+            attribute_offsets,
+            attribute_pairs,
+            ascendant_offsets,
+            ascendant_pairs,
+            descendant_offsets,
+            descendant_pairs
+        ]:
+            file.write(_pack(values))
+        file.write(blob.getvalue())
+    os.replace(temporary_path, path)
+
+
+# Read-only string sequence over blob
+class _Strings(collections.abc.Sequence):
+    def __init__(self, offsets, blob, count):
+        self._offsets = offsets
+        self._blob = blob
+        self._count = count
+    
+    def __len__(self):
+        return self._count
+    
+    def __getitem__(self, index):
+        if index < 0 or index >= self._count:
+            raise IndexError(index)
+        return str(self._blob[self._offsets[index] : self._offsets[index + 1]], 'utf-8')
+
+
+# Lazy identifier-to-relationships mapping, decoded on access
+class _Table(collections.abc.Mapping):
+    def __init__(self, snapshot, offsets, pairs, resolve):
+        self._snapshot = snapshot
+        self._offsets = offsets
+        self._pairs = pairs
+        self._resolve = resolve
+    
+    def __len__(self):
+        return len(self._snapshot.identifiers)
+    
+    def __iter__(self):
+        return iter(self._snapshot.identifiers)
+    
+    def __contains__(self, identifier):
+        return self._snapshot.find(identifier) is not None
+    
+    def __getitem__(self, identifier):
+        index = self._snapshot.find(identifier)
+        if index is None:
+            raise KeyError(identifier)
+        relationships = {}
+        for i in range(self._offsets[index] * 2, self._offsets[index + 1] * 2, 2):
+            key = self._snapshot.strings[self._pairs[i]]
+            value = self._resolve(self._pairs[i + 1])
+            relationships.setdefault(key, []).append(value)
+        return relationships
+
+
+# Memory-mapped ontology snapshot
+class Snapshot:
+    def __init__(self, path):
+        with io.open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        
+        # Check header
+        magic, version, identifier_count, string_count, attribute_count, ascendant_count, descendant_count = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise IOError('Invalid ontology snapshot %s' % path)
+        
+        # Locate arrays
+        offset = HEADER.size
+        def take(count):
+            nonlocal offset
+            values = _unpack(view[offset : offset + count * 4])
+            offset += count * 4
+            return values
+        string_offsets = take(string_count + 1)
+        attribute_offsets = take(identifier_count + 1)
+        attribute_pairs = take(attribute_count * 2)
+        ascendant_offsets = take(identifier_count + 1)
+        ascendant_pairs = take(ascendant_count * 2)
+        descendant_offsets = take(identifier_count + 1)
+        descendant_pairs = take(descendant_count * 2)
+        blob = view[offset:]
+        
+        # Expose strings and relationships
+        self.strings = _Strings(string_offsets, blob, string_count)
+        self.identifiers = _Strings(string_offsets, blob, identifier_count)
+        self.attributes = _Table(self, attribute_offsets, attribute_pairs, self.strings.__getitem__)
+        self.ascendants = _Table(self, ascendant_offsets, ascendant_pairs, self.identifiers.__getitem__)
+        self.descendants = _Table(self, descendant_offsets, descendant_pairs, self.identifiers.__getitem__)
+    
+    # Get identifier index, using binary search
+    def find(self, identifier):
+        index = bisect.bisect_left(self.identifiers, identifier)
+        if index < len(self.identifiers) and self.identifiers[index] == identifier:
+            return index
+        return None
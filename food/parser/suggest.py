@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+
+import array
+import bisect
+import collections
+import unicodedata
+
+
+# Character n-gram size
+GRAM = 3
+
+# Number of candidates considered for ranking
+PREFIX_CANDIDATES = 256
+FUZZY_CANDIDATES = 24
+
+# Maximum number of postings scanned for n-gram overlap
+POSTINGS_BUDGET = 16384
+
+
+# Simplify text for matching (lowercase, no accent, words separated by single spaces)
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(char if char.isalnum() else ' ' for char in text if not unicodedata.combining(char))
+    return ' '.join(text.split())
+
+
+# Get character n-grams, where word boundaries are marked by spaces
+def grams(text):
+    return {text[i : i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+# Get character bitmasks of query, used by bit-parallel edit distance
+def masks(query):
+    result = collections.defaultdict(int)
+    for i, char in enumerate(query):
+        result[char] |= 1 << i
+    return dict(result)
+
+
+# Smallest edit distance between query and any prefix of text, using bit-parallel algorithm
+# Note: see Hyyrö, "Explaining and extending the bit-parallel approximate string matching algorithm of Myers", 2001
+def prefix_distance(query, query_masks, text, bound):
+    length = len(query)
+    full = (1 << length) - 1
+    high = 1 << (length - 1)
+    positive = full
+    negative = 0
+    score = best = length
+    for char in text[:length + bound]:
+        equal = query_masks.get(char, 0)
+        vertical = equal | negative
+        horizontal = (((equal & positive) + positive) ^ positive) | equal
+        horizontal_positive = negative | ~(horizontal | positive)
+        horizontal_negative = positive & horizontal
+        if horizontal_positive & high:
+            score += 1
+        elif horizontal_negative & high:
+            score -= 1
+        horizontal_positive = ((horizontal_positive << 1) | 1) & full
+        horizontal_negative = (horizontal_negative << 1) & full
+        positive = (horizontal_negative | ~(vertical | horizontal_positive)) & full
+        negative = horizontal_positive & vertical
+        if score < best:
+            best = score
+    return best
+
+
+# Prebuilt fuzzy search over identifiers and labels
+class SuggestionIndex:
+    def __init__(self, ontology):
+        
+        # Collect normalized terms for each identifier
+        postings = collections.defaultdict(list)
+        for id in ontology.get_identifiers():
+            postings[normalize(id)].append(id)
+            for label in ontology._attributes[id].get('label', []):
+                postings[normalize(label)].append(id)
+        postings.pop('', None)
+        self._terms = sorted(postings)
+        self._identifiers = [postings[term] for term in self._terms]
+        
+        # Sort word-aligned suffixes, to find prefix matches using binary search
+        suffixes = []
+        for position, term in enumerate(self._terms):
+            start = 0
+            while True:
+                suffixes.append((term[start:], position))
+                start = term.find(' ', start) + 1
+                if start == 0:
+                    break
+        suffixes.sort()
+        self._suffixes = [suffix for suffix, _ in suffixes]
+        self._owners = array.array('I', (position for _, position in suffixes))
+        
+        # Build n-gram inverted index
+        index = collections.defaultdict(lambda: array.array('I'))
+        for position, term in enumerate(self._terms):
+            for gram in grams(' %s ' % term):
+                index[gram].append(position)
+        self._index = dict(index)
+    
+    # Find terms having a word starting with query
+    def _prefix(self, query):
+        positions = {}
+        start = bisect.bisect_left(self._suffixes, query)
+        for index in range(start, min(start + PREFIX_CANDIDATES, len(self._suffixes))):
+            if not self._suffixes[index].startswith(query):
+                break
+            positions[self._owners[index]] = None
+        return positions
+    
+    # Find terms sharing most n-grams with query, using rarest n-grams first until budget is exhausted
+    def _overlap(self, query):
+        counts = collections.Counter()
+        budget = POSTINGS_BUDGET
+        postings = sorted((self._index.get(gram, ()) for gram in grams(' %s' % query)), key=len)
+        for positions in postings:
+            if budget < len(positions) and len(counts) > 0:
+                break
+            counts.update(positions)
+            budget -= len(positions)
+        return counts.most_common(FUZZY_CANDIDATES)
+    
+    # Distance between query and any word-aligned suffix of term
+    def _distance(self, query, query_masks, term, bound):
+        best = bound + 1
+        start = 0
+        while True:
+            best = min(best, prefix_distance(query, query_masks, term[start:], bound))
+            start = term.find(' ', start) + 1
+            if start == 0 or best == 0:
+                return best
+    
+    # Get best matching identifiers, ranked by edit distance, n-gram overlap and length
+    def search(self, query, count=16):
+        query = normalize(query)
+        if len(query) == 0:
+            return []
+        
+        # Exact word prefixes come first, shortest terms first
+        prefixes = self._prefix(query)
+        ranking = [(0, 0, len(self._terms[position]), position) for position in prefixes]
+        
+        # If needed, add fuzzy matches using bounded edit distance (more distant ones being ranked only by n-gram overlap)
+        if sum(len(self._identifiers[position]) for position in prefixes) < count:
+            bound = len(query) // 4
+            query_masks = masks(query)
+            for position, overlap in self._overlap(query):
+                if position not in prefixes:
+                    term = self._terms[position]
+                    distance = self._distance(query, query_masks, term, bound) if bound > 0 else 1
+                    ranking.append((distance, -overlap, len(term), position))
+        ranking.sort()
+        
+        # Keep first occurrence of each identifier
+        results = []
+        visited = set()
+        for _, _, _, position in ranking:
+            for id in self._identifiers[position]:
+                if id not in visited:
+                    visited.add(id)
+                    results.append(id)
+                    if len(results) >= count:
+                        return results
+        return results
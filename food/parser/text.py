@@ -3,7 +3,10 @@
 
 import collections
 import hunspell
+import io
+import itertools
 import numpy
+import os
 import regex
 import scipy.sparse
 import unidecode
@@ -44,11 +47,61 @@ def latinize(text):
 english_hunspell = hunspell.Hunspell()
 
 
+# Simplify single lowercase word
+def lemmatize_uncached(word):
+    token = word if word.isascii() else latinize(word)
+    lemmas = english_hunspell.stem(token)
+    return lemmas[0] if len(lemmas) > 0 else token
+
+
+# Word-level cache, as vocabulary is small compared to token count
+MAXIMUM_LEMMAS = 100000
+lemma_cache = {}
+
+# Simplify single lowercase word, using cache
+def lemmatize(word):
+    lemma = lemma_cache.get(word)
+    if lemma is None:
+        lemma = lemmatize_uncached(word)
+        if len(lemma_cache) >= MAXIMUM_LEMMAS:
+            lemma_cache.clear()
+        lemma_cache[word] = lemma
+    return lemma
+
+# Preload cache from tab-separated file
+def load_lemmas(path):
+    with io.open(path, 'r', encoding='utf-8', newline='\n') as file:
+        for line in file:
+            word, lemma = line.rstrip('\n').split('\t')
+            lemma_cache[word] = lemma
+
+# Save cache as tab-separated file (atomically replaced)
+def save_lemmas(path):
+    temporary_path = '%s.%d.tmp' % (path, os.getpid())
+    with io.open(temporary_path, 'w', encoding='utf-8', newline='\n') as file:
+        for word, lemma in list(lemma_cache.items()):
+            file.write('%s\t%s\n' % (word, lemma))
+    os.replace(temporary_path, path)
+
+# Get lemmas cached after given number of entries (or whole cache, if it was cleared meanwhile)
+def get_lemmas(start=0):
+    if len(lemma_cache) < start:
+        start = 0
+    return dict(itertools.islice(list(lemma_cache.items()), start, None))
+
+# Add lemmas computed elsewhere (e.g. in worker process) to cache
+def add_lemmas(lemmas):
+    if len(lemma_cache) + len(lemmas) > MAXIMUM_LEMMAS:
+        lemma_cache.clear()
+    lemma_cache.update(lemmas)
+
+
 # Tokenization regex
 token_regex = regex.compile(r'\s*(?:(\p{L}+)|.)', regex.UNICODE)
 
 # Tokenize and simplify text
-def tokenize(text):
+def tokenize(text, cached=True):
+    simplify = lemmatize if cached else lemmatize_uncached
     tokens = []
     index = 0
     while True:
@@ -58,8 +111,4 @@ def tokenize(text):
         index = match.end(0)
         word = match.group(1)
         if word is not None:
-            token = word.lower()
-            token = latinize(token)
-            lemmas = english_hunspell.stem(token)
-            lemma = lemmas[0] if len(lemmas) > 0 else token
-            tokens.append(lemma)
+            tokens.append(simplify(word.lower()))
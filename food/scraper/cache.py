@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 
 
+import bz2
+import io
 import logging
+import lzma
 import os
 import pickle
 import scrapy
@@ -9,77 +12,192 @@ from scrapy.http import Headers, Response
 from scrapy.responsetypes import responsetypes
 from scrapy.utils.project import data_path
 from scrapy.utils.request import request_fingerprint
+import struct
 from time import time
 import threading
 from w3lib.http import headers_raw_to_dict, headers_dict_to_raw
 import zipfile
+import zlib
 
 
 # Basic logger instance
 logger = logging.getLogger(__name__)
 
 
+# Serialize request and response
+def create_dump(request, response):
+    return {
+        'url': request.url,
+        'method': request.method,
+        'status': response.status,
+        'response_url': response.url,
+        'timestamp': time(),
+        'response_headers' : headers_dict_to_raw(response.headers),
+        'response_body' : response.body,
+        'request_headers' : headers_dict_to_raw(request.headers),
+        'request_body' : request.body
+    }
+
+
+# Rebuild response from serialized content
+def create_response(dump):
+    body = dump['response_body']
+    headers = Headers(headers_raw_to_dict(dump['response_headers']))
+    url = dump.get('response_url')
+    status = dump['status']
+    respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+    return respcls(url=url, headers=headers, status=status, body=body)
+
+
+# Local file header layout (i.e. only name and extra field lengths), where member data follows name and extra field
+LOCAL_HEADER = struct.Struct('<26xHH')
+
+# Fingerprint index file name, in spider folder
+INDEX = 'index.pkl'
+
+
+# Get size and modification time of archive, to detect changes
+def _signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+# Locate data of member, as (offset, length, compression method)
+def _locate(file, info):
+    file.seek(info.header_offset)
+    name_length, extra_length = LOCAL_HEADER.unpack(file.read(LOCAL_HEADER.size))
+    offset = info.header_offset + LOCAL_HEADER.size + name_length + extra_length
+    return offset, info.compress_size, info.compress_type
+
+
+# Decompress member data, using public decompressors
+def _decompress(method, data):
+    if method == zipfile.ZIP_STORED:
+        return data
+    if method == zipfile.ZIP_DEFLATED:
+        return zlib.decompress(data, -zlib.MAX_WBITS)
+    if method == zipfile.ZIP_BZIP2:
+        return bz2.decompress(data)
+    
+    # LZMA data starts with version, properties size and LZMA1 properties (i.e. packed lc, lp and pb, then dictionary size)
+    if method == zipfile.ZIP_LZMA:
+        size, = struct.unpack_from('<H', data, 2)
+        properties = data[4 : 4 + size]
+        pb, remainder = divmod(properties[0], 45)
+        lp, lc = divmod(remainder, 9)
+        dict_size, = struct.unpack_from('<I', properties, 1)
+        decompressor = lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=[{
+            'id' : lzma.FILTER_LZMA1,
+            'dict_size' : dict_size,
+            'lc' : lc,
+            'lp' : lp,
+            'pb' : pb
+        }])
+        return decompressor.decompress(data[4 + size:])
+    raise ValueError('Unsupported compression method %d' % method)
+
+
+# Locate data of each member of archive
+# Note: when a fingerprint was stored several times, last member is used, as done by zipfile
+def read_locations(path):
+    locations = {}
+    with io.open(path, 'rb') as file, zipfile.ZipFile(file, 'r') as archive:
+        for info in archive.infolist():
+            locations[info.filename] = _locate(file, info)
+    return locations
+
+
 # Custom file storage, more compact than vanilla implementation (slower, though)
+# Note: fingerprints are indexed in memory, hence lookups do not parse archive directories, and misses do not access disk
+# Note: index is saved on close, and only archives that were modified meanwhile (e.g. by another process) are parsed again on open
 class CacheStorage:
     def __init__(self, settings):
         self._folder = data_path(settings['HTTPCACHE_DIR'])
         self._lock = threading.Lock()
+        self._indices = {}
+        self._signatures = {}
+        self._files = {}
     
-    # Nothing to do on open
+    # Load fingerprint index, updating entries of modified archives
     def open_spider(self, spider):
-        pass
-
-    # Nothing to do on close
+        folder = os.path.join(self._folder, spider.name)
+        index = {}
+        signatures = {}
+        saved_index = {}
+        saved_signatures = {}
+        path = os.path.join(folder, INDEX)
+        if os.path.exists(path):
+            with io.open(path, 'rb') as file:
+                saved_signatures, saved_index = pickle.load(file)
+        
+        # Each archive is either still valid, or parsed again
+        if os.path.exists(folder):
+            for name in sorted(os.listdir(folder)):
+                if not name.endswith('.zip'):
+                    continue
+                shard = name[:-4]
+                signature = _signature(os.path.join(folder, name))
+                if saved_signatures.get(shard) == signature:
+                    locations = saved_index[shard]
+                else:
+                    logger.debug('Indexing %s' % os.path.join(folder, name))
+                    locations = read_locations(os.path.join(folder, name))
+                index[shard] = locations
+                signatures[shard] = signature
+        self._indices[spider.name] = index
+        self._signatures[spider.name] = signatures
+    
+    # Save fingerprint index (atomically replaced), and release archives
     def close_spider(self, spider):
-        pass
+        with self._lock:
+            index = self._indices.pop(spider.name)
+            signatures = self._signatures.pop(spider.name)
+            for key in [key for key in self._files if key[0] == spider.name]:
+                self._files.pop(key).close()
+        folder = os.path.join(self._folder, spider.name)
+        if len(index) > 0:
+            path = os.path.join(folder, INDEX)
+            temporary_path = '%s.%d.tmp' % (path, os.getpid())
+            with io.open(temporary_path, 'wb') as file:
+                pickle.dump((signatures, index), file, pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, path)
+    
+    # Get archive opened for reading
+    def _open(self, name, shard):
+        file = self._files.get((name, shard))
+        if file is None:
+            with self._lock:
+                file = self._files.get((name, shard))
+                if file is None:
+                    file = self._files[name, shard] = io.open(os.path.join(self._folder, name, '%s.zip' % shard), 'rb')
+        return file
     
     # Acquire data
     def retrieve_response(self, spider, request):
-        with self._lock:
         
-            # Find archive, if any
-            id = request_fingerprint(request)
-            path = os.path.join(self._folder, spider.name, '%s.zip' % id[:2])
-            if not os.path.exists(path):
-                logger.debug('Cache miss: %s %s (%s)' % (request.method, request.url, id))
-                return
-            
-            # Acquire data
-            with zipfile.ZipFile(path, 'r') as archive:
-                try:
-                    info = archive.getinfo(id)
-                except KeyError:
-                    logger.debug('Cache miss: %s %s (%s)' % (request.method, request.url, id))
-                    return
-                logger.debug('Cache hit: %s %s (%s)' % (request.method, request.url, id))
-                with archive.open(info, 'r') as file:
-                    dump = pickle.load(file)
-            
-            # Create response
-            body = dump['response_body']
-            headers = Headers(headers_raw_to_dict(dump['response_headers']))
-            url = dump.get('response_url')
-            status = dump['status']
-            respcls = responsetypes.from_args(headers=headers, url=url)
-            response = respcls(url=url, headers=headers, status=status, body=body)
-            return response
+        # Find member, if any
+        id = request_fingerprint(request)
+        shard = id[:2]
+        location = self._indices[spider.name].get(shard, {}).get(id)
+        if location is None:
+            logger.debug('Cache miss: %s %s (%s)' % (request.method, request.url, id))
+            return
+        logger.debug('Cache hit: %s %s (%s)' % (request.method, request.url, id))
+        
+        # Acquire data, using a single read
+        offset, length, method = location
+        data = os.pread(self._open(spider.name, shard).fileno(), length, offset)
+        dump = pickle.loads(_decompress(method, data))
+        
+        # Create response
+        return create_response(dump)
     
     # Store data
     def store_response(self, spider, request, response):
         with self._lock:
             
             # Create dump
-            dump = {
-                'url': request.url,
-                'method': request.method,
-                'status': response.status,
-                'response_url': response.url,
-                'timestamp': time(),
-                'response_headers' : headers_dict_to_raw(response.headers),
-                'response_body' : response.body,
-                'request_headers' : headers_dict_to_raw(request.headers),
-                'request_body' : request.body
-            }
+            dump = create_dump(request, response)
             
             # Find archive folder
             id = request_fingerprint(request)
@@ -89,7 +207,14 @@ class CacheStorage:
                 os.makedirs(folder)
             
             # Update archive
-            path = os.path.join(folder, '%s.zip' % id[:2])
+            shard = id[:2]
+            path = os.path.join(folder, '%s.zip' % shard)
             with zipfile.ZipFile(path, 'a', compression=zipfile.ZIP_LZMA) as archive:
                 with archive.open(id, 'w') as file:
                     pickle.dump(dump, file)
+                info = archive.getinfo(id)
+            
+            # Index new member
+            with io.open(path, 'rb') as file:
+                self._indices[spider.name].setdefault(shard, {})[id] = _locate(file, info)
+            self._signatures[spider.name][shard] = _signature(path)
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+
+import gzip
+import io
+import json
+import logging
+import os
+import time
+
+
+# Basic logger instance
+logger = logging.getLogger(__name__)
+
+
+# Manifest file name, in feed folder
+MANIFEST = 'manifest.json'
+FORMAT = 1
+
+# Maximum number of items and uncompressed bytes in each shard
+SHARD_ITEMS = 10000
+SHARD_BYTES = 64 * 1024 * 1024
+
+# File extension of each compression scheme
+EXTENSIONS = {
+    'none' : '.jsonl',
+    'gzip' : '.jsonl.gz',
+    'zstd' : '.jsonl.zst'
+}
+
+# Delay between manifest checks, when following a feed that is still written
+FOLLOW_INTERVAL = 10.0
+
+# Delay between manifest updates while writing, and age after which an incomplete feed is considered abandoned (e.g. after a crash)
+HEARTBEAT_INTERVAL = 60.0
+FOLLOW_TIMEOUT = 3600.0
+
+
+# Open text file, with optional compression
+# Note: zstd compression requires zstandard package
+def _open(path, mode, compression):
+    if compression == 'none':
+        return io.open(path, mode + 't', encoding='utf-8', newline='\n')
+    if compression == 'gzip':
+        return gzip.open(path, mode + 't', encoding='utf-8', newline='\n')
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.open(path, mode + 't', encoding='utf-8', newline='\n')
+    raise ValueError('Unsupported compression %s' % compression)
+
+
+# Get compression scheme from file name
+def _get_compression(name):
+    for compression, extension in EXTENSIONS.items():
+        if compression != 'none' and name.endswith(extension):
+            return compression
+    return 'none'
+
+
+# Read manifest, if any
+def load_manifest(folder):
+    path = os.path.join(folder, MANIFEST)
+    if not os.path.exists(path):
+        return {'format' : FORMAT, 'complete' : False, 'shards' : []}
+    with io.open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+# Write manifest (atomically replaced)
+def save_manifest(folder, manifest):
+    path = os.path.join(folder, MANIFEST)
+    temporary_path = '%s.%d.tmp' % (path, os.getpid())
+    with io.open(temporary_path, 'w', encoding='utf-8', newline='\n') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(temporary_path, path)
+
+
+# Write items as compressed JSON lines, rotated into bounded shards listed in a manifest
+# Note: shards are only listed once complete, hence readers never see partial shards (even after a crash)
+# Note: by default, shards are added to those of previous runs, otherwise previous shards are removed
+# Note: manifest is also saved from time to time while writing, so that readers can detect abandoned feeds
+class FeedWriter:
+    def __init__(self, folder, compression='gzip', max_items=SHARD_ITEMS, max_bytes=SHARD_BYTES, append=True):
+        if compression not in EXTENSIONS:
+            raise ValueError('Unsupported compression %s' % compression)
+        os.makedirs(folder, exist_ok=True)
+        self._folder = folder
+        self._compression = compression
+        self._max_items = max_items
+        self._max_bytes = max_bytes
+        self._manifest = load_manifest(folder)
+        if not append:
+            for shard in self._manifest['shards']:
+                path = os.path.join(folder, shard['name'])
+                if os.path.exists(path):
+                    os.remove(path)
+            self._manifest['shards'] = []
+        self._manifest['complete'] = False
+        self._file = None
+        self._save()
+    
+    # Write manifest, with time of last update
+    def _save(self):
+        self._manifest['updated'] = time.time()
+        save_manifest(self._folder, self._manifest)
+    
+    # Start new shard, numbered after existing ones
+    def _open(self):
+        index = len(self._manifest['shards'])
+        self._name = 'part-%05d%s' % (index, EXTENSIONS[self._compression])
+        self._temporary_path = os.path.join(self._folder, self._name + '.tmp')
+        self._file = _open(self._temporary_path, 'w', self._compression)
+        self._items = 0
+        self._bytes = 0
+    
+    # Finish current shard, and publish it
+    def _close(self):
+        self._file.close()
+        self._file = None
+        os.replace(self._temporary_path, os.path.join(self._folder, self._name))
+        self._manifest['shards'].append({
+            'name' : self._name,
+            'items' : self._items,
+            'bytes' : self._bytes,
+            'created' : time.time()
+        })
+        self._save()
+    
+    # Add item, rotating shard if needed
+    def write(self, item):
+        if self._file is None:
+            self._open()
+        line = json.dumps(item, ensure_ascii=False) + '\n'
+        self._file.write(line)
+        self._items += 1
+        self._bytes += len(line.encode('utf-8'))
+        if self._items >= self._max_items or self._bytes >= self._max_bytes:
+            self._close()
+        elif time.time() >= self._manifest['updated'] + HEARTBEAT_INTERVAL:
+            self._save()
+    
+    # Publish last shard, and mark feed as complete
+    def close(self):
+        if self._file is not None:
+            self._close()
+        self._manifest['complete'] = True
+        self._save()
+
+
+# Enumerate items of published shards, optionally waiting for new shards until feed is complete
+# Note: waiting stops if writer has not updated manifest for given timeout
+def read_feed(folder, follow=False, interval=FOLLOW_INTERVAL, timeout=FOLLOW_TIMEOUT):
+    count = 0
+    while True:
+        manifest = load_manifest(folder)
+        for shard in manifest['shards'][count:]:
+            with _open(os.path.join(folder, shard['name']), 'r', _get_compression(shard['name'])) as file:
+                for line in file:
+                    yield json.loads(line)
+            count += 1
+        if not follow or manifest['complete']:
+            break
+        if time.time() > manifest.get('updated', 0.0) + timeout:
+            logger.warning('Feed %s was not updated for %.0fs, assuming it was abandoned' % (folder, timeout))
+            break
+        time.sleep(interval)
+
+
+# Enumerate ingredient lines of recipes
+def read_ingredients(folder, follow=False):
+    for item in read_feed(folder, follow):
+        yield from item.get('ingredients') or []
+
+
+# Item pipeline, exporting items of each spider in its own feed folder
+# Note: cached pages are served again on each crawl, hence each crawl replaces previous feed instead of adding duplicated items
+class FeedPipeline:
+    def __init__(self, folder, compression='gzip', max_items=SHARD_ITEMS, max_bytes=SHARD_BYTES):
+        self._folder = folder
+        self._compression = compression
+        self._max_items = max_items
+        self._max_bytes = max_bytes
+        self._writers = {}
+    
+    # Acquire options from settings
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            settings.get('FEED_FOLDER'),
+            settings.get('FEED_COMPRESSION', 'gzip'),
+            settings.getint('FEED_SHARD_ITEMS', SHARD_ITEMS),
+            settings.getint('FEED_SHARD_BYTES', SHARD_BYTES)
+        )
+    
+    # Prepare writer
+    def open_spider(self, spider):
+        self._writers[spider.name] = FeedWriter(os.path.join(self._folder, spider.name), self._compression, self._max_items, self._max_bytes, append=False)
+    
+    # Publish last shard
+    def close_spider(self, spider):
+        self._writers.pop(spider.name).close()
+    
+    # Export item
+    def process_item(self, item, spider):
+        self._writers[spider.name].write(dict(item))
+        return item
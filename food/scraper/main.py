@@ -2,7 +2,6 @@
 
 
 import os
-import pathlib
 import scrapy
 import scrapy.crawler
 
@@ -10,15 +9,17 @@ import scrapy.crawler
 # Get local directory
 HERE = os.path.dirname(os.path.realpath(__file__))
 CACHE_FOLDER = os.path.join(HERE, 'cache')
+EXPORT_FOLDER = os.path.join(HERE, 'export')
 
 
 # Configure crawling
 settings = {
     'BOT_NAME' : 'scraper',
     
-    # Export to JSON file
-    'FEED_URI' : pathlib.Path(os.path.join(HERE, 'export')).as_uri() + '/%(name)s.json',
-    'FEED_EXPORT_ENCODING' : 'UTF-8',
+    # Export to compressed JSON-lines shards, in one folder per spider
+    'ITEM_PIPELINES' : {'food.scraper.feed.FeedPipeline' : 300},
+    'FEED_FOLDER' : EXPORT_FOLDER,
+    'FEED_COMPRESSION' : 'gzip',
     
     # Try to be nice
     'ROBOTSTXT_OBEY' : True,
@@ -31,7 +32,8 @@ settings = {
     'HTTPCACHE_EXPIRATION_SECS' : 0,
     'HTTPCACHE_DIR' : CACHE_FOLDER,
     'HTTPCACHE_IGNORE_HTTP_CODES' : [],
-    'HTTPCACHE_STORAGE' : 'food.scraper.cache.CacheStorage',
+    'HTTPCACHE_STORAGE' : 'food.scraper.segment.SegmentCacheStorage',
+    'HTTPCACHE_CODEC' : 'zstd',
     
     # Disable irrelevant stuff
     #'LOG_LEVEL' : 'INFO',
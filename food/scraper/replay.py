@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+
+import argparse
+import concurrent.futures
+import logging
+import os
+import pickle
+import scrapy
+import sys
+import time
+import zipfile
+
+from .cache import create_response
+from .epicurious import EpicuriousSpider
+from .feed import FeedWriter
+from .genius_kitchen import GeniusKitchenSpider
+from .segment import SegmentLog, create_codec, read_records
+
+
+# Basic logger instance
+logger = logging.getLogger(__name__)
+
+
+# Get local directory
+HERE = os.path.dirname(os.path.realpath(__file__))
+CACHE_FOLDER = os.path.join(HERE, 'cache')
+EXPORT_FOLDER = os.path.join(HERE, 'export')
+
+# Available spiders
+SPIDERS = {spider.name : spider for spider in [GeniusKitchenSpider, EpicuriousSpider]}
+
+# Number of cached responses parsed by each task
+BATCH_SIZE = 1000
+
+# Number of tasks queued for each worker, which bounds memory usage
+BACKLOG = 2
+
+# Number of failures logged with their traceback in each batch, others being only counted
+LOGGED_FAILURES = 3
+
+
+# Spider instances of worker process
+_spiders = {}
+
+
+# Run spider callback on cached response, as done by crawler (i.e. only successful responses are parsed)
+def parse(name, payload):
+    dump = pickle.loads(payload)
+    if not 200 <= dump['status'] < 300:
+        return []
+    response = create_response(dump)
+    response.request = scrapy.Request(dump['url'], method=dump['method'])
+    spider = _spiders.get(name)
+    if spider is None:
+        spider = _spiders[name] = SPIDERS[name]()
+    return [item for item in spider.parse(response) or [] if isinstance(item, dict)]
+
+
+# Get URL of cached response, for diagnostic purpose
+def _get_url(payload):
+    try:
+        return pickle.loads(payload)['url']
+    except Exception:
+        return '<unreadable dump>'
+
+
+# Parse batch of payloads in worker process, where failures are counted instead of interrupting replay
+# Note: only first failures of each batch are logged, so that a broken parser does not flood the log
+def _parse_batch(name, payloads):
+    items = []
+    failures = 0
+    for payload in payloads:
+        try:
+            items.extend(parse(name, payload))
+        except Exception:
+            failures += 1
+            if failures <= LOGGED_FAILURES:
+                logger.exception('%s: failed to parse %s' % (name, _get_url(payload)))
+    if failures > LOGGED_FAILURES:
+        logger.warning('%s: %d other failures in batch' % (name, failures - LOGGED_FAILURES))
+    return items, failures
+
+
+# Parse records of segment log, in worker process
+def _replay_records(name, folder, locations, dictionary_path):
+    return _parse_batch(name, read_records(folder, locations, create_codec('raw', None, dictionary_path)))
+
+
+# Parse members of zip archive, in worker process
+def _replay_archive(name, path):
+    payloads = {}
+    with zipfile.ZipFile(path, 'r') as archive:
+        for info in archive.infolist():
+            payloads[info.filename] = info
+        return _parse_batch(name, (archive.read(info) for info in payloads.values()))
+
+
+# Enumerate tasks needed to replay cached responses of spider, in storage order
+def get_tasks(folder, name, dictionary_path=None, batch_size=BATCH_SIZE):
+    names = os.listdir(folder)
+    if any(n.endswith('.log') for n in names):
+        log = SegmentLog(folder, readonly=True)
+        try:
+            locations = log.get_locations()
+        finally:
+            log.close()
+        for start in range(0, len(locations), batch_size):
+            yield _replay_records, (name, folder, locations[start : start + batch_size], dictionary_path)
+    else:
+        for n in sorted(names):
+            if n.endswith('.zip'):
+                yield _replay_archive, (name, os.path.join(folder, n))
+
+
+# Parse all cached responses of given spider using process pool, and write items as feed (replacing previous one)
+# Note: items are written as soon as their batch is done, hence their order is not preserved
+def replay(name, folder, cache_folder=CACHE_FOLDER, dictionary_path=None, processes=None, batch_size=BATCH_SIZE, compression='gzip'):
+    processes = processes or os.cpu_count() or 1
+    start = time.perf_counter()
+    count = 0
+    failures = 0
+    writer = FeedWriter(folder, compression, append=False)
+    with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+        
+        # Write items of finished tasks
+        pending = set()
+        def wait(condition):
+            nonlocal pending, count, failures
+            done, pending = concurrent.futures.wait(pending, return_when=condition)
+            for future in done:
+                items, batch_failures = future.result()
+                for item in items:
+                    writer.write(item)
+                count += len(items)
+                failures += batch_failures
+        
+        # Keep workers busy, with a bounded number of queued tasks
+        for function, arguments in get_tasks(os.path.join(cache_folder, name), name, dictionary_path, batch_size):
+            if len(pending) >= processes * BACKLOG:
+                wait(concurrent.futures.FIRST_COMPLETED)
+            pending.add(executor.submit(function, *arguments))
+        wait(concurrent.futures.ALL_COMPLETED)
+    writer.close()
+    
+    elapsed = time.perf_counter() - start
+    logger.info('%s: %d items in %.1fs (%d failures)' % (name, count, elapsed, failures))
+    return count, failures
+
+
+# Command-line entry point
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog='python -m food.scraper.replay', description='Parse cached responses again, without crawling.')
+    parser.add_argument('spiders', nargs='*', default=sorted(SPIDERS), help='spider names')
+    parser.add_argument('-c', '--cache', default=CACHE_FOLDER, help='cache folder (i.e. HTTPCACHE_DIR)')
+    parser.add_argument('-o', '--output', default=EXPORT_FOLDER, help='output folder, where each spider has a feed folder')
+    parser.add_argument('-d', '--dictionary', default=None, help='zstd dictionary used by cache')
+    parser.add_argument('-p', '--processes', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args(arguments)
+    
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    for name in args.spiders:
+        replay(name, os.path.join(args.output, name), args.cache, args.dictionary, args.processes)
+
+
+if __name__ == '__main__':
+    main()
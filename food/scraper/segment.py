@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+
+
+import concurrent.futures
+import io
+import logging
+import os
+import pickle
+from scrapy.utils.project import data_path
+from scrapy.utils.request import request_fingerprint
+import struct
+import threading
+import zipfile
+import zlib
+
+from .cache import create_dump, create_response
+
+
+# Basic logger instance
+logger = logging.getLogger(__name__)
+
+
+# Record layout: fingerprint, codec and payload length, followed by compressed payload
+RECORD = struct.Struct('<20sBI')
+
+# Index layout: header, then size of each shard when index was written, then location of each record
+MAGIC = b'FOSI'
+VERSION = 1
+HEADER = struct.Struct('<4sIII')
+ENTRY = struct.Struct('<20sHQI')
+INDEX = 'index.bin'
+
+# Number of log files per spider
+SHARDS = 16
+
+# Number of threads used to compress and write responses
+WORKERS = 2
+
+# Codec identifiers, as stored in records, and default compression levels
+CODECS = {
+    'raw' : 0,
+    'zlib' : 1,
+    'zstd' : 2,
+    'lz4' : 3
+}
+LEVELS = {
+    'raw' : 0,
+    'zlib' : 1,
+    'zstd' : 3,
+    'lz4' : 0
+}
+
+# Dictionary training parameters
+DICTIONARY_SIZE = 112640
+DICTIONARY_SAMPLES = 10000
+
+
+# Payload compression, where codec of each record is stored alongside it (i.e. codec can be changed later on)
+# Note: zstd and lz4 codecs require zstandard and lz4 packages respectively, where zlib is used instead of zstd if needed
+# Note: if a zstd dictionary is used, the same dictionary is needed to read records
+class Codec:
+    def __init__(self, name='zstd', level=None, dictionary=None):
+        if name not in CODECS:
+            raise ValueError('Unsupported codec %s' % name)
+        
+        # Fall back to zlib if zstandard package is missing, unless a dictionary is explicitly requested
+        if name == 'zstd' and dictionary is None:
+            try:
+                import zstandard
+            except ImportError:
+                logger.warning('zstandard package is not available, using zlib codec instead')
+                name = 'zlib'
+                level = None
+        self._id = CODECS[name]
+        self._level = LEVELS[name] if level is None else level
+        self._dictionary = dictionary
+        self._local = threading.local()
+        
+        # Make sure required package is available
+        if name == 'zstd' or dictionary is not None:
+            import zstandard
+        if name == 'lz4':
+            import lz4.frame
+    
+    # Get zstd contexts of current thread, as they cannot be shared
+    def _zstd(self):
+        import zstandard
+        contexts = getattr(self._local, 'zstd', None)
+        if contexts is None:
+            dictionary = None if self._dictionary is None else zstandard.ZstdCompressionDict(self._dictionary)
+            contexts = self._local.zstd = (
+                zstandard.ZstdCompressor(level=self._level, dict_data=dictionary),
+                zstandard.ZstdDecompressor(dict_data=dictionary)
+            )
+        return contexts
+    
+    # Compress payload, returning codec identifier and compressed bytes
+    def compress(self, data):
+        if self._id == CODECS['zlib']:
+            data = zlib.compress(data, self._level)
+        elif self._id == CODECS['zstd']:
+            data = self._zstd()[0].compress(data)
+        elif self._id == CODECS['lz4']:
+            import lz4.frame
+            data = lz4.frame.compress(data, compression_level=self._level)
+        return self._id, data
+    
+    # Decompress payload, using specified codec
+    def decompress(self, codec, data):
+        if codec == CODECS['raw']:
+            return data
+        if codec == CODECS['zlib']:
+            return zlib.decompress(data)
+        if codec == CODECS['zstd']:
+            return self._zstd()[1].decompress(data)
+        if codec == CODECS['lz4']:
+            import lz4.frame
+            return lz4.frame.decompress(data)
+        raise ValueError('Unsupported codec %d' % codec)
+
+
+# Load codec from settings
+def create_codec(name='zstd', level=None, dictionary_path=None):
+    dictionary = None
+    if dictionary_path is not None:
+        with io.open(dictionary_path, 'rb') as file:
+            dictionary = file.read()
+    return Codec(name, level, dictionary)
+
+
+# Append-only record logs, sharded by fingerprint, with an in-memory index
+# Note: appends to a shard are serialized, while reads are positioned and need no lock
+# Note: logs are self-describing, hence records appended after last index flush are recovered by scanning log tails
+# Note: a fingerprint that is stored again points to the new record, and the old one is just ignored
+# Note: only one process may write in a given folder, while others may open it as read-only (e.g. while crawling)
+class SegmentLog:
+    def __init__(self, folder, shards=SHARDS, readonly=False):
+        self._folder = folder
+        self._readonly = readonly
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._files = []
+        if readonly:
+            flags = os.O_RDONLY
+        else:
+            os.makedirs(folder, exist_ok=True)
+            flags = os.O_RDWR | os.O_CREAT | os.O_APPEND
+        for shard in range(shards):
+            path = os.path.join(folder, '%02x.log' % shard)
+            self._files.append(os.open(path, flags | getattr(os, 'O_BINARY', 0)))
+        self._sizes = [0] * shards
+        self._index = {}
+        self._load()
+    
+    # Load index, if any, and then scan records that were not indexed
+    def _load(self):
+        sizes = [0] * len(self._files)
+        path = os.path.join(self._folder, INDEX)
+        if os.path.exists(path):
+            with io.open(path, 'rb') as file:
+                content = file.read()
+            magic, version, shards, count = HEADER.unpack_from(content)
+            offset = HEADER.size + 8 * shards
+            if magic == MAGIC and version == VERSION and shards == len(self._files):
+                indexed_sizes = list(struct.unpack_from('<%dQ' % shards, content, HEADER.size))
+                
+                # Index is only valid if logs were not truncated meanwhile
+                if all(size <= os.fstat(file).st_size for size, file in zip(indexed_sizes, self._files)):
+                    sizes = indexed_sizes
+                    for key, shard, position, length in ENTRY.iter_unpack(content[offset : offset + count * ENTRY.size]):
+                        self._index[key] = (shard, position, length)
+        for shard, size in enumerate(sizes):
+            self._scan(shard, size)
+    
+    # Index records starting at given offset, and discard incomplete trailing record (e.g. after a crash)
+    def _scan(self, shard, position):
+        file = self._files[shard]
+        end = os.fstat(file).st_size
+        while position + RECORD.size <= end:
+            key, _, length = RECORD.unpack(os.pread(file, RECORD.size, position))
+            if position + RECORD.size + length > end:
+                break
+            self._index[key] = (shard, position, RECORD.size + length)
+            position += RECORD.size + length
+        if position < end and not self._readonly:
+            logger.warning('Discarding %d trailing bytes in %s, shard %d' % (end - position, self._folder, shard))
+            os.ftruncate(file, position)
+        self._sizes[shard] = position
+    
+    # Get number of distinct fingerprints
+    def __len__(self):
+        return len(self._index)
+    
+    # Check whether fingerprint is available
+    def __contains__(self, key):
+        return key in self._index
+    
+    # Enumerate fingerprints, in storage order
+    def __iter__(self):
+        locations = sorted((location, key) for key, location in list(self._index.items()))
+        for _, key in locations:
+            yield key
+    
+    # Get location of each record, as (shard, offset, length), in storage order
+    def get_locations(self):
+        return sorted(self._index.values())
+    
+    # Get codec and compressed payload of given fingerprint, using a single positioned read
+    def get(self, key):
+        location = self._index.get(key)
+        if location is None:
+            return None
+        shard, offset, length = location
+        data = os.pread(self._files[shard], length, offset)
+        _, codec, _ = RECORD.unpack_from(data)
+        return codec, data[RECORD.size:]
+    
+    # Append record
+    def put(self, key, codec, payload):
+        shard = key[0] % len(self._files)
+        record = RECORD.pack(key, codec, len(payload)) + payload
+        with self._locks[shard]:
+            offset = self._sizes[shard]
+            view = memoryview(record)
+            while len(view) > 0:
+                view = view[os.write(self._files[shard], view):]
+            self._sizes[shard] = offset + len(record)
+            self._index[key] = (shard, offset, len(record))
+    
+    # Write index (atomically replaced)
+    def flush(self):
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            sizes = list(self._sizes)
+            entries = list(self._index.items())
+        finally:
+            for lock in self._locks:
+                lock.release()
+        path = os.path.join(self._folder, INDEX)
+        temporary_path = '%s.%d.tmp' % (path, os.getpid())
+        with io.open(temporary_path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, len(sizes), len(entries)))
+            file.write(struct.pack('<%dQ' % len(sizes), *sizes))
+            file.write(b''.join(ENTRY.pack(key, *location) for key, location in entries))
+        os.replace(temporary_path, path)
+    
+    # Write index and release files
+    def close(self):
+        if not self._readonly:
+            self.flush()
+        for file in self._files:
+            os.close(file)
+        self._files = []
+
+
+# Read payloads at given locations of log folder, without loading index
+def read_records(folder, locations, codec):
+    files = {}
+    try:
+        for shard, offset, length in locations:
+            file = files.get(shard)
+            if file is None:
+                file = files[shard] = os.open(os.path.join(folder, '%02x.log' % shard), os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+            data = os.pread(file, length, offset)
+            _, record_codec, _ = RECORD.unpack_from(data)
+            yield codec.decompress(record_codec, data[RECORD.size:])
+    finally:
+        for file in files.values():
+            os.close(file)
+
+
+# Sharded log storage, where responses are compressed and written by worker threads
+# Note: responses that are not written yet are served from memory
+class SegmentCacheStorage:
+    def __init__(self, settings):
+        self._folder = data_path(settings['HTTPCACHE_DIR'])
+        self._shards = settings.getint('HTTPCACHE_SHARDS', SHARDS)
+        self._workers = settings.getint('HTTPCACHE_WORKERS', WORKERS)
+        level = settings.get('HTTPCACHE_CODEC_LEVEL')
+        self._codec = create_codec(
+            settings.get('HTTPCACHE_CODEC', 'zstd'),
+            None if level is None else int(level),
+            settings.get('HTTPCACHE_DICTIONARY')
+        )
+        self._logs = {}
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._executor = None
+    
+    # Load index
+    def open_spider(self, spider):
+        self._logs[spider.name] = SegmentLog(os.path.join(self._folder, spider.name), self._shards)
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(self._workers)
+    
+    # Wait for pending writes, and save index
+    def close_spider(self, spider):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._logs.pop(spider.name).close()
+    
+    # Acquire data
+    def retrieve_response(self, spider, request):
+        id = request_fingerprint(request)
+        key = bytes.fromhex(id)
+        with self._lock:
+            dump = self._pending.get((spider.name, key))
+        if dump is None:
+            record = self._logs[spider.name].get(key)
+            if record is None:
+                logger.debug('Cache miss: %s %s (%s)' % (request.method, request.url, id))
+                return
+            dump = pickle.loads(self._codec.decompress(*record))
+        logger.debug('Cache hit: %s %s (%s)' % (request.method, request.url, id))
+        return create_response(dump)
+    
+    # Compress and write data, in worker thread
+    def _store(self, name, key, dump):
+        try:
+            codec, payload = self._codec.compress(pickle.dumps(dump, pickle.HIGHEST_PROTOCOL))
+            self._logs[name].put(key, codec, payload)
+        except:
+            logger.exception('Failed to store %s' % dump['url'])
+        finally:
+            with self._lock:
+                if self._pending.get((name, key)) is dump:
+                    del self._pending[name, key]
+    
+    # Store data
+    def store_response(self, spider, request, response):
+        id = request_fingerprint(request)
+        key = bytes.fromhex(id)
+        logger.debug('Cache update: %s %s (%s)' % (request.method, request.url, id))
+        dump = create_dump(request, response)
+        with self._lock:
+            self._pending[spider.name, key] = dump
+        self._executor.submit(self._store, spider.name, key, dump)
+
+
+# Enumerate fingerprints and payloads of zip archives of a spider cache folder, where only last duplicate is kept
+def read_archives(folder):
+    
+    # List members first, as a fingerprint may have been stored again in same or later archive
+    members = {}
+    for name in sorted(os.listdir(folder)):
+        if name.endswith('.zip'):
+            with zipfile.ZipFile(os.path.join(folder, name), 'r') as archive:
+                for info in archive.infolist():
+                    members[info.filename] = (name, info)
+    archives = {}
+    for name, info in members.values():
+        archives.setdefault(name, []).append(info)
+    
+    # Read kept members, archive by archive
+    for name in sorted(archives):
+        with zipfile.ZipFile(os.path.join(folder, name), 'r') as archive:
+            for info in archives[name]:
+                yield info.filename, archive.read(info)
+
+
+# Convert zip archives of cache folder (i.e. one subfolder per spider) to segment logs
+def migrate(source, destination, codec='zstd', level=None, dictionary_path=None, shards=SHARDS):
+    codec = create_codec(codec, level, dictionary_path)
+    for name in sorted(os.listdir(source)):
+        folder = os.path.join(source, name)
+        if not os.path.isdir(folder):
+            continue
+        log = SegmentLog(os.path.join(destination, name), shards)
+        try:
+            for id, payload in read_archives(folder):
+                log.put(bytes.fromhex(id), *codec.compress(payload))
+        finally:
+            log.close()
+
+
+# Train zstd dictionary from a sample of payloads of zip archives in cache folder
+def train_dictionary(source, path, size=DICTIONARY_SIZE, count=DICTIONARY_SAMPLES):
+    import zstandard
+    archives = []
+    for name in sorted(os.listdir(source)):
+        folder = os.path.join(source, name)
+        if os.path.isdir(folder):
+            archives.extend(os.path.join(folder, n) for n in sorted(os.listdir(folder)) if n.endswith('.zip'))
+    samples = []
+    for archive_path in archives:
+        with zipfile.ZipFile(archive_path, 'r') as archive:
+            for info in archive.infolist()[:max(count // len(archives), 1)]:
+                samples.append(archive.read(info))
+    dictionary = zstandard.train_dictionary(size, samples)
+    with io.open(path, 'wb') as file:
+        file.write(dictionary.as_bytes())
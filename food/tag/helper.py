@@ -7,6 +7,8 @@ import collections
 import random
 import pandas
 
+from food.scraper.feed import read_ingredients
+
 from .text import tokenize
 from .pos import get_tagger as get_pos_tagger
 from .entity import get_tagger as get_entity_tagger
@@ -28,7 +30,16 @@ def get_debug_tagger():
   return tag
 
 
-# Generate additional samples for Part-of-Speech and food entities
+# Enumerate raw lines, from text file or scraper feed folder
+def read_lines(input_path):
+  if os.path.isdir(input_path):
+    yield from read_ingredients(input_path)
+  else:
+    with io.open(input_path, 'r', newline='\n', encoding='utf-8') as file:
+      yield from file
+
+
+# Generate additional samples for Part-of-Speech and food entities, from text file or scraper feed folder
 def generate_entities(input_path, output_path, count=50, by_frequency=True):
   
   # Acquire existing lines
@@ -37,11 +48,10 @@ def generate_entities(input_path, output_path, count=50, by_frequency=True):
   
   # Acquire raw lines
   lines = collections.Counter()
-  with io.open(input_path, 'r', newline='\n', encoding='utf-8') as file:
-    for line in file:
-      line = line.strip()
-      if line not in existing_lines:
-        lines[line] += 1
+  for line in read_lines(input_path):
+    line = line.strip()
+    if line not in existing_lines:
+      lines[line] += 1
   
   # Select random samples
   lines = [line for line, _ in lines.most_common()]
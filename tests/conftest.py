@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+
+import os
+import pytest
+
+import food
+from food.parser.ontology import parse
+
+
+# Ontology shipped with repository
+ONTOLOGY_TXT = os.path.join(os.path.dirname(food.__file__), 'ontology', 'core.txt')
+
+
+# Parse shipped ontology once
+@pytest.fixture(scope='session')
+def ontology():
+    return parse([ONTOLOGY_TXT])
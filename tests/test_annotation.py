@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncio
+import concurrent.futures
+import json
+import os
+import pytest
+
+import food.parser.annotation.lines
+import food.parser.annotation.sqlite
+from food.parser.annotation import AnnotationView, LinesAnnotationDataset, SqliteAnnotationDataset, migrate
+
+
+# Append raw lines to file, as another process would
+def append(path, content):
+    with open(path, 'ab') as file:
+        file.write(content)
+
+
+# Encode entries as lines
+def encode(*entries):
+    return b''.join(b'%s\n' % json.dumps(entry).encode('utf-8') for entry in entries)
+
+
+# Recent entries override base ones, until they are merged
+def test_view(monkeypatch):
+    monkeypatch.setattr(food.parser.annotation.lines, 'MERGE_THRESHOLD', 3)
+    first = AnnotationView({'a' : 1, 'b' : 2})
+    second = first.extend({'b' : 3, 'c' : 4})
+    assert dict(second) == {'a' : 1, 'b' : 3, 'c' : 4}
+    assert len(second) == 3
+    assert second._base is first._base
+    assert dict(first) == {'a' : 1, 'b' : 2}
+    third = second.extend({'d' : 5})
+    assert dict(third) == {'a' : 1, 'b' : 3, 'c' : 4, 'd' : 5}
+    assert len(third._recent) == 0
+    assert 'e' not in third
+
+
+# Only appended lines are parsed, and incomplete lines are deferred
+def test_tail(tmp_path, monkeypatch):
+    path = str(tmp_path / 'annotations.txt')
+    dataset = LinesAnnotationDataset(path, None)
+    assert len(dataset._get()) == 0
+    append(path, encode({'key' : 'a', 'value' : 1}, {'key' : 'b', 'value' : 1}))
+    assert dict(dataset._get()) == {'a' : {'key' : 'a', 'value' : 1}, 'b' : {'key' : 'b', 'value' : 1}}
+    offsets = []
+    read = dataset._read
+    def spy(offset):
+        offsets.append(offset)
+        return read(offset)
+    monkeypatch.setattr(dataset, '_read', spy)
+    line = encode({'key' : 'a', 'value' : 2})
+    append(path, line[:10])
+    assert dataset._get()['a']['value'] == 1
+    append(path, line[10:] + encode({'key' : 'c', 'value' : 1}))
+    view = dataset._get()
+    assert view['a']['value'] == 2
+    assert sorted(view) == ['a', 'b', 'c']
+    assert dataset._lines == 4
+    assert all(offset > 0 for offset in offsets)
+    assert dataset._get() is view
+
+
+# Rewritten or deleted files are reloaded from scratch
+def test_rewrite(tmp_path):
+    path = str(tmp_path / 'annotations.txt')
+    append(path, encode({'key' : 'a', 'value' : 1}))
+    dataset = LinesAnnotationDataset(path, None)
+    assert dataset._get()['a']['value'] == 1
+    with open(path, 'wb') as file:
+        file.write(encode({'key' : 'b', 'value' : 1}, {'key' : 'c', 'value' : 1}))
+    assert sorted(dataset._get()) == ['b', 'c']
+    replacement = path + '.new'
+    append(replacement, encode({'key' : 'd', 'value' : 1}, {'key' : 'e', 'value' : 1}, {'key' : 'f', 'value' : 1}))
+    os.replace(replacement, path)
+    assert sorted(dataset._get()) == ['d', 'e', 'f']
+    os.remove(path)
+    assert len(dataset._get()) == 0
+
+
+# Superseded lines are removed by compaction, and later appends are still parsed incrementally
+def test_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(food.parser.annotation.lines, 'COMPACTION_MINIMUM', 10)
+    path = str(tmp_path / 'annotations.txt')
+    dataset = LinesAnnotationDataset(path, None)
+    append(path, encode(*({'key' : str(index % 3), 'value' : index} for index in range(5))))
+    dataset._compact()
+    assert dataset._lines == 5
+    append(path, encode(*({'key' : str(index % 3), 'value' : index} for index in range(5, 30))))
+    dataset._compact()
+    assert dataset._lines == 3
+    with open(path, 'rb') as file:
+        assert sorted((json.loads(line) for line in file), key=lambda entry: entry['key']) == [{'key' : '0', 'value' : 27}, {'key' : '1', 'value' : 28}, {'key' : '2', 'value' : 29}]
+    append(path, encode({'key' : '3', 'value' : 30}))
+    view = dataset._get()
+    assert dataset._lines == 4
+    assert {key : entry['value'] for key, entry in view.items()} == {'0' : 27, '1' : 28, '2' : 29, '3' : 30}
+
+
+# Asynchronous interface adds and reads annotations
+def test_async(tmp_path):
+    path = str(tmp_path / 'annotations.txt')
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        async def run():
+            dataset = LinesAnnotationDataset(path, executor, interval=3600)
+            try:
+                assert await dataset.get('a') is None
+                await dataset.add({'key' : 'a', 'value' : 1})
+                await dataset.add([{'key' : 'b', 'value' : 1}, {'key' : 'a', 'value' : 2}])
+                assert await dataset.get(['a', 'b', 'c']) == [{'key' : 'a', 'value' : 2}, {'key' : 'b', 'value' : 1}, None]
+                assert len(await dataset.get()) == 2
+            finally:
+                dataset.close()
+        asyncio.run(run())
+    other = LinesAnnotationDataset(path, None)
+    assert other._get()['a']['value'] == 2
+
+
+# Database backend imports JSON-lines file, and serves point lookups and updates
+def test_sqlite(tmp_path, monkeypatch):
+    monkeypatch.setattr(food.parser.annotation.sqlite, 'BATCH_SIZE', 2)
+    json_path = str(tmp_path / 'annotations.txt')
+    path = str(tmp_path / 'annotations.db')
+    append(json_path, encode(*({'key' : str(index % 5), 'value' : index} for index in range(8))))
+    migrate(json_path, path, batch_size=3)
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        async def run():
+            dataset = SqliteAnnotationDataset(path, executor)
+            try:
+                assert await dataset.get('1') == {'key' : '1', 'value' : 6}
+                assert await dataset.get(['0', '4', 'x', '2']) == [{'key' : '0', 'value' : 5}, {'key' : '4', 'value' : 4}, None, {'key' : '2', 'value' : 7}]
+                await dataset.add({'key' : '1', 'value' : 8})
+                await dataset.add([{'key' : 'x', 'value' : 9}])
+                
+                # Mapping must not be queried from event loop, but is usable in executor
+                view = await dataset.get()
+                with pytest.raises(RuntimeError):
+                    len(view)
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(executor, lambda: (len(view), dict(view.items()), view['1'], 'x' in view, 'y' in view))
+            finally:
+                dataset.close()
+        length, entries, entry, present, absent = asyncio.run(run())
+    assert length == 6
+    assert {key : entry['value'] for key, entry in entries.items()} == {'0' : 5, '1' : 8, '2' : 7, '3' : 3, '4' : 4, 'x' : 9}
+    assert entry == {'key' : '1', 'value' : 8}
+    assert present and not absent
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+
+import pytest
+
+pytest.importorskip('hunspell')
+
+from food.parser.classifier.logistic import artifact
+from food.parser.classifier.logistic.model import Model
+
+
+# Small training set, where each text has a single label
+SAMPLES = {
+    'red apple' : {'apple' : 1.0},
+    'green apples' : {'apple' : 1.0},
+    'ripe banana' : {'banana' : 1.0},
+    'sliced bananas' : {'banana' : 1.0},
+    'chopped onion' : {'onion' : 1.0},
+    'red onions' : {'onion' : 1.0},
+    'fresh basil' : {'basil' : 1.0},
+    'basil leaves' : {'basil' : 1.0}
+}
+ADJACENCY = {label : set() for labels in SAMPLES.values() for label in labels}
+TEXTS = ['red apple', 'basil and onion', 'unknown words', 'sliced green banana']
+
+# Texts without ties between best labels, i.e. where selected labels do not depend on precision
+KNOWN_TEXTS = ['red apple', 'basil and onion', 'sliced green banana']
+
+
+# Train flat model
+def train(features='count', jobs=1):
+    model = Model(features, jobs=jobs)
+    model.train(SAMPLES, ADJACENCY)
+    return model
+
+
+# Compare predictions, where artifacts use single precision
+def assert_equivalent(actual, expected):
+    assert len(actual) == len(expected)
+    for actual_labels, expected_labels in zip(actual, expected):
+        assert set(actual_labels) == set(expected_labels)
+        for label, probability in expected_labels.items():
+            assert actual_labels[label] == pytest.approx(probability, rel=1e-4, abs=1e-6)
+
+
+# Loaded artifact must give same probabilities as in-memory pipeline
+@pytest.mark.parametrize('features', ['count', 'hashing'])
+@pytest.mark.parametrize('jobs, kind', [(1, 'multinomial'), (2, 'ovr')])
+def test_round_trip(tmp_path, features, jobs, kind):
+    model = train(features, jobs)
+    version = artifact.save(model, str(tmp_path))
+    loaded = artifact.load(str(tmp_path))
+    assert loaded.get_metadata()['version'] == version
+    assert loaded.get_metadata()['type'] == 'linear'
+    assert loaded.get_metadata()['kind'] == kind
+    assert_equivalent(loaded.classify(TEXTS), model.classify(TEXTS))
+    assert_equivalent(loaded.classify(KNOWN_TEXTS, 2, 0.1), model.classify(KNOWN_TEXTS, 2, 0.1))
+
+
+# Untrained model is pickled
+def test_pickle(tmp_path):
+    artifact.save(Model(), str(tmp_path))
+    loaded = artifact.load(str(tmp_path))
+    assert loaded.classify(TEXTS) == [{} for _ in TEXTS]
+
+
+# Only latest versions are kept, and any of them can be published again
+def test_versions(tmp_path):
+    path = str(tmp_path)
+    assert artifact.get_current(path) is None
+    model = train()
+    versions = [artifact.save(model, path, retention=2) for _ in range(3)]
+    assert versions == [1, 2, 3]
+    assert artifact.get_versions(path) == [2, 3]
+    assert artifact.get_current(path) == 3
+    artifact.set_current(path, 2)
+    assert artifact.get_current(path) == 2
+    assert artifact.load(path).get_metadata()['version'] == 2
+    with pytest.raises(KeyError):
+        artifact.set_current(path, 1)
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+
+import os
+import pytest
+import zipfile
+
+cache = pytest.importorskip('food.scraper.cache', reason='requires a scrapy version providing request_fingerprint', exc_type=ImportError)
+
+
+# Members are read directly from located data, for each compression method supported by zipfile
+@pytest.mark.parametrize('method', [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED, zipfile.ZIP_BZIP2, zipfile.ZIP_LZMA])
+def test_decompress(tmp_path, method):
+    path = str(tmp_path / '00.zip')
+    payload = os.urandom(256) + b'ingredient' * 1000
+    with zipfile.ZipFile(path, 'a', compression=method) as archive:
+        archive.writestr('a', b'previous')
+        archive.writestr('b', payload)
+        archive.writestr('a', b'current')
+    locations = cache.read_locations(path)
+    with open(path, 'rb') as file:
+        for name, expected in (('a', b'current'), ('b', payload)):
+            offset, length, compression = locations[name]
+            assert compression == method
+            assert cache._decompress(compression, os.pread(file.fileno(), length, offset)) == expected
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncio
+import pytest
+
+pytest.importorskip('hunspell')
+
+from food.parser.classifier import BatchingClassifier, Classifier, DelayedClassifier, MemoryCacheClassifier
+
+
+# Classifier returning texts as labels, and recording calls
+class EchoClassifier(Classifier):
+    def __init__(self):
+        self.calls = []
+        self.version = 1
+    
+    async def classify(self, texts, limit=None, threshold=None):
+        self.calls.append((list(texts), limit, threshold))
+        return [{'%s@%d' % (text, self.version) : 1.0} for text in texts]
+    
+    async def train(self, progress=None):
+        self.version += 1
+        return {'success' : True}
+    
+    def get_version(self):
+        return self.version
+
+
+# Cache is keyed by normalized text and parameters, and evicts least recently used entries
+def test_cache():
+    async def run():
+        classifier = EchoClassifier()
+        cache = MemoryCacheClassifier(classifier, capacity=3)
+        assert await cache.classify(['a', 'B', ' b ']) == [{'a@1' : 1.0}, {'B@1' : 1.0}, {'B@1' : 1.0}]
+        assert classifier.calls == [(['a', 'B'], None, None)]
+        assert await cache.classify(['b', 'a']) == [{'B@1' : 1.0}, {'a@1' : 1.0}]
+        assert await cache.classify(['a'], limit=1) == [{'a@1' : 1.0}]
+        assert await cache.classify(['c']) == [{'c@1' : 1.0}]
+        assert classifier.calls[1:] == [(['a'], 1, None), (['c'], None, None)]
+        
+        # Least recently used entry (b) was evicted, while recently used one (a) was kept
+        await cache.classify(['a', 'b'])
+        assert classifier.calls[3:] == [(['b'], None, None)]
+        assert cache.get_statistics() == {'size' : 3, 'capacity' : 3, 'hits' : 3, 'misses' : 6, 'evictions' : 2}
+        
+        # New model version invalidates entries
+        await cache.train()
+        assert await cache.classify(['a']) == [{'a@2' : 1.0}]
+        assert cache.get_version() == 2
+    asyncio.run(run())
+
+
+# Concurrent requests are coalesced by selection parameters, while large requests are forwarded directly
+def test_batch():
+    async def run():
+        classifier = EchoClassifier()
+        batching = BatchingClassifier(classifier, delay=0.01, maximum=4)
+        results = await asyncio.gather(
+            batching.classify(['a']),
+            batching.classify(['b', 'c']),
+            batching.classify(['d'], limit=1)
+        )
+        assert results == [[{'a@1' : 1.0}], [{'b@1' : 1.0}, {'c@1' : 1.0}], [{'d@1' : 1.0}]]
+        assert sorted(classifier.calls) == [(['a', 'b', 'c'], None, None), (['d'], 1, None)]
+        
+        # Full batch is sent without waiting
+        classifier.calls = []
+        results = await asyncio.wait_for(asyncio.gather(
+            batching.classify(['e', 'f']),
+            batching.classify(['g', 'h']),
+            batching.classify(['i', 'j', 'k', 'l'])
+        ), 1.0)
+        assert results[2] == [{'%s@1' % text : 1.0} for text in 'ijkl']
+        assert classifier.calls == [(['i', 'j', 'k', 'l'], None, None), (['e', 'f', 'g', 'h'], None, None)]
+        
+        # Errors are forwarded to each waiting request
+        async def fail(texts, limit=None, threshold=None):
+            raise ValueError()
+        classifier.classify = fail
+        results = await asyncio.gather(batching.classify(['a']), batching.classify(['b']), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+    asyncio.run(run())
+
+
+# Classifier whose training sessions wait for explicit release
+class GatedClassifier(EchoClassifier):
+    def __init__(self):
+        super().__init__()
+        self.sessions = 0
+        self.releases = asyncio.Queue()
+    
+    async def train(self, progress=None):
+        self.sessions += 1
+        progress.update('fitting', 0, 2)
+        await self.releases.get()
+        progress.update('fitting', 1, 2)
+        self.version += 1
+        return {'success' : True}
+
+
+# Wait until other tasks have run
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+# Requests made during a session are coalesced into a single next session, which can be cancelled
+def test_delay():
+    async def run():
+        classifier = GatedClassifier()
+        delayed = DelayedClassifier(classifier)
+        first = asyncio.ensure_future(delayed.train())
+        await settle()
+        status = delayed.get_status()
+        assert status['running']['stage'] == 'fitting'
+        assert status['running']['total'] == 2
+        assert not status['pending']
+        second = asyncio.ensure_future(delayed.train())
+        third = asyncio.ensure_future(delayed.train())
+        await settle()
+        assert delayed.get_status()['pending']
+        classifier.releases.put_nowait(None)
+        assert (await first)['success']
+        await settle()
+        assert classifier.sessions == 2
+        assert not delayed.get_status()['pending']
+        
+        # Cancelled session is reported, and its model is discarded
+        assert delayed.cancel()
+        classifier.releases.put_nowait(None)
+        second, third = await asyncio.gather(second, third)
+        assert second is third
+        assert second['cancelled'] and not second['success']
+        assert classifier.sessions == 2
+        assert delayed.get_version() == 2
+        assert delayed.get_status()['last'] is second
+        assert delayed.get_status()['running'] is None
+        assert not delayed.cancel()
+    asyncio.run(run())
+
+
+# Training is triggered after enough new annotations
+def test_delay_count():
+    async def run():
+        classifier = GatedClassifier()
+        delayed = DelayedClassifier(classifier, count=3, interval=3600)
+        await delayed.update([{'key' : 'a'}, {'key' : 'b'}])
+        assert delayed.get_status()['changes'] == 2
+        assert delayed.get_status()['scheduled'] > 0
+        await delayed.update([{'key' : 'c'}])
+        await settle()
+        status = delayed.get_status()
+        assert classifier.sessions == 1
+        assert status['changes'] == 0
+        assert status['scheduled'] is None
+        classifier.releases.put_nowait(None)
+        await settle()
+        assert delayed.get_status()['last']['success']
+    asyncio.run(run())
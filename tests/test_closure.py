@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+
+import pytest
+
+from food.parser.closure import RULES, ClosureIndex
+from food.parser.ontology import build
+
+
+# Find ascendants by explicit search over (node, has entered) states
+def search(ontology, identifier, rule):
+    transferring, entering, following = rule
+    pending = [(identifier, False)]
+    visited = set(pending)
+    while len(pending) > 0:
+        node, entered = pending.pop()
+        for key, targets in ontology._ascendants[node].items():
+            for target in targets:
+                states = []
+                if not entered and key in transferring:
+                    states.append((target, False))
+                if not entered and key in entering:
+                    states.append((target, True))
+                if entered and key in following:
+                    states.append((target, True))
+                for state in states:
+                    if state not in visited:
+                        visited.add(state)
+                        pending.append(state)
+    return {node for node, entered in visited if entered}
+
+
+# Closure index matches explicit search on shipped ontology
+@pytest.mark.parametrize('relationship', sorted(RULES.keys()))
+def test_ontology(ontology, relationship):
+    index = ClosureIndex(ontology)
+    identifiers = sorted(ontology.get_identifiers())
+    expected = {id : search(ontology, id, RULES[relationship]) for id in identifiers}
+    descendants = {id : set() for id in identifiers}
+    for id, ascendants in expected.items():
+        for ascendant in ascendants:
+            descendants[ascendant].add(id)
+    for id in identifiers:
+        assert set(index.get_ascendants(id, relationship)) == expected[id]
+        assert set(index.get_descendants(id, relationship)) == descendants[id]
+    for id in identifiers[::50]:
+        assert index.are_a(identifiers, id, relationship) == [id in expected[other] for other in identifiers]
+
+
+# Rules are applied to small graph
+def test_rules():
+    ontology = build([
+        ('apple', 'kind_of', 'fruit'),
+        ('fruit', 'kind_of', 'plant_food'),
+        ('apple_juice', 'derivative_of', 'apple'),
+        ('cloudy_apple_juice', 'kind_of', 'apple_juice'),
+        ('apple_peel', 'part_of', 'apple'),
+        ('apple_peel_extract', 'made_of', 'apple_peel'),
+        ('cider', 'product_of', 'apple_juice'),
+        ('plant_food', 'label', 'plant food')
+    ])
+    index = ontology.get_closure()
+    assert sorted(index.get_ascendants('apple')) == ['fruit', 'plant_food']
+    assert index.get_ascendants('fruit') == ['plant_food']
+    assert index.get_ascendants('apple_juice') == []
+    assert sorted(index.get_ascendants('cloudy_apple_juice', 'derivative_of')) == ['apple', 'fruit', 'plant_food']
+    assert sorted(index.get_ascendants('apple_peel_extract', 'derivative_of')) == ['apple', 'apple_peel', 'fruit', 'plant_food']
+    assert index.get_ascendants('apple_peel_extract', 'made_of') == ['apple_peel']
+    assert index.get_ascendants('cider', 'product_of') == ['apple_juice']
+    assert index.is_a('cloudy_apple_juice', 'fruit', 'derivative_of')
+    assert not index.is_a('cloudy_apple_juice', 'fruit')
+    assert not index.is_a('unknown', 'fruit')
+    assert index.get_ascendants('unknown') == []
+    assert sorted(index.get_descendants('apple', 'derivative_of')) == ['apple_juice', 'apple_peel', 'apple_peel_extract', 'cloudy_apple_juice']
+    assert index.get_many_ascendants(['apple', 'unknown', 'apple']) == [index.get_ascendants('apple'), [], index.get_ascendants('apple')]
+
+
+# Cycles are rejected
+def test_cycle():
+    ontology = build([
+        ('fruit', 'kind_of', 'plant_food'),
+        ('plant_food', 'kind_of', 'fruit')
+    ])
+    with pytest.raises(ValueError):
+        ontology.get_closure()
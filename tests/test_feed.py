@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+
+import os
+import pytest
+import threading
+import time
+
+from food.scraper.feed import FeedWriter, load_manifest, read_feed, read_ingredients, save_manifest
+
+
+# Items are rotated into shards, and only complete shards are listed
+@pytest.mark.parametrize('compression', ['none', 'gzip'])
+def test_shards(tmp_path, compression):
+    folder = str(tmp_path / 'feed')
+    writer = FeedWriter(folder, compression, max_items=3)
+    items = [{'title' : 'Crème brûlée %d' % index, 'ingredients' : ['%d eggs' % index]} for index in range(7)]
+    for item in items[:4]:
+        writer.write(item)
+    manifest = load_manifest(folder)
+    assert not manifest['complete']
+    assert [shard['items'] for shard in manifest['shards']] == [3]
+    assert list(read_feed(folder)) == items[:3]
+    for item in items[4:]:
+        writer.write(item)
+    writer.close()
+    manifest = load_manifest(folder)
+    assert manifest['complete']
+    assert [shard['items'] for shard in manifest['shards']] == [3, 3, 1]
+    assert sorted(os.listdir(folder)) == sorted([shard['name'] for shard in manifest['shards']] + ['manifest.json'])
+    assert list(read_feed(folder)) == items
+    assert list(read_ingredients(folder)) == ['%d eggs' % index for index in range(7)]
+
+
+# Shards of previous runs are kept, unless feed is replaced
+def test_append(tmp_path):
+    folder = str(tmp_path / 'feed')
+    assert list(read_feed(folder)) == []
+    for append, expected in ((True, [0]), (True, [0, 1]), (False, [2])):
+        writer = FeedWriter(folder, 'gzip', append=append)
+        writer.write({'run' : expected[-1]})
+        writer.close()
+        assert [item['run'] for item in read_feed(folder)] == expected
+    assert len(os.listdir(folder)) == 2
+
+
+# Followers get new shards until feed is complete, or abandoned
+def test_follow(tmp_path):
+    folder = str(tmp_path / 'feed')
+    writer = FeedWriter(folder, 'none', max_items=1)
+    writer.write({'index' : 0})
+    def finish():
+        time.sleep(0.1)
+        writer.write({'index' : 1})
+        writer.close()
+    thread = threading.Thread(target=finish)
+    thread.start()
+    try:
+        assert [item['index'] for item in read_feed(folder, follow=True, interval=0.01, timeout=60.0)] == [0, 1]
+    finally:
+        thread.join()
+    
+    # Incomplete feed, which was not updated for a while
+    manifest = load_manifest(folder)
+    manifest['complete'] = False
+    manifest['updated'] = time.time() - 120.0
+    save_manifest(folder, manifest)
+    assert [item['index'] for item in read_feed(folder, follow=True, interval=0.01, timeout=60.0)] == [0, 1]
+
+
+# Unknown compression is rejected, before anything is written
+def test_invalid(tmp_path):
+    with pytest.raises(ValueError):
+        FeedWriter(str(tmp_path / 'feed'), 'unknown')
+    assert not os.path.exists(str(tmp_path / 'feed'))
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+
+import pickle
+import pytest
+
+pytest.importorskip('hunspell')
+
+from food.parser.classifier.logistic.hierarchy import HierarchicalModel
+
+
+# Small taxonomy, where fruits and vegetables have several children
+ADJACENCY = {
+    'fruit' : {'apple', 'banana', 'pear'},
+    'apple' : set(),
+    'banana' : set(),
+    'pear' : set(),
+    'vegetable' : {'onion', 'carrot', 'tomato'},
+    'onion' : set(),
+    'carrot' : set(),
+    'tomato' : set()
+}
+SAMPLES = {
+    'fresh fruit' : {'fruit' : 1.0},
+    'red apple' : {'apple' : 1.0},
+    'ripe banana' : {'banana' : 1.0},
+    'juicy pear' : {'pear' : 1.0},
+    'mixed vegetables' : {'vegetable' : 1.0},
+    'chopped onion' : {'onion' : 1.0},
+    'grated carrot' : {'carrot' : 1.0},
+    'ripe tomato' : {'tomato' : 1.0}
+}
+TEXTS = ['red apple', 'ripe tomato', 'chopped carrot and onion', 'unknown words']
+
+
+# Train model once, as an exact search
+@pytest.fixture(scope='module')
+def model():
+    model = HierarchicalModel(beam=None)
+    model.train(SAMPLES, ADJACENCY)
+    return model
+
+
+# Use same nodes with another beam width
+def with_beam(model, beam):
+    other = pickle.loads(pickle.dumps(model))
+    other._beam = beam
+    return other
+
+
+# Exact probabilities sum to one, and best label is the annotated one
+def test_exact(model):
+    predictions = model.classify(TEXTS)
+    for prediction in predictions:
+        assert sum(prediction.values()) == pytest.approx(1.0)
+    assert next(iter(model.classify(['red apple'], limit=1)[0])) == 'apple'
+
+
+# Beam wider than taxonomy gives exact probabilities, up to negligible paths
+def test_wide_beam(model):
+    expected = model.classify(TEXTS)
+    actual = with_beam(model, 100).classify(TEXTS)
+    for expected_labels, actual_labels in zip(expected, actual):
+        for label, probability in expected_labels.items():
+            assert actual_labels.get(label, 0.0) == pytest.approx(probability, abs=1e-3)
+
+
+# Narrow beam only keeps labels below best nodes, which probabilities cannot exceed exact ones
+def test_narrow_beam(model):
+    narrow = with_beam(model, 1)
+    for expected_labels, actual_labels in zip(model.classify(TEXTS), narrow.classify(TEXTS)):
+        assert sum(actual_labels.values()) <= 1.0 + 1e-9
+        for label, probability in actual_labels.items():
+            assert probability <= expected_labels[label] + 1e-9
+    assert next(iter(narrow.classify(['red apple'], limit=1)[0])) == 'apple'
+
+
+# Compiled structures are not pickled
+def test_pickle(model):
+    model.classify(TEXTS)
+    other = pickle.loads(pickle.dumps(model))
+    assert other._graph is None
+    assert other.classify(TEXTS) == model.classify(TEXTS)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+
+import numpy
+import pytest
+import scipy.sparse
+
+pytest.importorskip('hunspell')
+
+from food.parser.classifier.logistic.model import ColumnSelector, Model, create_classifier, expand, fit_classifier, select
+
+
+# Keep most probable labels using full sort
+def naive_select(probabilities, classes, limit=None, threshold=None):
+    results = []
+    for row in probabilities:
+        ranking = sorted(zip(classes, row), key=lambda pair: -pair[1])
+        if limit is not None:
+            ranking = ranking[:max(limit, 0)]
+        if threshold is not None:
+            ranking = [(label, probability) for label, probability in ranking if probability >= threshold]
+        results.append(ranking)
+    return results
+
+
+# Vectorized selection matches full sort, including order
+@pytest.mark.parametrize('limit', [None, 0, 1, 3, 10, 20])
+@pytest.mark.parametrize('threshold', [None, 0.0, 0.1, 0.9])
+def test_select(limit, threshold):
+    generator = numpy.random.default_rng(0)
+    probabilities = generator.dirichlet(numpy.full(10, 0.3), size=50)
+    classes = numpy.array(['label_%d' % index for index in range(10)], dtype=object)
+    results = select(probabilities, classes, limit, threshold)
+    for result, expected in zip(results, naive_select(probabilities, classes, limit, threshold)):
+        if limit is None and threshold is None:
+            assert result == dict(expected)
+        else:
+            assert list(result.items()) == expected
+
+
+# Training samples, as text to label weights
+SAMPLES = {
+    'red apples' : {'apple' : 1.0},
+    'green apple' : {'apple' : 1.0},
+    'ripe bananas' : {'banana' : 1.0},
+    'banana slices' : {'banana' : 1.0},
+    'chopped carrots' : {'carrot' : 1.0},
+    'carrot sticks' : {'carrot' : 1.0}
+}
+ADJACENCY = {'apple' : [], 'banana' : [], 'carrot' : []}
+
+
+# Only columns used during fitting are kept, in order
+def test_selector():
+    fitted = scipy.sparse.random(20, 100, density=0.05, format='csr', random_state=1)
+    other = scipy.sparse.random(10, 100, density=0.2, format='csr', random_state=2)
+    selector = ColumnSelector().fit(fitted)
+    assert selector.transform(other).toarray() == pytest.approx(other.toarray()[:, selector.columns_])
+    empty = ColumnSelector().fit(scipy.sparse.csr_matrix((2, 100)))
+    assert empty.transform(other).shape == (10, 0)
+
+
+# Hashing features give same predictions as vocabulary, while only keeping used buckets
+@pytest.mark.parametrize('ngrams', [1, 2])
+def test_hashing(ngrams):
+    texts = ['apple', 'sliced banana', 'carrots', 'unknown']
+    count = Model('count', ngrams)
+    count.train(SAMPLES, ADJACENCY)
+    hashing = Model('hashing', ngrams, size=2 ** 16)
+    hashing.train(SAMPLES, ADJACENCY)
+    vocabulary = count.get_pipeline().steps[0][1].vocabulary_
+    assert len(hashing.get_pipeline().steps[0][1].named_steps['selector'].columns_) == len(vocabulary)
+    for actual, expected in zip(hashing.classify(texts), count.classify(texts)):
+        assert actual == pytest.approx(expected, abs=1e-6)
+    assert [list(result) for result in hashing.classify(texts[:3], limit=1)] == [['apple'], ['banana'], ['carrot']]
+
+
+# Label weights of distinct texts are flattened into rows
+def test_expand():
+    texts, rows, labels, weights = expand({'a' : {'x' : 2.0, 'y' : 1.0}, 'b' : {'x' : 1.0}})
+    assert texts == ['a', 'b']
+    assert rows.tolist() == [0, 0, 1]
+    assert labels == ['x', 'y', 'x']
+    assert weights.tolist() == [2.0, 1.0, 1.0]
+
+
+# Weighted texts are equivalent to duplicated samples
+def test_weights():
+    weighted = dict(SAMPLES)
+    weighted['red apples'] = {'apple' : 3.0, 'banana' : 1.0}
+    model = Model()
+    model.train(weighted, ADJACENCY)
+    vectorizer = model.get_pipeline().steps[0][1]
+    features = vectorizer.transform(['red apples'] * 4 + [text for text in SAMPLES if text != 'red apples'])
+    labels = ['apple'] * 3 + ['banana'] + [next(iter(SAMPLES[text])) for text in SAMPLES if text != 'red apples']
+    duplicated = fit_classifier(create_classifier(), features, labels, numpy.ones(len(labels)))
+    texts = ['red apples', 'banana', 'carrot']
+    expected = duplicated.predict_proba(vectorizer.transform(texts))
+    for actual, probabilities in zip(model.classify(texts), expected):
+        assert actual == pytest.approx(dict(zip(duplicated.classes_, probabilities)), abs=1e-4)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncio
+import concurrent.futures
+import os
+import pytest
+import random
+
+from food.parser.ontology import OntologyContainer, build, read
+
+from conftest import ONTOLOGY_TXT
+
+
+# Convert ontology to plain sorted triplets, including inverse relationships
+def flatten(ontology):
+    result = set()
+    for id in ontology.get_identifiers():
+        for table, name in ((ontology._attributes, 'attribute'), (ontology._ascendants, 'ascendant'), (ontology._descendants, 'descendant')):
+            for key, values in table[id].items():
+                for value in values:
+                    result.add((name, id, key, value))
+    return sorted(result)
+
+
+# Patching matches rebuilding from scratch
+def test_patch(ontology):
+    triplets = read(ONTOLOGY_TXT).triplets
+    leaves = sorted(id for id in ontology.get_identifiers() if len(ontology._descendants[id]) == 0)
+    generator = random.Random(0)
+    for _ in range(10):
+        
+        # Remove some leaf entries and labels, and add new entries below existing ones
+        deleted = set(generator.sample(leaves, 20))
+        relabeled = set(generator.sample(range(len(triplets)), 200))
+        flags = [left in deleted or (index in relabeled and relationship == 'label' and len(ontology._descendants[left]) == 0) for index, (left, relationship, _) in enumerate(triplets)]
+        removed = [triplet for triplet, flag in zip(triplets, flags) if flag]
+        remaining = [triplet for triplet, flag in zip(triplets, flags) if not flag]
+        parents = generator.sample(sorted(set(ontology.get_identifiers()) - deleted), 20)
+        added = [('new_%d' % index, 'kind_of', parent) for index, parent in enumerate(parents)]
+        added += [('new_%d' % index, 'label', 'New %d' % index) for index in range(len(parents))]
+        patched = ontology.patch(removed, added)
+        assert flatten(patched) == flatten(build(remaining + added))
+    
+    # Original version is not modified
+    assert flatten(ontology) == flatten(build(triplets))
+
+
+# Dangling references are rejected
+def test_patch_invalid():
+    ontology = build([
+        ('apple', 'kind_of', 'fruit'),
+        ('fruit', 'label', 'Fruit')
+    ])
+    with pytest.raises(KeyError):
+        ontology.patch([('fruit', 'label', 'Fruit')], [])
+    with pytest.raises(KeyError):
+        ontology.patch([], [('pear', 'kind_of', 'vegetable')])
+    assert ontology.get_properties('apple')['ascendants'] == {'kind_of' : ['fruit']}
+
+
+# Write ontology source file, with distinct modification time
+def write(path, content, time):
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(content)
+    os.utime(path, ns=(time, time))
+
+
+# Container applies file modifications incrementally, and keeps previous version on error
+def test_container(tmp_path):
+    fruits = str(tmp_path / 'fruits.txt')
+    vegetables = str(tmp_path / 'vegetables.txt')
+    snapshot = str(tmp_path / 'ontology.bin')
+    write(fruits, 'fruit\n  label Fruit\n\napple\n  kind_of fruit\n', 10 ** 18)
+    write(vegetables, 'vegetable\n  label Vegetable\n', 10 ** 18)
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        
+        # Load sources
+        async def load():
+            container = OntologyContainer([fruits, vegetables], executor, snapshot=snapshot, interval=3600)
+            try:
+                return container, await container.get()
+            finally:
+                container.close()
+        container, first = asyncio.run(load())
+        assert sorted(first.get_identifiers()) == ['apple', 'fruit', 'vegetable']
+        assert os.path.exists(snapshot)
+        
+        # Apply modification
+        write(vegetables, 'vegetable\n  label Vegetable\n\ncarrot\n  kind_of vegetable\n', 2 * 10 ** 18)
+        second = container._refresh()
+        assert second is not first
+        assert flatten(second) == flatten(build(read(fruits).triplets + read(vegetables).triplets))
+        assert sorted(first.get_identifiers()) == ['apple', 'fruit', 'vegetable']
+        
+        # Unchanged sources do not create a new version
+        assert container._refresh() is second
+        
+        # Invalid sources are rejected
+        write(fruits, 'apple\n  kind_of fruit\n', 3 * 10 ** 18)
+        with pytest.raises(KeyError):
+            container._refresh()
+        assert container._refresh() is second
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncio
+import os
+
+import food.parser.sampler.line
+from food.parser.sampler import LineSampler
+from food.parser.sampler.line import _permutation, build_index, load_index
+
+
+# Write text file, with given modification time
+def write(path, content, time):
+    with open(path, 'wb') as file:
+        file.write(content)
+    os.utime(path, ns=(time, time))
+
+
+# Index contains line starts and end of file, also with small blocks and missing final line break
+def test_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(food.parser.sampler.line, 'BLOCK_SIZE', 3)
+    path = str(tmp_path / 'texts.txt')
+    index_path = path + '.idx'
+    for content in (b'', b'\n', b'ab\ncd\n\nefgh\n', b'ab\ncd\n\nefgh'):
+        write(path, content, 10 ** 18)
+        build_index(path, index_path)
+        ends = [position + 1 for position, char in enumerate(content) if char == 10]
+        if not content.endswith(b'\n') and len(content) > 0:
+            ends.append(len(content))
+        assert list(load_index(path, index_path)) == [0] + ends
+    
+    # Outdated or invalid index is ignored
+    write(path, b'ab\ncd\n\nefgh!', 2 * 10 ** 18)
+    assert load_index(path, index_path) is None
+    write(index_path, b'FOLI', 0)
+    assert load_index(path, index_path) is None
+
+
+# Each integer is enumerated exactly once
+def test_permutation():
+    for count in (0, 1, 2, 10, 97, 100):
+        assert sorted(_permutation(count)) == list(range(count))
+
+
+# Annotation store returning known annotations
+class Annotations:
+    def __init__(self, keys):
+        self.keys = keys
+    
+    async def get(self, keys):
+        return [{'key' : key} if key in self.keys else None for key in keys]
+
+
+# Samples are distinct, non-empty and not annotated, and index is reused
+def test_sample(tmp_path):
+    path = str(tmp_path / 'texts.txt')
+    lines = ['text %d' % (index % 40) if index % 5 > 0 else '' for index in range(100)]
+    write(path, ('\n'.join(lines) + '\n').encode('utf-8'), 10 ** 18)
+    sampler = LineSampler(path, Annotations({'text 1', 'text 2'}))
+    try:
+        assert len(sampler) == 100
+        async def run():
+            return [await sampler.sample(8) for _ in range(20)]
+        for samples in asyncio.run(run()):
+            texts = [sample['text'] for sample in samples]
+            assert len(texts) == 8
+            assert len(set(texts)) == 8
+            assert all(text in lines and text not in ('', 'text 1', 'text 2') for text in texts)
+    finally:
+        sampler.close()
+    modified = os.stat(path + '.idx').st_mtime_ns
+    other = LineSampler(path)
+    try:
+        assert os.stat(path + '.idx').st_mtime_ns == modified
+        assert asyncio.run(other.sample(100)) != []
+    finally:
+        other.close()
+
+
+# Empty files and fully annotated files give no sample
+def test_sample_empty(tmp_path):
+    path = str(tmp_path / 'texts.txt')
+    write(path, b'', 10 ** 18)
+    sampler = LineSampler(path)
+    try:
+        assert len(sampler) == 0
+        assert asyncio.run(sampler.sample(4)) == []
+    finally:
+        sampler.close()
+    write(path, b'a\nb\n', 2 * 10 ** 18)
+    sampler = LineSampler(path, Annotations({'a', 'b'}))
+    try:
+        assert len(sampler) == 2
+        assert asyncio.run(sampler.sample(4)) == []
+    finally:
+        sampler.close()
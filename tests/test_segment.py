@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+
+import hashlib
+import os
+import pytest
+import zipfile
+
+segment = pytest.importorskip('food.scraper.segment', reason='requires a scrapy version providing request_fingerprint', exc_type=ImportError)
+
+
+# Get fingerprint of given name
+def key(name):
+    return hashlib.sha1(name.encode('utf-8')).digest()
+
+
+# Records are stored and retrieved, where latest one wins
+def test_store(tmp_path):
+    folder = str(tmp_path / 'spider')
+    log = segment.SegmentLog(folder, shards=4)
+    try:
+        for index in range(50):
+            log.put(key(str(index)), 0, b'payload %d' % index)
+        log.put(key('7'), 1, b'updated')
+        assert len(log) == 50
+        assert key('7') in log and key('x') not in log
+        assert log.get(key('3')) == (0, b'payload 3')
+        assert log.get(key('7')) == (1, b'updated')
+        assert log.get(key('x')) is None
+        assert sorted(log) == sorted(key(str(index)) for index in range(50))
+    finally:
+        log.close()
+
+
+# Index is reloaded, and records appended after last flush are recovered
+def test_reopen(tmp_path):
+    folder = str(tmp_path / 'spider')
+    log = segment.SegmentLog(folder, shards=4)
+    for index in range(20):
+        log.put(key(str(index)), 0, b'payload %d' % index)
+    log.flush()
+    for index in range(20, 30):
+        log.put(key(str(index)), 0, b'payload %d' % index)
+    log.put(key('0'), 0, b'updated')
+    locations = log.get_locations()
+    
+    # Simulate crash, i.e. index is not written again
+    for file in log._files:
+        os.close(file)
+    log = segment.SegmentLog(folder, shards=4)
+    try:
+        assert len(log) == 30
+        assert log.get_locations() == locations
+        assert log.get(key('0')) == (0, b'updated')
+        assert log.get(key('25')) == (0, b'payload 25')
+    finally:
+        log.close()
+    reader = segment.SegmentLog(folder, shards=4, readonly=True)
+    try:
+        assert reader.get_locations() == locations
+    finally:
+        reader.close()
+
+
+# Incomplete trailing record is discarded, and truncated logs invalidate index
+def test_truncated(tmp_path):
+    folder = str(tmp_path / 'spider')
+    log = segment.SegmentLog(folder, shards=1)
+    log.put(key('a'), 0, b'first')
+    log.put(key('b'), 0, b'second')
+    log.close()
+    path = os.path.join(folder, '00.log')
+    size = os.path.getsize(path)
+    with open(path, 'r+b') as file:
+        file.truncate(size - 1)
+    
+    # Read-only access does not modify logs
+    reader = segment.SegmentLog(folder, shards=1, readonly=True)
+    try:
+        assert len(reader) == 1
+        assert reader.get(key('a')) == (0, b'first')
+    finally:
+        reader.close()
+    assert os.path.getsize(path) == size - 1
+    log = segment.SegmentLog(folder, shards=1)
+    try:
+        assert os.path.getsize(path) < size - 1
+        assert key('b') not in log
+        log.put(key('c'), 0, b'third')
+        assert log.get(key('c')) == (0, b'third')
+    finally:
+        log.close()
+    log = segment.SegmentLog(folder, shards=1)
+    try:
+        assert sorted(log) == sorted([key('a'), key('c')])
+    finally:
+        log.close()
+
+
+# Payloads are compressed, and read back at given locations
+@pytest.mark.parametrize('name', ['raw', 'zlib'])
+def test_read_records(tmp_path, name):
+    folder = str(tmp_path / 'spider')
+    codec = segment.create_codec(name)
+    payloads = [os.urandom(16) + b'ingredient' * index for index in range(20)]
+    log = segment.SegmentLog(folder, shards=4)
+    try:
+        for index, payload in enumerate(payloads):
+            log.put(key(str(index)), *codec.compress(payload))
+        locations = {tuple(log._index[key(str(index))]) : payload for index, payload in enumerate(payloads)}
+        assert codec.decompress(*log.get(key('5'))) == payloads[5]
+    finally:
+        log.close()
+    order = sorted(locations)
+    assert list(segment.read_records(folder, order, codec)) == [locations[location] for location in order]
+
+
+# Missing zstandard package falls back to zlib
+def test_codec():
+    codec = segment.create_codec('zstd')
+    identifier, data = codec.compress(b'ingredient' * 100)
+    assert identifier in (segment.CODECS['zstd'], segment.CODECS['zlib'])
+    assert codec.decompress(identifier, data) == b'ingredient' * 100
+    with pytest.raises(ValueError):
+        segment.create_codec('unknown')
+
+
+# Zip archives are converted, where last duplicate wins
+def test_migrate(tmp_path):
+    source = tmp_path / 'zip'
+    (source / 'spider').mkdir(parents=True)
+    with zipfile.ZipFile(str(source / 'spider' / '00.zip'), 'w') as archive:
+        archive.writestr(key('a').hex(), b'previous')
+        archive.writestr(key('b').hex(), b'other')
+    with zipfile.ZipFile(str(source / 'spider' / '01.zip'), 'w') as archive:
+        archive.writestr(key('a').hex(), b'current')
+    destination = str(tmp_path / 'logs')
+    segment.migrate(str(source), destination, codec='zlib', shards=2)
+    codec = segment.create_codec('zlib')
+    log = segment.SegmentLog(os.path.join(destination, 'spider'), shards=2, readonly=True)
+    try:
+        assert len(log) == 2
+        assert codec.decompress(*log.get(key('a'))) == b'current'
+        assert codec.decompress(*log.get(key('b'))) == b'other'
+    finally:
+        log.close()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+
+import pytest
+
+from food.parser.ontology import Ontology, build
+
+
+# Convert lazy tables to plain dictionaries, without empty relationships
+def flatten(table, identifiers):
+    return {id : {key : list(values) for key, values in table[id].items() if len(values) > 0} for id in identifiers}
+
+
+# Snapshot gives same entries as parsed ontology
+def test_equivalence(tmp_path, ontology):
+    path = str(tmp_path / 'ontology.bin')
+    ontology.save(path)
+    loaded = Ontology.load(path)
+    identifiers = sorted(ontology.get_identifiers())
+    assert sorted(loaded.get_identifiers()) == identifiers
+    for table in ('_attributes', '_ascendants', '_descendants'):
+        assert flatten(getattr(loaded, table), identifiers) == flatten(getattr(ontology, table), identifiers)
+    for id in identifiers[:100]:
+        assert loaded.get_properties(id)['label'] == ontology.get_properties(id)['label']
+
+
+# Non-ASCII strings, missing identifiers and entries without relationships are supported
+def test_small(tmp_path):
+    ontology = build([
+        ('crème_fraîche', 'kind_of', 'cream'),
+        ('crème_fraîche', 'label', 'crème fraîche'),
+        ('cream', 'label', 'cream'),
+        ('cream', 'label', 'single cream')
+    ])
+    path = str(tmp_path / 'ontology.bin')
+    ontology.save(path)
+    loaded = Ontology.load(path)
+    assert loaded.get_properties('crème_fraîche')['label'] == ['crème fraîche']
+    assert loaded.get_properties('crème_fraîche')['ascendants'] == {'kind_of' : ['cream']}
+    assert loaded.get_properties('cream')['label'] == ['cream', 'single cream']
+    assert dict(loaded.get_properties('cream')['descendants']) == {'kind_of' : ['crème_fraîche']}
+    assert loaded.get_properties('butter') is None
+
+
+# Invalid files are rejected
+def test_invalid(tmp_path):
+    path = tmp_path / 'ontology.bin'
+    path.write_bytes(b'\0' * 64)
+    with pytest.raises(IOError):
+        Ontology.load(str(path))
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+
+import random
+
+from food.parser.ontology import build
+from food.parser.suggest import SuggestionIndex, masks, normalize, prefix_distance
+
+
+# Smallest edit distance between query and any prefix of text, using dynamic programming
+def naive_distance(query, text):
+    row = list(range(len(query) + 1))
+    best = row[-1]
+    for j, char in enumerate(text):
+        previous = row
+        row = [j + 1]
+        for i, other in enumerate(query):
+            row.append(min(previous[i + 1] + 1, row[i] + 1, previous[i] + (char != other)))
+        best = min(best, row[-1])
+    return best
+
+
+# Small ontology, with accented labels and similar names
+def create_ontology():
+    return build([
+        ('apple', 'label', 'apple'),
+        ('apple_juice', 'label', 'apple juice'),
+        ('green_apple', 'label', 'green apple'),
+        ('pineapple', 'label', 'pineapple'),
+        ('creme_fraiche', 'label', 'crème fraîche'),
+        ('jalapeno', 'label', 'jalapeño pepper'),
+        ('banana', 'label', 'banana'),
+        ('banana', 'label', 'plantain')
+    ])
+
+
+# Normalization ignores case, accents and punctuation
+def test_normalize():
+    assert normalize('  Crème-Fraîche ') == 'creme fraiche'
+    assert normalize('JALAPEÑO, pepper') == 'jalapeno pepper'
+    assert normalize('...') == ''
+
+
+# Bit-parallel distance matches dynamic programming
+def test_prefix_distance():
+    generator = random.Random(0)
+    for _ in range(2000):
+        query = ''.join(generator.choice('abc') for _ in range(generator.randint(1, 8)))
+        text = ''.join(generator.choice('abc') for _ in range(generator.randint(0, 12)))
+        bound = len(query)
+        assert prefix_distance(query, masks(query), text, bound) == naive_distance(query, text[:len(query) + bound])
+
+
+# Word prefixes are found and ranked first, shortest first
+def test_prefix():
+    index = SuggestionIndex(create_ontology())
+    assert index.search('apple', count=3) == ['apple', 'apple_juice', 'green_apple']
+    assert index.search('APP')[:3] == ['apple', 'apple_juice', 'green_apple']
+    assert index.search('juice')[0] == 'apple_juice'
+    assert index.search('plant')[0] == 'banana'
+    assert index.search('') == []
+
+
+# Accents are ignored, both in query and labels
+def test_accents():
+    index = SuggestionIndex(create_ontology())
+    assert index.search('creme fraiche')[0] == 'creme_fraiche'
+    assert index.search('crème')[0] == 'creme_fraiche'
+    assert index.search('jalapeño')[0] == 'jalapeno'
+
+
+# Misspelled queries are matched using edit distance
+def test_typo():
+    index = SuggestionIndex(create_ontology())
+    assert index.search('pinaepple')[0] == 'pineapple'
+    assert index.search('bananna')[0] == 'banana'
+    assert index.search('jalapeno peper')[0] == 'jalapeno'
+    assert len(index.search('apple', count=100)) == len(set(index.search('apple', count=100)))
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+
+import pytest
+
+pytest.importorskip('hunspell')
+
+import food.parser.text
+from food.parser.text import add_lemmas, get_lemmas, load_lemmas, save_lemmas, tokenize
+
+
+# Texts with repeated, accented and non-alphabetic tokens
+TEXTS = [
+    '2 cups of Tomatoes, chopped',
+    'tomatoes and onions',
+    'Crème fraîche (200ml)',
+    'crème FRAÎCHE',
+    '',
+    '1/2 tsp salt & pepper'
+]
+
+
+# Use empty cache in each test
+@pytest.fixture(autouse=True)
+def cache(monkeypatch):
+    lemmas = {}
+    monkeypatch.setattr(food.parser.text, 'lemma_cache', lemmas)
+    return lemmas
+
+
+# Cached lemmatization gives same tokens as uncached one
+def test_tokenize(cache):
+    for text in TEXTS:
+        assert tokenize(text) == tokenize(text, cached=False)
+    assert 'tomatoes' in cache
+    size = len(cache)
+    for text in TEXTS:
+        tokenize(text)
+    assert len(cache) == size
+
+
+# Cache is bounded, and lemmas are shared with other processes through files and increments
+def test_lemmas(tmp_path, cache, monkeypatch):
+    monkeypatch.setattr(food.parser.text, 'MAXIMUM_LEMMAS', 4)
+    tokenize('tomatoes onions')
+    assert get_lemmas() == cache
+    start = len(cache)
+    tokenize('peppers')
+    assert list(get_lemmas(start)) == ['peppers']
+    path = str(tmp_path / 'lemmas.tsv')
+    save_lemmas(path)
+    saved = dict(cache)
+    cache.clear()
+    load_lemmas(path)
+    assert cache == saved
+    add_lemmas({'eggs' : 'egg', 'apples' : 'apple'})
+    assert cache == {'eggs' : 'egg', 'apples' : 'apple'}
+    assert get_lemmas(10) == cache
+    tokenize('a b c')
+    assert len(cache) <= 4